@@ -0,0 +1,77 @@
+"""
+Per-file decode time of every installed JSON backend on result and topology files.
+
+Run from the repository root:
+    python -m benchmarks.bench_json_backend
+    python -m benchmarks.bench_json_backend --files data/query-results-raw-*.json --topology-dir <dir>
+
+Without --files a synthetic result file and a synthetic sweep are used. The speedup is relative
+to the stdlib json module; results are appended to benchmarks/results/json_backend.jsonl.
+"""
+import argparse
+import glob
+import os
+
+from benchmarks.bench_topology import synthetic_sweep
+from benchmarks.harness import measure, print_report, record_results
+from benchmarks.bench_load_raw_data import synthetic_file
+from src.json_backend import BACKEND, available_backends, get_loads
+
+SUITE = "json_backend"
+
+
+def read_bytes(paths):
+    contents = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            contents.append(f.read())
+    return contents
+
+
+def decode_all(loads, contents):
+    return [loads(content) for content in contents]
+
+
+def run(groups, repeat=3, trace_memory=False):
+    """groups maps a benchmark name to a list of files, which are decoded from memory to exclude disk reads."""
+    rows = []
+    for group, paths in groups.items():
+        contents = read_bytes(paths)
+        n_bytes = sum(len(c) for c in contents)
+        stdlib_seconds = None
+        for backend in ["json"] + [b for b in available_backends() if b != "json"]:
+            seconds, peak_mb, _ = measure(decode_all, get_loads(backend), contents, repeat=repeat,
+                                          trace_memory=trace_memory)
+            if backend == "json":
+                stdlib_seconds = seconds
+            speedup = stdlib_seconds / seconds if seconds > 0 else float('inf')
+            rows.append({"benchmark": f"{group} [{backend}]", "n_entries": len(paths), "seconds": seconds,
+                         "peak_mb": peak_mb, "mb_per_s": n_bytes / 1024 ** 2 / seconds, "speedup": speedup,
+                         "per_file_ms": seconds / len(paths) * 1000})
+            print(f"{group} [{backend}] ({len(paths)} files, {n_bytes / 1024 ** 2:.1f} MB): {seconds:.4f}s, "
+                  f"{seconds / len(paths) * 1000:.2f} ms/file, {speedup:.1f}x stdlib")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decode speed of the installed JSON backends.")
+    parser.add_argument("--files", nargs="*", help="Result files (default: a synthetic 100k-entry file).")
+    parser.add_argument("--topology-dir", help="Directory with topology files (default: a synthetic sweep).")
+    parser.add_argument("--max-topology-files", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--memory", action="store_true", help="Also measure the peak heap allocation.")
+    parser.add_argument("--no-record", action="store_true")
+    args = parser.parse_args()
+
+    print(f"Available backends: {available_backends()}, selected: {BACKEND}")
+    result_files = args.files or [synthetic_file(100_000)]
+    if args.topology_dir:
+        topology_files = sorted(glob.glob(os.path.join(args.topology_dir, "**", "*.json"), recursive=True))
+    else:
+        topology_files = sorted(str(p) for p in synthetic_sweep(50).rglob("output-topology-tracking/*.json"))
+    groups = {"result files": result_files, "topology files": topology_files[:args.max_topology_files]}
+
+    results = run(groups, repeat=args.repeat, trace_memory=args.memory)
+    print_report(SUITE, results)
+    if not args.no_record:
+        record_results(SUITE, results)
@@ -0,0 +1,68 @@
+"""
+Scaling benchmarks of the result-file analysis code on synthetic result files.
+
+Run from the repository root:
+    python -m benchmarks.bench_load_raw_data --sizes 10000 100000 1000000 10000000
+
+Timings and peak memory are appended to benchmarks/results/load_raw_data.jsonl and compared with
+the last run of a different commit.
+"""
+import argparse
+import os
+
+from benchmarks.harness import DATA_DIR, measure, print_report, record_results
+from benchmarks.synthetic_results import generate_result_file
+from cache_metrics_plots import calculate_session_hit_rates, prepare_eviction_impact
+from src.load_raw_data import load_json, aggregate_on, get_means, get_geo_means, get_raw_metrics, \
+    get_cache_metrics_per_sequence
+
+SUITE = "load_raw_data"
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def synthetic_file(n_entries, seed=0):
+    location = os.path.join(DATA_DIR, f"query-results-raw-synthetic-{n_entries}.json")
+    if not os.path.exists(location):
+        print(f"Generating {location}...")
+        generate_result_file(location, n_entries, seed=seed)
+    return location
+
+
+def run(sizes, repeat=3, trace_memory=True):
+    rows = []
+    for n_entries in sizes:
+        location = synthetic_file(n_entries)
+        # The loaders are memoized on disk, benchmark the underlying functions
+        data = load_json(location)
+        aggregated = aggregate_on(data, ["sequenceElement", "template"])
+        benchmarks = [
+            ("load_json", load_json, (location,)),
+            ("aggregate_on(template)", aggregate_on, (data, ["sequenceElement", "template"])),
+            ("get_means", get_means, (aggregated,)),
+            ("get_geo_means", get_geo_means, (aggregated,)),
+            ("get_raw_metrics", get_raw_metrics.uncached, (location,)),
+            ("get_cache_metrics_per_sequence", get_cache_metrics_per_sequence.uncached, (location,)),
+            ("calculate_session_hit_rates", calculate_session_hit_rates.uncached, ([location],)),
+            ("prepare_eviction_impact", prepare_eviction_impact, ([location], "execution_time")),
+        ]
+        del data
+        for name, func, args in benchmarks:
+            seconds, peak_mb, _ = measure(func, *args, repeat=repeat, trace_memory=trace_memory)
+            rows.append({"benchmark": name, "n_entries": n_entries, "seconds": seconds, "peak_mb": peak_mb})
+            print(f"{name} ({n_entries}): {seconds:.4f}s, {peak_mb:.1f} MB")
+        del aggregated, benchmarks
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scaling benchmarks for load_raw_data.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Number of entries per file.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark, the best is reported.")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the (slow) peak memory measurement.")
+    parser.add_argument("--no-record", action="store_true", help="Do not append the results to the history.")
+    args = parser.parse_args()
+
+    results = run(args.sizes, repeat=args.repeat, trace_memory=not args.no_memory)
+    print_report(SUITE, results)
+    if not args.no_record:
+        record_results(SUITE, results)
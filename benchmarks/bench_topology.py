@@ -0,0 +1,154 @@
+"""
+Stage-level benchmarks of the topology / hyperparameter sweep path on synthetic run_* trees.
+
+Run from the repository root:
+    python -m benchmarks.bench_topology --sequences 10 50
+
+Every stage reports throughput (queries/s or topology files/s) and peak memory. Results are appended to
+benchmarks/results/topology.jsonl and compared with the last run of a different commit.
+"""
+import argparse
+import os
+import shutil
+from pathlib import Path
+
+from benchmarks.harness import DATA_DIR, measure, print_report, record_results
+from benchmarks.synthetic_topologies import generate_sweep
+from src import json_backend
+from src.hyperparameter_analysis import analyze_sweep, compute_jaccard_stats, simulate_lru_cache, topology_nodes
+from src.load_raw_data import find_topology_files, generate_md5_hash, read_sequence_queries, \
+    yield_sequence_topologies
+from src.topology_archive import pack_topology_dir
+
+SUITE = "topology"
+DEFAULT_SEQUENCES = [10, 50]
+
+
+def synthetic_sweep(n_sequences, n_runs=2, **kwargs):
+    suffix = "-".join(f"{k}={v}" for k, v in sorted(kwargs.items()))
+    sweep_dir = os.path.join(DATA_DIR, f"sweep-{n_runs}x{n_sequences}-{suffix}")
+    if not os.path.exists(sweep_dir):
+        print(f"Generating {sweep_dir}...")
+        generate_sweep(sweep_dir, n_runs=n_runs, n_sequences=n_sequences, **kwargs)
+    return Path(sweep_dir)
+
+
+def packed_sweep(sweep_dir):
+    """Copy of a synthetic sweep with every topology directory packed into an archive."""
+    packed_dir = sweep_dir.with_name(sweep_dir.name + "-packed")
+    if not packed_dir.exists():
+        shutil.copytree(sweep_dir, packed_dir)
+        for topology_dir in sorted(packed_dir.rglob("output-topology-tracking")):
+            pack_topology_dir(topology_dir, remove=True)
+    return packed_dir
+
+
+def run_dirs(sweep_dir):
+    for run in sorted(sweep_dir.glob("run_*")):
+        yield run / "generated" / "out-queries", run / "combinations" / "combination_0" / "output-topology-tracking"
+
+
+def stage_scan(sweep_dir):
+    """Directory scan: read the sequence files and find the topology files of every query."""
+    sequences = []
+    for sparql_dir, topology_dir in run_dirs(sweep_dir):
+        for sparql_file in sorted(sparql_dir.glob("*.sparql")):
+            queries = read_sequence_queries(sparql_file)
+            sequences.append([find_topology_files(topology_dir, generate_md5_hash(q)) for q in queries])
+    return sequences
+
+
+def stage_decode(sequences):
+    """JSON decode of every topology file."""
+    decoded = []
+    for sequence in sequences:
+        decoded_sequence = []
+        for files in sequence:
+            topologies = []
+            for topo_file in files:
+                topologies.append(json_backend.load_file(topo_file))
+            decoded_sequence.append(topologies)
+        decoded.append(decoded_sequence)
+    return decoded
+
+
+def stage_node_sets(decoded):
+    """Set construction: the union of visited sources over the repetitions of every query."""
+    node_sets = []
+    for sequence in decoded:
+        sequence_nodes = []
+        for topologies in sequence:
+            visited = set()
+            for topology in topologies:
+                visited.update(topology_nodes(topology))
+            sequence_nodes.append(visited)
+        node_sets.append(sequence_nodes)
+    return node_sets
+
+
+def stage_jaccard(node_sets):
+    return [compute_jaccard_stats(sequence) for sequence in node_sets]
+
+
+def stage_lru(node_sets, cache_size):
+    return [simulate_lru_cache(sequence, cache_size) for sequence in node_sets]
+
+
+def stage_yield_sequence_topologies(sweep_dir, read_ahead=0):
+    n = 0
+    for sparql_dir, topology_dir in run_dirs(sweep_dir):
+        for _, sequence in yield_sequence_topologies(sparql_dir, topology_dir, read_ahead=read_ahead):
+            n += len(sequence["sequence"])
+    return n
+
+
+def run(sequence_counts, repeat=3, trace_memory=True, cache_size=1000, **generator_kwargs):
+    rows = []
+    for n_sequences in sequence_counts:
+        sweep_dir = synthetic_sweep(n_sequences, **generator_kwargs)
+        sequences = stage_scan(sweep_dir)
+        n_queries = sum(len(s) for s in sequences)
+        n_files = sum(len(files) for s in sequences for files in s)
+        decoded = stage_decode(sequences)
+        node_sets = stage_node_sets(decoded)
+
+        stages = [
+            ("scan", "queries", n_queries, stage_scan, (sweep_dir,)),
+            ("decode", "files", n_files, stage_decode, (sequences,)),
+            ("node_sets", "files", n_files, stage_node_sets, (decoded,)),
+            ("jaccard", "queries", n_queries, stage_jaccard, (node_sets,)),
+            (f"simulate_lru_cache({cache_size})", "queries", n_queries, stage_lru, (node_sets, cache_size)),
+            ("yield_sequence_topologies", "files", n_files, stage_yield_sequence_topologies, (sweep_dir,)),
+            ("yield_sequence_topologies(read_ahead=16)", "files", n_files, stage_yield_sequence_topologies,
+             (sweep_dir, 16)),
+            ("analyze_sweep", "files", n_files, analyze_sweep.uncached, (sweep_dir,)),
+            ("analyze_sweep(packed)", "files", n_files, analyze_sweep.uncached, (packed_sweep(sweep_dir),)),
+        ]
+        for name, unit, count, func, args in stages:
+            seconds, peak_mb, _ = measure(func, *args, repeat=repeat, trace_memory=trace_memory)
+            throughput = count / seconds if seconds > 0 else float('inf')
+            rows.append({"benchmark": name, "n_entries": n_files, "seconds": seconds, "peak_mb": peak_mb,
+                         "throughput": throughput, "unit": f"{unit}/s"})
+            print(f"{name} ({n_files} topology files): {seconds:.4f}s, {throughput:,.0f} {unit}/s, {peak_mb:.1f} MB")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stage-level benchmarks for the topology/sweep path.")
+    parser.add_argument("--sequences", type=int, nargs="+", default=DEFAULT_SEQUENCES,
+                        help="Number of sequences per run, one benchmark per value.")
+    parser.add_argument("--runs", type=int, default=2)
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--nodes", type=int, default=200, help="Visited sources per topology.")
+    parser.add_argument("--overlap", type=float, default=0.5, help="Source overlap between consecutive queries.")
+    parser.add_argument("--cache-size", type=int, default=1000, help="Cache size of simulate_lru_cache.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--no-record", action="store_true")
+    args = parser.parse_args()
+
+    results = run(args.sequences, repeat=args.repeat, trace_memory=not args.no_memory, cache_size=args.cache_size,
+                  n_runs=args.runs, repetitions=args.repetitions, nodes_per_query=args.nodes, overlap=args.overlap)
+    print_report(SUITE, results)
+    if not args.no_record:
+        record_results(SUITE, results)
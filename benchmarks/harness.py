@@ -0,0 +1,84 @@
+import gc
+import json
+import os
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data")
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def measure(func, *args, repeat=3, trace_memory=True, **kwargs):
+    """
+    Times func(*args, **kwargs) as the best of `repeat` runs, and measures its peak Python heap
+    allocation in a separate traced run (tracemalloc slows down execution, so it is not timed).
+
+    Returns (seconds, peak_mb, result).
+    """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+
+    peak_mb = float('nan')
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_mb = peak / 1024 ** 2
+    return best, peak_mb, result
+
+
+def load_history(suite):
+    path = os.path.join(RESULTS_DIR, f"{suite}.jsonl")
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def record_results(suite, rows):
+    """Appends benchmark rows, tagged with the current commit and time, to results/<suite>.jsonl."""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    commit = current_commit()
+    timestamp = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    with open(os.path.join(RESULTS_DIR, f"{suite}.jsonl"), 'a') as f:
+        for row in rows:
+            f.write(json.dumps({"commit": commit, "timestamp": timestamp, **row}) + "\n")
+
+
+def print_report(suite, rows, key_fields=("benchmark", "n_entries")):
+    """
+    Prints the rows of this run next to the most recent result of another commit for the same
+    benchmark, so regressions between commits stand out.
+    """
+    commit = current_commit()
+    previous = {}
+    for row in load_history(suite):
+        if row["commit"] != commit:
+            previous[tuple(row[k] for k in key_fields)] = row
+
+    header = f"{'benchmark':<40} {'size':>10} {'seconds':>10} {'peak MB':>10} {'prev s':>10} {'change':>8}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        prev = previous.get(tuple(row[k] for k in key_fields))
+        prev_seconds = f"{prev['seconds']:.4f}" if prev else "-"
+        change = f"{(row['seconds'] / prev['seconds'] - 1) * 100:+.0f}%" if prev and prev['seconds'] > 0 else "-"
+        print(f"{row['benchmark']:<40} {row[key_fields[1]]:>10} {row['seconds']:>10.4f} {row['peak_mb']:>10.1f} "
+              f"{prev_seconds:>10} {change:>8}")
@@ -0,0 +1,139 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+CACHE_STATE_KEYS = [
+    "@comunica/persistent-cache-manager:sourceState",
+    "@comunica/persistent-cache-manager:sourceStateQuerySource",
+    "@comunica/persistent-cache-manager:cacheSourceStateIndexedDisk",
+    "@comunica/persistent-cache-manager:cacheSourceStateIndexedQuadStore",
+]
+
+DEFAULT_TEMPLATES = [f"interactive-short-{i}" for i in range(1, 8)] + \
+                    [f"interactive-discover-{i}" for i in range(1, 9)]
+
+
+def generate_result_file(location, n_entries, n_templates=15, mean_sequence_length=8, repetitions=5,
+                         sequences_per_session=3, refinement_rate=0.5, mean_timestamps=10, error_rate=0.02,
+                         timeout_rate=0.02, timeout_ms=180000, cache_state_key=CACHE_STATE_KEYS[0], seed=0):
+    """
+    Writes a synthetic query-results-raw-*.json file with the same structure as the jbr output.
+
+    Entries are ordered as the benchmark runner produces them: every repetition runs all sequences,
+    every sequence runs its steps in order. Consecutive sequences share a session, refinement steps
+    carry refinementMetadata, and errors/timeouts occur at the given rates.
+
+    Parameters:
+    location (str): Output file path.
+    n_entries (int): Exact number of entries written.
+    n_templates (int): Number of distinct query templates.
+    mean_sequence_length (int): Mean number of steps per sequence (Poisson distributed, at least 1).
+    repetitions (int): Number of repetitions of every sequence.
+    sequences_per_session (int): Number of consecutive sequences sharing a sessionId.
+    refinement_rate (float): Probability that a non-first step is a refinement.
+    mean_timestamps (int): Mean length of the timestamps list of completed queries.
+    error_rate (float): Probability of an entry with an error.
+    timeout_rate (float): Probability of an entry that hits timeout_ms.
+    cache_state_key (str): Which of the cache state keys stores the serialized cache state.
+    seed (int): Seed of the random generator.
+    """
+    rng = np.random.default_rng(seed)
+    templates = (DEFAULT_TEMPLATES * (n_templates // len(DEFAULT_TEMPLATES) + 1))[:n_templates]
+    template_log_means = rng.normal(7, 1, n_templates)
+
+    n_sequences = max(int(np.ceil(n_entries / (repetitions * mean_sequence_length))), 1)
+    sequence_lengths = np.maximum(rng.poisson(mean_sequence_length, n_sequences), 1)
+    sequence_templates = [rng.integers(0, n_templates, length) for length in sequence_lengths]
+    sequence_refinements = [
+        np.concatenate([[False], rng.random(length - 1) < refinement_rate]) for length in sequence_lengths
+    ]
+
+    os.makedirs(os.path.dirname(location) or ".", exist_ok=True)
+    written = 0
+    with open(location, 'w') as f:
+        f.write("[")
+        while written < n_entries:
+            for seq_idx in range(n_sequences):
+                session_id = f"session-{seq_idx // sequences_per_session}"
+                for step in range(sequence_lengths[seq_idx]):
+                    if written >= n_entries:
+                        break
+                    entry = _generate_entry(
+                        rng, seq_idx, step, templates[sequence_templates[seq_idx][step]],
+                        template_log_means[sequence_templates[seq_idx][step]],
+                        sequence_refinements[seq_idx][step], session_id, mean_timestamps, error_rate,
+                        timeout_rate, timeout_ms, cache_state_key
+                    )
+                    if written > 0:
+                        f.write(",\n")
+                    f.write(json.dumps(entry))
+                    written += 1
+        f.write("]")
+    return location
+
+
+def _generate_entry(rng, seq_idx, step, template, log_mean, is_refinement, session_id, mean_timestamps,
+                    error_rate, timeout_rate, timeout_ms, cache_state_key):
+    outcome = rng.random()
+    is_error = outcome < error_rate
+    is_timeout = error_rate <= outcome < error_rate + timeout_rate
+
+    time_ms = timeout_ms if is_timeout else float(min(rng.lognormal(log_mean, 1.0), timeout_ms - 1))
+    n_timestamps = 0 if is_error else int(rng.poisson(mean_timestamps))
+    timestamps = np.sort(rng.random(n_timestamps) * time_ms).round(3).tolist()
+
+    refinement_metadata = {}
+    if is_refinement:
+        refinement_metadata = {
+            "patternIds": rng.integers(0, 10, rng.integers(1, 4)).tolist(),
+            "refinementType": str(rng.choice(["add", "remove", "replace"])),
+        }
+
+    hits = int(rng.integers(0, 500))
+    misses = int(rng.integers(0, 500))
+    cache_state = {
+        "hits": hits,
+        "misses": misses,
+        "evictions": int(rng.integers(0, 50)),
+        "evictionPercentage": float(rng.random() * 100),
+    }
+
+    entry = {
+        "name": f"sequence-{seq_idx}",
+        "id": str(step),
+        "time": time_ms,
+        "results": n_timestamps,
+        "httpRequests": hits + misses,
+        "timestamps": timestamps,
+        "sequenceElement": {
+            "template": template,
+            "refinementMetadata": refinement_metadata,
+            "session": {"sessionId": session_id},
+        },
+        cache_state_key: json.dumps(cache_state),
+    }
+    if is_error:
+        entry["error"] = "Error: synthetic failure"
+    elif is_timeout:
+        entry["error"] = "Error: Timeout"
+    return entry
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic query-results-raw-*.json files.")
+    parser.add_argument("location")
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--templates", type=int, default=15)
+    parser.add_argument("--sequence-length", type=int, default=8)
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--timeout-rate", type=float, default=0.02)
+    parser.add_argument("--cache-state-key", default=CACHE_STATE_KEYS[0], choices=CACHE_STATE_KEYS)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_result_file(args.location, args.entries, n_templates=args.templates,
+                         mean_sequence_length=args.sequence_length, repetitions=args.repetitions,
+                         error_rate=args.error_rate, timeout_rate=args.timeout_rate,
+                         cache_state_key=args.cache_state_key, seed=args.seed)
@@ -0,0 +1,103 @@
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+def generate_run(run_dir, n_sequences=10, mean_sequence_length=8, repetitions=3, nodes_per_query=200,
+                 overlap=0.5, n_sources=100000, hyperparameters=None, seed=0):
+    """
+    Writes a synthetic sweep run directory with the layout analyze_sweep and
+    yield_sequence_topologies expect:
+
+        run_dir/sweep_metadata.json
+        run_dir/generated/out-queries/<sequence>.sparql
+        run_dir/combinations/combination_0/output-topology-tracking/<timestamp>-<md5(query)>.json
+
+    Parameters:
+    n_sequences (int): Number of sequence files.
+    mean_sequence_length (int): Mean number of queries per sequence (Poisson distributed, at least 1).
+    repetitions (int): Number of topology files (repetitions) per query.
+    nodes_per_query (int): Number of visited sources in each topology.
+    overlap (float): Fraction of the sources of a query that are shared with the previous query of the sequence.
+    n_sources (int): Size of the universe sources are drawn from.
+    hyperparameters (dict): Hyperparameters stored in sweep_metadata.json.
+
+    Returns the number of topology files written.
+    """
+    rng = np.random.default_rng(seed)
+    run_dir = Path(run_dir)
+    sparql_dir = run_dir / "generated" / "out-queries"
+    topology_dir = run_dir / "combinations" / "combination_0" / "output-topology-tracking"
+    sparql_dir.mkdir(parents=True, exist_ok=True)
+    topology_dir.mkdir(parents=True, exist_ok=True)
+
+    with open(run_dir / "sweep_metadata.json", 'w') as f:
+        json.dump({"hyperparameters": hyperparameters or {
+            "sequenceGenerator.meanLogSequenceLength": 3,
+            "sequenceGenerator.stdLogSequenceLength": 0.2,
+            "sequenceGenerator.meanLogTransitionProbability": -2,
+        }}, f)
+
+    timestamp = 1700000000000
+    n_files = 0
+    for seq_idx in range(n_sequences):
+        length = max(int(rng.poisson(mean_sequence_length)), 1)
+        queries = []
+        previous_nodes = None
+        for step in range(length):
+            query = (f"SELECT * WHERE {{\n  <http://example.org/{run_dir.name}/sequence-{seq_idx}> "
+                     f"<http://example.org/p> ?o{step} .\n}}")
+            queries.append(query)
+            query_hash = hashlib.md5(query.encode('utf-8')).hexdigest()
+
+            n_shared = int(nodes_per_query * overlap) if previous_nodes is not None else 0
+            shared = rng.choice(previous_nodes, n_shared, replace=False) if n_shared else np.empty(0, dtype=int)
+            fresh = rng.integers(0, n_sources, nodes_per_query - n_shared)
+            nodes = np.concatenate([shared, fresh])
+            previous_nodes = nodes
+
+            for _ in range(repetitions):
+                timestamp += int(rng.integers(1, 1000))
+                # Every repetition visits a slightly different subset of the query's sources
+                visited = nodes[rng.random(len(nodes)) < 0.95]
+                topology = {
+                    "indexToNodeDict": {"0": "root", **{
+                        str(i + 1): f"http://example.org/source/{node}" for i, node in enumerate(visited)
+                    }},
+                    "edges": [[0, i + 1] for i in range(len(visited))],
+                }
+                with open(topology_dir / f"{timestamp}-{query_hash}.json", 'w', encoding='utf-8') as f:
+                    json.dump(topology, f)
+                n_files += 1
+
+        with open(sparql_dir / f"sequence-{seq_idx}.sparql", 'w', encoding='utf-8') as f:
+            f.write("\n\n".join(queries) + "\n")
+    return n_files
+
+
+def generate_sweep(sweep_dir, n_runs=3, seed=0, **run_kwargs):
+    """Writes n_runs synthetic run_* directories into sweep_dir, returns the total number of topology files."""
+    n_files = 0
+    for run_idx in range(n_runs):
+        n_files += generate_run(os.path.join(sweep_dir, f"run_{run_idx}"), seed=seed + run_idx, **run_kwargs)
+    return n_files
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic sweep of run_* topology directories.")
+    parser.add_argument("sweep_dir")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--sequences", type=int, default=10)
+    parser.add_argument("--sequence-length", type=int, default=8)
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--nodes", type=int, default=200)
+    parser.add_argument("--overlap", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_sweep(args.sweep_dir, n_runs=args.runs, seed=args.seed, n_sequences=args.sequences,
+                   mean_sequence_length=args.sequence_length, repetitions=args.repetitions,
+                   nodes_per_query=args.nodes, overlap=args.overlap)
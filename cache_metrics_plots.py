@@ -1,29 +1,56 @@
-import json
+import argparse
+from collections import defaultdict
 from typing import List, Literal
 
-from tabulate import tabulate
-import glob
 
-import pandas as pd
-
-from load_raw_data import get_raw_metrics, get_cache_metrics_per_sequence
+from src import json_backend
+from src.load_raw_data import get_raw_metrics, get_cache_metrics_per_sequence, load_json, find_result_files, \
+    memory_budget_or_default, result_label
+from src.figure_manifest import FigureManifest, figure_hash
+from src.profiling import profiled, stage
+from src.result_cache import memoize
+from src.sampling import sample_mask
 
 import os
-import matplotlib.pyplot as plt
 import numpy as np
-import seaborn as sns
+
+# pandas, matplotlib and tabulate are imported inside the functions that use them,
+# so importing this module (e.g. from the CLI) stays fast.
+
+SWITCH_TYPES = ['new_session', 'existing_session', 'within_session']
 
 
-def plot_correlation_scatter(files, output_dir, filter_mode="all"):
+def sampled_entries(data, sample):
+    """
+    Mask of the entries whose cache state is decoded when sampling (stratified by template), None
+    without a sample. The session bookkeeping still runs over all entries.
+    """
+    if sample is None:
+        return None
+    return sample_mask([entry.get("sequenceElement", {}).get("template") for entry in data], sample)
+
+
+@profiled()
+def plot_correlation_scatter(files, output_dir, filter_mode="all", dpi=300, force=False,
+                             density_threshold=20000, density_bins=(100, 100)):
     """
     Generates a separate scatter plot of Cache Hit Rate vs. Log(Execution Time) for each file.
+    Plots whose inputs did not change since the last run are skipped unless force is set.
+
+    Files with more than density_threshold completed executions are drawn as a binned density
+    image instead of individual markers, set density_threshold to None to always draw markers.
+    Timeouts are drawn as a separate overlay in both modes.
     """
+    import matplotlib.pyplot as plt
+    from src.visualize_data import plot_log_density
+
+    manifest = FigureManifest(output_dir, force=force)
     all_data = {}
     max_time = 0
 
     # Parse raw data and find the global maximum time for consistent timeout placement
     for path in sorted(files):
-        label = os.path.basename(path).replace("query-results-raw-", "").replace(".json", "")
+        label = result_label(path)
         # Assuming get_raw_metrics is defined elsewhere in your script
         hit_rates, times, timeouts, requests, results = get_raw_metrics(path, filter_mode=filter_mode)
 
@@ -37,19 +64,42 @@ def plot_correlation_scatter(files, output_dir, filter_mode="all"):
 
     # 2. Generate and save a separate plot for each file
     for label, (hit_rates, times, timeouts) in all_data.items():
-        plt.figure(figsize=(10, 6))
-
+        output_file = f'scatter_cache_vs_time_{label}.png'
+        output_path = os.path.join(output_dir, output_file)
         valid_idx = ~timeouts
         timeout_idx = timeouts
-
-        # Plot standard executions
-        plt.scatter(hit_rates[valid_idx], times[valid_idx] / 1000,
-                    alpha=0.6, edgecolors='w', linewidth=0.5, label='Completed')
-
-        # Plot timeouts
-        if np.any(timeout_idx):
-            plt.scatter(hit_rates[timeout_idx], [timeout_y_val] * np.sum(timeout_idx),
-                        marker='x', color='red', s=50, label='Timeout')
+        use_density = density_threshold is not None and np.sum(valid_idx) > density_threshold
+
+        digest = figure_hash([hit_rates, times, timeouts], label=label, filter_mode=filter_mode,
+                             timeout_y_val=timeout_y_val, dpi=dpi, use_density=use_density,
+                             density_bins=density_bins)
+        if manifest.is_current(output_path, digest):
+            print(f"Scatter plot {output_path} is up to date.")
+            continue
+
+        fig, ax = plt.subplots(figsize=(10, 6))
+
+        if use_density:
+            # Plot standard executions as a binned density image
+            mesh = plot_log_density(ax, hit_rates[valid_idx], times[valid_idx] / 1000, bins=density_bins)
+            fig.colorbar(mesh, ax=ax, label='Executions per bin')
+
+            # Plot timeouts aggregated per hit rate bin, marker size grows with the count
+            if np.any(timeout_idx):
+                counts, edges = np.histogram(hit_rates[timeout_idx], bins=density_bins[0], range=(0.0, 1.0))
+                occupied = counts > 0
+                centers = (edges[:-1] + edges[1:]) / 2
+                plt.scatter(centers[occupied], [timeout_y_val] * np.sum(occupied),
+                            marker='x', color='red', s=20 + 30 * np.log10(counts[occupied]), label='Timeout')
+        else:
+            # Plot standard executions
+            plt.scatter(hit_rates[valid_idx], times[valid_idx] / 1000,
+                        alpha=0.6, edgecolors='w', linewidth=0.5, label='Completed')
+
+            # Plot timeouts
+            if np.any(timeout_idx):
+                plt.scatter(hit_rates[timeout_idx], [timeout_y_val] * np.sum(timeout_idx),
+                            marker='x', color='red', s=50, label='Timeout')
 
         # Formatting
         plt.yscale('log')
@@ -61,20 +111,24 @@ def plot_correlation_scatter(files, output_dir, filter_mode="all"):
         plt.tight_layout()
 
         # Save individual plot
-        output_file = f'scatter_cache_vs_time_{label}.png'
-        output_path = os.path.join(output_dir, output_file)
-        plt.savefig(output_path, dpi=300)
-        plt.close()
+        with stage("savefig"):
+            plt.savefig(output_path, dpi=dpi)
+        plt.close(fig)
+        manifest.record(output_path, digest)
 
         print(f"Scatter plot saved to {output_path}")
 
-def plot_cumulative_churn(files, output_dir, filter_mode="all", ):
+@profiled()
+def plot_cumulative_churn(files, output_dir, filter_mode="all", dpi=300, force=False):
     """Generates step plots showing cumulative cache evictions per sequence."""
+    import matplotlib.pyplot as plt
+
+    manifest = FigureManifest(output_dir, force=force)
     sequence_data = {}
 
     # 1. Parse data and calculate cumulative sum of evictions per sequence
     for path in sorted(files):
-        label = os.path.basename(path).replace("query-results-raw-", "").replace(".json", "")
+        label = result_label(path)
         # Uses the function defined in the previous step
         metrics_per_seq = get_cache_metrics_per_sequence(path, filter_mode=filter_mode)
 
@@ -85,6 +139,13 @@ def plot_cumulative_churn(files, output_dir, filter_mode="all", ):
 
     # 2. Generate a step plot for each sequence
     for seq_name, algorithms in sequence_data.items():
+        safe_seq_name = str(seq_name).replace(" ", "_").lower()
+        output_path = os.path.join(output_dir, f"cumulative_churn_{safe_seq_name}.png")
+        digest = figure_hash(algorithms, seq_name=seq_name, filter_mode=filter_mode, dpi=dpi)
+        if manifest.is_current(output_path, digest):
+            print(f"Churn plot {output_path} is up to date.")
+            continue
+
         plt.figure(figsize=(10, 6))
 
         for label, cum_evictions in algorithms.items():
@@ -98,24 +159,27 @@ def plot_cumulative_churn(files, output_dir, filter_mode="all", ):
         plt.grid(True, ls="--", alpha=0.5)
         plt.tight_layout()
 
-        safe_seq_name = str(seq_name).replace(" ", "_").lower()
-        output_path = os.path.join(output_dir, f"cumulative_churn_{safe_seq_name}.png")
-
-        plt.savefig(output_path, dpi=300)
+        with stage("savefig"):
+            plt.savefig(output_path, dpi=dpi)
         plt.close()
+        manifest.record(output_path, digest)
         print(f"Churn plot saved to {output_path}")
 
 
-def plot_sequence_cache_state(files, output_dir, filter_mode="all", drop_always_errors=False):
+@profiled()
+def plot_sequence_cache_state(files, output_dir, filter_mode="all", drop_always_errors=False, dpi=300, force=False):
     """
     Generates a sequence-aligned plot comparing cache hit rates (lines)
     and eviction percentages (bars).
     """
+    import matplotlib.pyplot as plt
+
+    manifest = FigureManifest(output_dir, force=force)
     sequence_data = {}
 
     # 1. Parse and group data by sequence
     for path in sorted(files):
-        label = os.path.basename(path).replace("query-results-raw-", "").replace(".json", "")
+        label = result_label(path)
         metrics_per_seq = get_cache_metrics_per_sequence(
             path, filter_mode=filter_mode, drop_always_errors=drop_always_errors
         )
@@ -127,6 +191,13 @@ def plot_sequence_cache_state(files, output_dir, filter_mode="all", drop_always_
 
     # 2. Generate a plot for each sequence
     for seq_name, algorithms in sequence_data.items():
+        safe_seq_name = str(seq_name).replace(" ", "_").lower()
+        output_path = os.path.join(output_dir, f"cache_state_{safe_seq_name}_{filter_mode}.png")
+        digest = figure_hash(algorithms, seq_name=seq_name, filter_mode=filter_mode, dpi=dpi)
+        if manifest.is_current(output_path, digest):
+            print(f"Cache state plot {output_path} is up to date.")
+            continue
+
         fig, ax1 = plt.subplots(figsize=(12, 6))
         ax2 = ax1.twinx()
 
@@ -174,32 +245,41 @@ def plot_sequence_cache_state(files, output_dir, filter_mode="all", drop_always_
         ax1.grid(True, ls="--", alpha=0.3)
         fig.tight_layout()
 
-        # Format output filename
-        safe_seq_name = str(seq_name).replace(" ", "_").lower()
-        output_path = os.path.join(output_dir, f"cache_state_{safe_seq_name}_{filter_mode}.png")
-
-        fig.savefig(output_path, dpi=300, bbox_inches='tight')
+        with stage("savefig"):
+            fig.savefig(output_path, dpi=dpi, bbox_inches='tight')
         plt.close(fig)
+        manifest.record(output_path, digest)
         print(f"Cache state plot saved to {output_path}")
 
 
-def calculate_session_hit_rates(files: List[str]) -> pd.DataFrame:
+@profiled()
+def session_switch_sums(files: List[str], sample=None, memory_budget=None) -> 'pd.DataFrame':
     """
-    Parses result files to calculate average hit rates based on session context:
-    new session, existing session, or within the current session.
+    Classifies every query with a session as new_session, existing_session or within_session (the
+    session of the preceding query) and sums its hit rate per (algorithm, template, switch_type).
+    Returns a DataFrame with n, hit_rate_sum and hit_rate_sq_sum per group, built from running sums,
+    so memory does not grow with the number of queries. With a memory_budget (see spill.py) the files
+    are streamed instead of read whole; sample (a fraction or a size per template) only decodes the
+    cache states of the sampled queries.
     """
-    records = []
+    import pandas as pd
+
+    if memory_budget is not None and sample is not None:
+        raise ValueError("A sample needs the whole file in memory, it can not be combined with a memory budget")
+    if sample is None:
+        memory_budget = memory_budget_or_default(memory_budget)
 
+    sums = defaultdict(lambda: [0, 0.0, 0.0])
     for path in sorted(files):
-        algo_label = os.path.basename(path).replace("query-results-raw-", "").replace(".json", "")
+        algo_label = result_label(path)
 
-        with open(path, 'r') as file:
-            data = json.load(file)
+        data = json_backend.iter_array(path) if memory_budget is not None else load_json(path)
+        sampled = sampled_entries(data, sample)
 
         seen_sessions = set()
         prev_session_id = None
 
-        for entry in data:
+        for i, entry in enumerate(data):
             seq_element = entry.get("sequenceElement", {})
             session_info = seq_element.get("session", {})
 
@@ -213,13 +293,13 @@ def calculate_session_hit_rates(files: List[str]) -> pd.DataFrame:
                         entry.get("@comunica/persistent-cache-manager:sourceStateQuerySource")
 
             hit_rate = np.nan
-            if cache_str:
+            if cache_str and (sampled is None or sampled[i]):
                 try:
-                    cache_stats = json.loads(cache_str)
+                    cache_stats = json_backend.loads(cache_str)
                     hits = cache_stats.get("hits", 0)
                     total = hits + cache_stats.get("misses", 0)
                     hit_rate = (hits / total) if total > 0 else 0.0
-                except json.JSONDecodeError:
+                except json_backend.JSONDecodeError:
                     pass
 
             # Determine session state
@@ -232,171 +312,127 @@ def calculate_session_hit_rates(files: List[str]) -> pd.DataFrame:
                 switch_type = "existing_session"
 
             if template and not np.isnan(hit_rate):
-                records.append({
-                    'algorithm': algo_label,
-                    'template': template,
-                    'switch_type': switch_type,
-                    'hit_rate': hit_rate
-                })
+                group = sums[(algo_label, template, switch_type)]
+                group[0] += 1
+                group[1] += hit_rate
+                group[2] += hit_rate * hit_rate
 
             seen_sessions.add(current_session_id)
             prev_session_id = current_session_id
 
-    if not records:
-        return pd.DataFrame()
+    return pd.DataFrame(
+        [(*key, n, total, squares) for key, (n, total, squares) in sums.items()],
+        columns=['algorithm', 'template', 'switch_type', 'n', 'hit_rate_sum', 'hit_rate_sq_sum']
+    )
 
-    df = pd.DataFrame(records)
 
-    # Calculate means and pivot
-    avg_df = df.groupby(['algorithm', 'template', 'switch_type'])['hit_rate'].mean().reset_index()
+def standard_error_from_sums(n, total, squares):
+    """Standard error of the mean from the count, sum and sum of squares of a sample (NaN below 2 values)."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = np.maximum(squares - total * total / n, 0) / (n - 1)
+        return np.where(n > 1, np.sqrt(variance / n), np.nan)
 
-    pivot_df = avg_df.pivot(
-        index=['algorithm', 'template'],
-        columns='switch_type',
-        values='hit_rate'
-    ).reset_index()
 
+def pivot_switch_types(df, index, value, with_se):
+    """One column per switch type of value (and of value_se, as <switch type>_se columns if with_se)."""
+    pivot_df = df.pivot(index=index, columns='switch_type', values=value).reset_index()
     pivot_df.columns.name = None
+    if with_se:
+        se_df = df.pivot(index=index, columns='switch_type', values=f"{value}_se").reset_index()
+        se_df.columns.name = None
+        pivot_df = pivot_df.merge(se_df.rename(columns={col: f"{col}_se" for col in SWITCH_TYPES}), on=index)
 
     # Standardize output columns
-    expected_columns = ['new_session', 'existing_session', 'within_session']
-    for col in expected_columns:
+    for col in SWITCH_TYPES:
         if col not in pivot_df.columns:
             pivot_df[col] = np.nan
+    col_order = index + SWITCH_TYPES + ([f"{col}_se" for col in SWITCH_TYPES] if with_se else [])
+    return pivot_df[[c for c in col_order if c in pivot_df.columns]]
 
-    col_order = ['algorithm', 'template', 'new_session', 'existing_session', 'within_session']
-    pivot_df = pivot_df[[c for c in col_order if c in pivot_df.columns]]
 
-    return pivot_df
+@profiled()
+@memoize(paths=("files",))
+def calculate_session_hit_rates(files: List[str], sample=None, memory_budget=None) -> 'pd.DataFrame':
+    """
+    Parses result files to calculate average hit rates based on session context:
+    new session, existing session, or within the current session. With a sample (a fraction or a
+    size per template) only the sampled queries are averaged, and <switch type>_se columns give the
+    standard errors of the means. memory_budget streams the files, see session_switch_sums.
+    """
+    import pandas as pd
 
+    df = session_switch_sums(files, sample, memory_budget)
+    if df.empty:
+        return pd.DataFrame()
 
-import os
-import json
-import pandas as pd
-import numpy as np
-from typing import List
+    # Calculate means and pivot
+    df['hit_rate'] = df['hit_rate_sum'] / df['n']
+    df['hit_rate_se'] = standard_error_from_sums(df['n'], df['hit_rate_sum'], df['hit_rate_sq_sum'])
+    return pivot_switch_types(df, ['algorithm', 'template'], 'hit_rate', sample is not None)
 
 
-def calculate_switch_effect(files: List[str]) -> pd.DataFrame:
+@profiled()
+@memoize(paths=("files",))
+def calculate_switch_effect(files: List[str], sample=None, memory_budget=None) -> 'pd.DataFrame':
     """
     Parses result files, normalizes hit rates against template baselines,
-    and aggregates the pure effect of session states.
+    and aggregates the pure effect of session states. With a sample (a fraction or a size per
+    template) only the sampled queries are used, and <switch type>_se columns give the standard
+    errors of the effects. memory_budget streams the files, see session_switch_sums.
     """
-    records = []
-
-    for path in sorted(files):
-        algo_label = os.path.basename(path).replace("query-results-raw-", "").replace(".json", "")
-
-        with open(path, 'r') as file:
-            data = json.load(file)
+    import pandas as pd
 
-        seen_sessions = set()
-        prev_session_id = None
-
-        for entry in data:
-            seq_element = entry.get("sequenceElement", {})
-            session_info = seq_element.get("session", {})
-
-            if "sessionId" not in session_info:
-                continue
-
-            current_session_id = session_info["sessionId"]
-            template = seq_element.get("template")
-
-            cache_str = entry.get("@comunica/persistent-cache-manager:sourceState") or \
-                        entry.get("@comunica/persistent-cache-manager:sourceStateQuerySource")
-
-            hit_rate = np.nan
-            if cache_str:
-                try:
-                    cache_stats = json.loads(cache_str)
-                    hits = cache_stats.get("hits", 0)
-                    total = hits + cache_stats.get("misses", 0)
-                    hit_rate = (hits / total) if total > 0 else 0.0
-                except json.JSONDecodeError:
-                    pass
-
-            if prev_session_id is None or (
-                    current_session_id not in seen_sessions and current_session_id != prev_session_id):
-                switch_type = "new_session"
-            elif current_session_id == prev_session_id:
-                switch_type = "within_session"
-            else:
-                switch_type = "existing_session"
-
-            if template and not np.isnan(hit_rate):
-                records.append({
-                    'algorithm': algo_label,
-                    'template': template,
-                    'switch_type': switch_type,
-                    'hit_rate': hit_rate
-                })
-
-            seen_sessions.add(current_session_id)
-            prev_session_id = current_session_id
-
-    if not records:
+    df = session_switch_sums(files, sample, memory_budget)
+    if df.empty:
         return pd.DataFrame()
 
-    df = pd.DataFrame(records)
-
     # 1. Calculate the overall baseline hit rate for each algorithm + template combination
-    baselines = df.groupby(['algorithm', 'template'])['hit_rate'].mean().reset_index()
-    baselines.rename(columns={'hit_rate': 'template_baseline'}, inplace=True)
+    baselines = df.groupby(['algorithm', 'template'])[['n', 'hit_rate_sum']].sum()
+    baselines = (baselines['hit_rate_sum'] / baselines['n']).rename('template_baseline').reset_index()
 
-    # 2. Merge baselines back to the main records
+    # 2. Merge baselines back to the grouped sums
     df = df.merge(baselines, on=['algorithm', 'template'])
 
-    # 3. Calculate the delta (effect of the switch type)
-    df['hit_rate_delta'] = df['hit_rate'] - df['template_baseline']
+    # 3. Sum the deltas (effect of the switch type) of the queries: hit_rate - template_baseline
+    b = df['template_baseline']
+    df['delta_sum'] = df['hit_rate_sum'] - df['n'] * b
+    df['delta_sq_sum'] = df['hit_rate_sq_sum'] - 2 * b * df['hit_rate_sum'] + df['n'] * b * b
 
     # 4. Aggregate the deltas by algorithm and switch type across all templates
-    effect_df = df.groupby(['algorithm', 'switch_type'])['hit_rate_delta'].mean().reset_index()
+    effect_df = df.groupby(['algorithm', 'switch_type'])[['n', 'delta_sum', 'delta_sq_sum']].sum().reset_index()
+    effect_df['hit_rate_delta'] = effect_df['delta_sum'] / effect_df['n']
+    effect_df['hit_rate_delta_se'] = standard_error_from_sums(effect_df['n'], effect_df['delta_sum'],
+                                                              effect_df['delta_sq_sum'])
 
     # Pivot for clean presentation
-    pivot_df = effect_df.pivot(
-        index='algorithm',
-        columns='switch_type',
-        values='hit_rate_delta'
-    ).reset_index()
-
-    pivot_df.columns.name = None
-
-    expected_columns = ['new_session', 'existing_session', 'within_session']
-    for col in expected_columns:
-        if col not in pivot_df.columns:
-            pivot_df[col] = np.nan
+    return pivot_switch_types(effect_df, ['algorithm'], 'hit_rate_delta', sample is not None)
 
-    col_order = ['algorithm', 'new_session', 'existing_session', 'within_session']
-    pivot_df = pivot_df[[c for c in col_order if c in pivot_df.columns]]
 
-    return pivot_df
-
-
-import os
-import json
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-from typing import List, Literal
-
-
-def plot_eviction_impact(files: List[str], dep_var: Literal['hit_rate', 'execution_time'],
-                         num_bins: int = 100, output_dir=None, file_name=None):
+@profiled()
+def prepare_eviction_impact(files: List[str], dep_var: Literal['hit_rate', 'execution_time'], sample=None):
     """
-    Parses result files, extracts sequential queries within the same session,
-    calculates Pearson correlation, bins the preceding cache eviction percentage,
-    and plots the mean delta of the dependent variable for each algorithm.
+    Data preparation of plot_eviction_impact: returns a DataFrame with, for every query that directly
+    follows another query of the same session, the eviction percentage of the preceding query and the
+    delta of the dependent variable from its (algorithm, template) baseline. Returns None if no such
+    queries exist. With a sample (a fraction or a size per template) only the sampled queries and
+    their preceding queries are parsed, the baselines are then the means of those.
     """
+    import pandas as pd
+
     records = []
 
     for path in sorted(files):
-        algo_label = os.path.basename(path).replace("query-results-raw-", "").replace(".json", "")
+        algo_label = result_label(path)
 
-        with open(path, 'r') as file:
-            data = json.load(file)
+        data = load_json(path)
+        sampled = sampled_entries(data, sample)
+        if sampled is not None:
+            # The eviction percentage of the preceding query is needed too
+            sampled |= np.r_[sampled[1:], False]
 
         for i, entry in enumerate(data):
+            if sampled is not None and not sampled[i]:
+                continue
             seq_element = entry.get("sequenceElement", {})
             session_info = seq_element.get("session", {})
             session_id = session_info.get("sessionId")
@@ -410,14 +446,14 @@ def plot_eviction_impact(files: List[str], dep_var: Literal['hit_rate', 'executi
 
             if cache_str:
                 try:
-                    cache_stats = json.loads(cache_str)
+                    cache_stats = json_backend.loads(cache_str)
                     hits = cache_stats.get("hits", 0)
                     misses = cache_stats.get("misses", 0)
                     total = hits + misses
                     hit_rate = (hits / total) if total > 0 else 0.0
 
                     eviction_pct = cache_stats.get("evictionPercentage")
-                except json.JSONDecodeError:
+                except json_backend.JSONDecodeError:
                     pass
             else:
                 hit_rate = np.nan
@@ -441,9 +477,10 @@ def plot_eviction_impact(files: List[str], dep_var: Literal['hit_rate', 'executi
 
     if not records:
         print("No valid data found.")
-        return
+        return None
 
-    df = pd.DataFrame(records)
+    with stage("DataFrame construction", entries=len(records)):
+        df = pd.DataFrame(records)
 
     # Calculate baselines and delta
     baselines = df.groupby(['algorithm', 'template'])['dep_value'].mean().reset_index()
@@ -456,12 +493,34 @@ def plot_eviction_impact(files: List[str], dep_var: Literal['hit_rate', 'executi
     # Shift columns to align consecutive queries
     df['prev_session_id'] = df['session_id'].shift(1)
     df['prev_eviction_pct'] = df['eviction_pct'].shift(1)
+    if sample is not None:
+        # Only pairs of directly consecutive queries, the sample leaves gaps between them
+        df.loc[df['query_index'].diff() != 1, 'prev_session_id'] = None
 
     within_session_df = df[df['session_id'] == df['prev_session_id']].dropna(
         subset=['prev_eviction_pct', 'delta_value']).copy()
 
     if within_session_df.empty:
         print("No valid sequential data found.")
+        return None
+
+    return within_session_df
+
+
+@profiled()
+def plot_eviction_impact(files: List[str], dep_var: Literal['hit_rate', 'execution_time'],
+                         num_bins: int = 100, output_dir=None, file_name=None, force=False, sample=None):
+    """
+    Parses result files, extracts sequential queries within the same session,
+    calculates Pearson correlation, bins the preceding cache eviction percentage,
+    and plots the mean delta of the dependent variable for each algorithm.
+    With a sample, the plot is approximated from a sample of the queries (see prepare_eviction_impact).
+    """
+    import matplotlib.pyplot as plt
+    import pandas as pd
+
+    within_session_df = prepare_eviction_impact(files, dep_var, sample)
+    if within_session_df is None:
         return
 
     # Calculate Pearson correlation on unbinned data
@@ -488,6 +547,23 @@ def plot_eviction_impact(files: List[str], dep_var: Literal['hit_rate', 'executi
         lambda x: x.mid if pd.notnull(x) else np.nan
     )
 
+    output_loc = f"eviction_vs_{dep_var}_binned.png"
+    if output_dir and file_name:
+        output_loc = os.path.join(output_dir, file_name)
+    elif output_dir and not file_name:
+        output_loc = os.path.join(output_dir, output_loc)
+    elif file_name and not output_dir:
+        output_loc = file_name
+
+    manifest = FigureManifest(os.path.dirname(output_loc) or ".", force=force)
+    digest = figure_hash(
+        [binned_df[['algorithm', 'bin_midpoint', 'mean_delta']], corr_df],
+        dep_var=dep_var, num_bins=num_bins
+    )
+    if manifest.is_current(output_loc, digest):
+        print(f"Plot {output_loc} is up to date.")
+        return
+
     # Plot generation
     fig, ax = plt.subplots(figsize=(10, 6))
 
@@ -517,30 +593,27 @@ def plot_eviction_impact(files: List[str], dep_var: Literal['hit_rate', 'executi
 
     plt.tight_layout()
 
-    output_loc = f"eviction_vs_{dep_var}_binned.png"
-    if output_dir and file_name:
-        output_loc = os.path.join(output_dir, file_name)
-    elif output_dir and not file_name:
-        output_loc = os.path.join(output_dir, output_loc)
-    elif file_name and not output_dir:
-        output_loc = file_name
-
-    plt.savefig(output_loc)
+    with stage("savefig"):
+        plt.savefig(output_loc)
+    manifest.record(output_loc, digest)
     print(f"Plot saved as {output_loc}")
 
 
-def plot_refinement_sequence_performance(files: List[str], output_dir=None, file_name=None):
+@profiled()
+def plot_refinement_sequence_performance(files: List[str], output_dir=None, file_name=None, force=False):
     """
     Parses result files to extract refinement sequences (base query + subsequent refinements).
     Calculates and plots the average cumulative hit rate and cumulative evictions per step.
     """
+    import matplotlib.pyplot as plt
+    import pandas as pd
+
     records = []
     #TODO: This is wrong!
     for path in sorted(files):
-        algo_label = os.path.basename(path).replace("query-results-raw-", "").replace(".json", "")
+        algo_label = result_label(path)
 
-        with open(path, 'r') as file:
-            data = json.load(file)
+        data = load_json(path)
 
         # Group sequential queries by session
         session_streams = {}
@@ -560,11 +633,11 @@ def plot_refinement_sequence_performance(files: List[str], output_dir=None, file
             hits, misses, evictions = 0, 0, 0
             if cache_str:
                 try:
-                    cache_stats = json.loads(cache_str)
+                    cache_stats = json_backend.loads(cache_str)
                     hits = cache_stats.get("hits", 0)
                     misses = cache_stats.get("misses", 0)
                     evictions = cache_stats.get("evictions", 0)
-                except json.JSONDecodeError:
+                except json_backend.JSONDecodeError:
                     pass
 
             if session_id not in session_streams:
@@ -633,7 +706,8 @@ def plot_refinement_sequence_performance(files: List[str], output_dir=None, file
         print("No valid refinement sequences found.")
         return
 
-    df = pd.DataFrame(records)
+    with stage("DataFrame construction", entries=len(records)):
+        df = pd.DataFrame(records)
 
     # Calculate means per algorithm per step
     step_stats = df.groupby(['algorithm', 'step']).agg(
@@ -646,6 +720,20 @@ def plot_refinement_sequence_performance(files: List[str], output_dir=None, file
     min_samples = 5
     step_stats = step_stats[step_stats['n_samples'] >= min_samples]
 
+    output_loc = "refinement_sequence_performance.png"
+    if output_dir and file_name:
+        output_loc = os.path.join(output_dir, file_name)
+    elif output_dir and not file_name:
+        output_loc = os.path.join(output_dir, output_loc)
+    elif file_name and not output_dir:
+        output_loc = file_name
+
+    manifest = FigureManifest(os.path.dirname(output_loc) or ".", force=force)
+    digest = figure_hash(step_stats, min_samples=min_samples)
+    if manifest.is_current(output_loc, digest):
+        print(f"Plot {output_loc} is up to date.")
+        return
+
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 5))
     algos = step_stats['algorithm'].unique()
 
@@ -686,21 +774,16 @@ def plot_refinement_sequence_performance(files: List[str], output_dir=None, file
 
     plt.tight_layout()
 
-    output_loc = "refinement_sequence_performance.png"
-    if output_dir and file_name:
-        output_loc = os.path.join(output_dir, file_name)
-    elif output_dir and not file_name:
-        output_loc = os.path.join(output_dir, output_loc)
-    elif file_name and not output_dir:
-        output_loc = file_name
-
-    plt.savefig(output_loc, bbox_inches='tight')
+    with stage("savefig"):
+        plt.savefig(output_loc, bbox_inches='tight')
+    manifest.record(output_loc, digest)
     print(f"Plot saved as {output_loc}")
 
-def main():
+def main(force=False):
+    from tabulate import tabulate
+
     # Define the path to the benchmark data files
-    pattern = os.path.join("data", "query-results-raw-*.json")
-    files = glob.glob(pattern)
+    files = find_result_files("data")
 
     if not files:
         print("Error: No data files found matching the pattern.")
@@ -712,10 +795,10 @@ def main():
     # plot_correlation_scatter(files, "output/cache_metric_figures", "no_refinement")
     #
     print("Generating cumulative churn plots...")
-    plot_cumulative_churn(files, "output/cache_metric_figures", "no_refinement")
+    plot_cumulative_churn(files, "output/cache_metric_figures", "no_refinement", force=force)
     #
     print("Generating cache state plots...")
-    plot_sequence_cache_state(files, "output/cache_metric_figures")
+    plot_sequence_cache_state(files, "output/cache_metric_figures", force=force)
     # print("All plots generated successfully.")
     #
     print("Generating hitrate on switch dataframe")
@@ -742,19 +825,26 @@ def main():
                          dep_var = "execution_time",
                          num_bins=50,
                          output_dir="output/cache_metric_figures",
-                         file_name="eviction_vs_hit_rate_l.png")
+                         file_name="eviction_vs_hit_rate_l.png",
+                         force=force)
     plot_eviction_impact([file for file in files if "-m" in file],
                          dep_var="execution_time",
                          output_dir="output/cache_metric_figures",
-                         file_name="eviction_vs_hit_rate_m.png")
+                         file_name="eviction_vs_hit_rate_m.png",
+                         force=force)
     plot_eviction_impact([file for file in files if "-s" in file],
                          dep_var="execution_time",
                          output_dir="output/cache_metric_figures",
-                         file_name="eviction_vs_hit_rate_s.png")
+                         file_name="eviction_vs_hit_rate_s.png",
+                         force=force)
 
     plot_refinement_sequence_performance([file for file in files if "-s" in file],
                          output_dir="output/cache_metric_figures",
-                         file_name="refinement_sequence_performance.png")
+                         file_name="refinement_sequence_performance.png",
+                         force=force)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate cache metric figures.")
+    parser.add_argument("--force", action="store_true", help="Re-render figures even if their inputs did not change.")
+    args = parser.parse_args()
+    main(force=args.force)
\ No newline at end of file
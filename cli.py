@@ -0,0 +1,455 @@
+import time
+
+_START_TIME = time.perf_counter()
+
+import argparse
+import os
+import sys
+
+# Only light-weight modules are imported here. Plotting libraries (matplotlib, pandas, seaborn, tabulate)
+# are imported by the subcommands that need them, so e.g. `python cli.py summary` starts quickly.
+
+
+def discover_files(args):
+    from src.load_raw_data import find_result_files
+
+    files = find_result_files(args.data_dir, args.pattern)
+    if not files:
+        print(f"Error: No data files found matching {os.path.join(args.data_dir, args.pattern)}")
+        sys.exit(1)
+    return files
+
+
+def sample_argument(value):
+    """A sample fraction (e.g. 0.1) or size (e.g. 500)."""
+    return int(value) if value.isdigit() else float(value)
+
+
+def cmd_summary(args):
+    import numpy as np
+    from src.load_raw_data import get_raw_metrics, result_label
+
+    files = discover_files(args)
+    if args.sample is not None:
+        if args.drop_outliers:
+            print("Error: --drop-outliers can not be combined with --sample")
+            sys.exit(1)
+        cmd_sampled_summary(args, files)
+        return
+    header = f"{'algorithm':<40} {'entries':>8} {'timeouts':>9} {'mean (s)':>10} {'geo mean (s)':>13} {'hit rate':>9}"
+    print(header)
+    print("-" * len(header))
+    for path in files:
+        hit_rates, times, timeouts, _, _ = get_raw_metrics(path, filter_mode=args.filter_mode,
+                                                          drop_always_errors=args.drop_always_errors,
+                                                          timeout_ms=args.timeout_ms, drop_outliers=args.drop_outliers)
+        completed = times[~timeouts] / 1000
+        positive = completed[completed > 0]
+        mean_time = np.mean(completed) if len(completed) > 0 else float('nan')
+        geo_mean_time = np.exp(np.mean(np.log(positive))) if len(positive) > 0 else float('nan')
+        mean_hit_rate = np.mean(hit_rates) if len(hit_rates) > 0 else float('nan')
+        print(f"{result_label(path):<40} {len(times):>8} {int(np.sum(timeouts)):>9} "
+              f"{mean_time:>10.3f} {geo_mean_time:>13.3f} {mean_hit_rate:>9.3f}")
+
+
+def cmd_sampled_summary(args, files):
+    from src.load_raw_data import result_label
+    from src.sampling import approximate_raw_metrics
+
+    header = (f"{'algorithm':<40} {'sampled':>15} {'timeout rate':>17} {'mean (s)':>17} {'geo mean (s)':>17} "
+              f"{'hit rate':>17}")
+    print(header)
+    print("-" * len(header))
+    for path in files:
+        estimates = approximate_raw_metrics(path, args.sample, filter_mode=args.filter_mode,
+                                            drop_always_errors=args.drop_always_errors, timeout_ms=args.timeout_ms)
+        sampled = f"{estimates['timeout']['n']}/{estimates['timeout']['population']}"
+        columns = (f"{estimates[name]['mean'] * scale:.3f} ± {estimates[name]['se'] * scale:.3f}"
+                   for name, scale in (("timeout", 1), ("time", 1 / 1000), ("geo_time", 1 / 1000), ("hit_rate", 1)))
+        timeout, time_s, geo_time_s, hit_rate = columns
+        print(f"{result_label(path):<40} {sampled:>15} {timeout:>17} {time_s:>17} {geo_time_s:>17} {hit_rate:>17}")
+
+
+def cmd_outliers(args):
+    from src.outliers import outlier_report
+
+    report = outlier_report(discover_files(args), rules=args.rules, group_by=args.group_by, tails=args.tails)
+    print(report.to_string(index=False))
+
+
+def cmd_cactus(args):
+    from plot_cumulative import plot_cactus
+
+    y_labels = {
+        "exec_time": "Execution Time (s)",
+        "http_requests": "HTTP Requests",
+        "results": "Produced Results",
+    }
+    os.makedirs(args.output_dir, exist_ok=True)
+    plot_cactus(discover_files(args),
+                output_dir=args.output_dir,
+                plotted_value=args.value,
+                y_label=y_labels[args.value],
+                title=f'Cactus Plot: Global Algorithm Performance\nFilter: {args.filter_mode}',
+                filter_timeouts=args.filter_timeouts,
+                filter_mode=args.filter_mode,
+                drop_always_errors=args.drop_always_errors,
+                log_y_axis=args.log_y_axis,
+                force=args.force)
+
+
+def cmd_cumulative(args):
+    from plot_cumulative import main as plot_cumulative_main
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    plot_cumulative_main(args.output_dir, discover_files(args), force=args.force)
+
+
+def cmd_cache_state(args):
+    from cache_metrics_plots import plot_sequence_cache_state
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    plot_sequence_cache_state(discover_files(args), args.output_dir, filter_mode=args.filter_mode,
+                              drop_always_errors=args.drop_always_errors, force=args.force)
+
+
+def cmd_churn(args):
+    from cache_metrics_plots import plot_cumulative_churn
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    plot_cumulative_churn(discover_files(args), args.output_dir, filter_mode=args.filter_mode, force=args.force)
+
+
+def cmd_sessions(args):
+    from tabulate import tabulate
+    from cache_metrics_plots import calculate_session_hit_rates, calculate_switch_effect
+
+    files = discover_files(args)
+    print(tabulate(calculate_session_hit_rates(files, sample=args.sample), headers='keys', tablefmt='psql'))
+    print(tabulate(calculate_switch_effect(files, sample=args.sample), headers='keys', tablefmt='psql'))
+
+
+def cmd_eviction_impact(args):
+    from cache_metrics_plots import plot_eviction_impact
+
+    files = discover_files(args)
+    if args.size:
+        files = [f for f in files if f"-{args.size}" in os.path.basename(f)]
+    os.makedirs(args.output_dir, exist_ok=True)
+    suffix = f"_{args.size}" if args.size else ""
+    plot_eviction_impact(files, dep_var=args.dep_var, num_bins=args.num_bins, output_dir=args.output_dir,
+                         file_name=f"eviction_vs_{args.dep_var}{suffix}.png", force=args.force, sample=args.sample)
+
+
+def cmd_ingest(args):
+    from src.result_store import DEFAULT_STORE_PATH, ingest_files
+
+    ingest_files(discover_files(args), args.store or DEFAULT_STORE_PATH, force=args.force)
+
+
+def cmd_query(args):
+    from src.result_store import DEFAULT_STORE_PATH, ResultStore
+
+    filters = {}
+    for condition in args.where:
+        column, _, value = condition.partition("=")
+        filters[column] = int(value) if value.lstrip("-").isdigit() else value
+    store = ResultStore(args.store or DEFAULT_STORE_PATH)
+    result = store.aggregate(args.metric, args.how, tuple(args.by), **filters)
+    if not args.by:
+        print(result)
+        return
+    for group, value in sorted(result.items(), key=lambda item: str(item[0])):
+        print(f"{' | '.join(map(str, group)) if isinstance(group, tuple) else group:<60} {value}")
+
+
+def cmd_cube(args):
+    from src.summary_cube import DEFAULT_CUBE_PATH, MEASURES, build_summary_cube
+
+    cube = build_summary_cube(discover_files(args), args.output or DEFAULT_CUBE_PATH, timeout_ms=args.timeout_ms,
+                              force=args.force)
+    filters = {"filter_mode": args.filter_mode, "drop_always_errors": args.drop_always_errors}
+    try:
+        for condition in args.where:
+            column, _, value = condition.partition("=")
+            filters[column] = cube.coerce(column, value)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(cube.query(by=tuple(args.by), measures=MEASURES, **filters).to_string(index=False))
+
+
+def cmd_compare(args):
+    from src.regression import compare_runs, compare_table, write_verdict
+
+    thresholds = {"slowdown": args.max_slowdown, "error_rate": args.max_error_rate_increase,
+                  "hit_rate": args.max_hit_rate_drop}
+    verdict = compare_runs(args.baseline, args.candidate, filter_mode=args.filter_mode, thresholds=thresholds,
+                           alpha=args.alpha, n_resamples=args.resamples, timeout_ms=args.timeout_ms,
+                           seed=args.seed, workers=args.workers)
+    table = compare_table(verdict)
+    if not args.all_templates and not table.empty:
+        table = table[table["flags"] != ""]
+    print(table.to_string(index=False) if not table.empty else "No regressions.")
+    if args.json:
+        write_verdict(verdict, args.json)
+        print(f"Wrote verdict to {args.json}")
+    print(f"Verdict: {'PASSED' if verdict['passed'] else 'FAILED'} ({len(verdict['regressions'])} regressions)")
+    if not verdict["passed"]:
+        sys.exit(1)
+
+
+def cmd_shard(args):
+    from src.sharding import shard_result_file
+
+    for path in discover_files(args):
+        index = shard_result_file(path, n_shards=args.shards, force=args.force)
+        print(f"{path}: {len(index['shards'])} shards, {index['n_entries']} entries")
+
+
+def cmd_pack_topologies(args):
+    from pathlib import Path
+    from src.json_backend import is_json_file
+    from src.topology_archive import pack_topology_dir
+
+    for path in map(Path, args.paths):
+        if any(is_json_file(f.name) for f in path.iterdir()):
+            topology_dirs = [path]
+        else:
+            topology_dirs = sorted(d for d in path.rglob("output-topology-tracking") if d.is_dir())
+        if not topology_dirs:
+            print(f"Warning: No topology files found in {path}")
+        for topology_dir in topology_dirs:
+            pack_topology_dir(topology_dir, codec=args.codec, remove=args.remove)
+
+
+def cmd_bootstrap(args):
+    from src.bootstrap import bootstrap_confidence_intervals
+
+    files = discover_files(args)
+    baseline = args.baseline
+    if baseline is not None and not os.path.exists(baseline):
+        from src.load_raw_data import result_label
+        matches = [f for f in files if result_label(f) == baseline]
+        if not matches:
+            print(f"Error: Baseline {baseline} is neither a file nor the label of a result file")
+            sys.exit(1)
+        baseline = matches[0]
+    intervals = bootstrap_confidence_intervals(files, baseline=baseline, filter_modes=[args.filter_mode],
+                                               n_resamples=args.resamples, confidence=args.confidence,
+                                               exclude_errors=args.exclude_errors,
+                                               drop_always_errors=args.drop_always_errors,
+                                               seed=args.seed, workers=args.workers)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        intervals.to_csv(args.output, index=False)
+        print(f"Wrote {len(intervals)} intervals to {args.output}")
+    else:
+        print(intervals.to_string(index=False))
+
+
+def cmd_significance(args):
+    from src.significance import pairwise_significance
+
+    pairs, kruskal = pairwise_significance(discover_files(args), filter_mode=args.filter_mode,
+                                           exclude_errors=args.exclude_errors,
+                                           drop_always_errors=args.drop_always_errors, alpha=args.alpha,
+                                           correction=args.correction, workers=args.workers)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        pairs.to_csv(args.output, index=False)
+        print(f"Wrote {len(pairs)} pairwise tests to {args.output}")
+    else:
+        print(kruskal.to_string(index=False))
+        if not pairs.empty:
+            print(pairs[pairs["is_significant"]].to_string(index=False))
+
+
+def cmd_sweep(args):
+    from src.hyperparameter_analysis import main as sweep_main
+
+    sweep_main(args.sweep_dir, args.output_dir, read_ahead=args.read_ahead)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Analysis of raw caching benchmark results.")
+    parser.add_argument("--timing", action="store_true", help="Report startup and total run time.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print per-stage timings, entries/s and peak RSS at exit.")
+    parser.add_argument("--profile-trace", metavar="PATH",
+                        help="Profile and write the stages as a Chrome trace (chrome://tracing, Perfetto).")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    files_parser = argparse.ArgumentParser(add_help=False)
+    files_parser.add_argument("--data-dir", default="data", help="Directory with result files.")
+    files_parser.add_argument("--pattern", default="query-results-raw-*.json", help="Glob pattern of result files.")
+    files_parser.add_argument("--filter-mode", default="all", choices=["all", "refinement_only", "no_refinement"])
+    files_parser.add_argument("--drop-always-errors", action="store_true",
+                              help="Exclude templates that fail in all their executions.")
+    files_parser.add_argument("--store", help="Answer the per-file queries from this result store (see `ingest`) "
+                                              "instead of parsing the JSON files.")
+    files_parser.add_argument("--memory-budget", metavar="SIZE",
+                              help="Stream the per-sequence and session analyses and spill grouped entries to "
+                                   "disk beyond this size (e.g. 512M), for files larger than memory.")
+
+    sample_parser = argparse.ArgumentParser(add_help=False)
+    sample_parser.add_argument("--sample", type=sample_argument,
+                               help="Approximate from a sample stratified by template: a fraction (e.g. 0.1) or a "
+                                    "number of entries (e.g. 500), reported with standard errors.")
+
+    plot_parser = argparse.ArgumentParser(add_help=False)
+    plot_parser.add_argument("--output-dir", default=os.path.join("output", "cache_metric_figures"))
+    plot_parser.add_argument("--force", action="store_true", help="Re-render figures even if their inputs did not change.")
+
+    summary = subparsers.add_parser("summary", parents=[files_parser, sample_parser], help="Print per-file summary statistics.")
+    summary.add_argument("--timeout-ms", type=int, default=180000)
+    summary.add_argument("--drop-outliers", choices=["iqr", "mad"],
+                         help="Exclude outlier repetitions per (template, step) with this rule.")
+    summary.set_defaults(func=cmd_summary)
+
+    outliers = subparsers.add_parser("outliers", parents=[files_parser],
+                                     help="Report how many repetitions every outlier rule removes per file.")
+    outliers.add_argument("--rules", nargs="+", default=["iqr", "mad"], choices=["iqr", "mad"])
+    outliers.add_argument("--group-by", nargs="+", default=["template", "step"],
+                          help="Keys the repetitions are grouped on, e.g. template name id.")
+    outliers.add_argument("--tails", default="upper", choices=["upper", "both"])
+    outliers.set_defaults(func=cmd_outliers)
+
+    cactus = subparsers.add_parser("cactus", parents=[files_parser, plot_parser], help="Cactus plot over all files.")
+    cactus.add_argument("--value", default="exec_time", choices=["exec_time", "http_requests", "results"])
+    cactus.add_argument("--filter-timeouts", action="store_true")
+    cactus.add_argument("--log-y-axis", action="store_true")
+    cactus.set_defaults(func=cmd_cactus, output_dir=os.path.join("output", "execution_time_figures"))
+
+    cumulative = subparsers.add_parser("cumulative", parents=[files_parser, plot_parser],
+                                       help="Cumulative time and results per sequence.")
+    cumulative.set_defaults(func=cmd_cumulative, output_dir=os.path.join("output", "execution_time_figures"))
+
+    cache_state = subparsers.add_parser("cache-state", parents=[files_parser, plot_parser],
+                                        help="Hit rate and evictions per sequence step.")
+    cache_state.set_defaults(func=cmd_cache_state)
+
+    churn = subparsers.add_parser("churn", parents=[files_parser, plot_parser],
+                                  help="Cumulative evictions per sequence.")
+    churn.set_defaults(func=cmd_churn)
+
+    sessions = subparsers.add_parser("sessions", parents=[files_parser, sample_parser], help="Hit rates per session switch type.")
+    sessions.set_defaults(func=cmd_sessions)
+
+    eviction = subparsers.add_parser("eviction-impact", parents=[files_parser, plot_parser, sample_parser],
+                                     help="Impact of preceding evictions on the current query.")
+    eviction.add_argument("--dep-var", default="execution_time", choices=["hit_rate", "execution_time"])
+    eviction.add_argument("--num-bins", type=int, default=100)
+    eviction.add_argument("--size", choices=["s", "m", "l"], help="Only use files of this cache size.")
+    eviction.set_defaults(func=cmd_eviction_impact)
+
+    ingest = subparsers.add_parser("ingest", parents=[files_parser],
+                                   help="Load result files into the embedded SQL result store.")
+    ingest.add_argument("--force", action="store_true", help="Re-ingest files that did not change.")
+    ingest.set_defaults(func=cmd_ingest)
+
+    query = subparsers.add_parser("query", help="Aggregate a metric over every file in the result store.")
+    query.add_argument("--store", help="Path of the result store (default: output/results.sqlite).")
+    query.add_argument("--metric", default="time")
+    query.add_argument("--how", default="avg", help="avg, sum, min, max, count or geo_mean.")
+    query.add_argument("--by", nargs="*", default=["algorithm", "size"], help="Columns to group on.")
+    query.add_argument("--where", nargs="*", default=[], metavar="COLUMN=VALUE",
+                       help="Equality filters, e.g. size=m refinement=1.")
+    query.set_defaults(func=cmd_query)
+
+    cube = subparsers.add_parser("cube", parents=[files_parser],
+                                 help="Build (or reuse) the summary cube of all files and print a roll-up of it.")
+    cube.add_argument("--output", help="Path of the cube (default: output/summary_cube.npz).")
+    cube.add_argument("--timeout-ms", type=int, default=180000)
+    cube.add_argument("--by", nargs="*", default=["algorithm", "size"], help="Dimensions to group on.")
+    cube.add_argument("--where", nargs="*", default=[], metavar="DIMENSION=VALUE",
+                      help="Equality filters, e.g. size=m template=interactive-short-1.")
+    cube.add_argument("--force", action="store_true", help="Rebuild the cube even if its files did not change.")
+    cube.set_defaults(func=cmd_cube)
+
+    compare = subparsers.add_parser("compare", help="Detect performance regressions of a candidate run against a "
+                                                    "baseline run, exits with status 1 if any are found.")
+    compare.add_argument("baseline", help="Baseline result file, or directory of result files.")
+    compare.add_argument("candidate", help="Candidate result file, or directory of result files (paired by label).")
+    compare.add_argument("--filter-mode", default="all", choices=["all", "refinement_only", "no_refinement"])
+    compare.add_argument("--max-slowdown", type=float, default=1.10,
+                         help="Flag templates whose geometric-mean time ratio candidate/baseline is at least this.")
+    compare.add_argument("--max-error-rate-increase", type=float, default=0.01)
+    compare.add_argument("--max-hit-rate-drop", type=float, default=0.02)
+    compare.add_argument("--alpha", type=float, default=0.05)
+    compare.add_argument("--resamples", type=int, default=2000)
+    compare.add_argument("--timeout-ms", type=int, default=180000)
+    compare.add_argument("--seed", type=int, default=0)
+    compare.add_argument("--workers", type=int)
+    compare.add_argument("--json", help="Write the machine-readable verdict to this file.")
+    compare.add_argument("--all-templates", action="store_true", help="Print every template, not only regressions.")
+    compare.set_defaults(func=cmd_compare)
+
+    shard = subparsers.add_parser("shard", parents=[files_parser],
+                                  help="Split result files by sequence into shards, the per-sequence analyses then "
+                                       "process the shards in parallel.")
+    shard.add_argument("--shards", type=int, default=32, help="Maximum number of shards per file.")
+    shard.add_argument("--force", action="store_true", help="Re-split files that did not change.")
+    shard.set_defaults(func=cmd_shard)
+
+    pack = subparsers.add_parser("pack-topologies",
+                                 help="Pack topology directories into single indexed archives (<dir>.pack).")
+    pack.add_argument("paths", nargs="+", help="Topology directories, or sweep/run directories to search for "
+                                               "output-topology-tracking directories.")
+    pack.add_argument("--codec", choices=["zstd", "gzip", "none"],
+                      help="Member compression (default: zstd if installed, else gzip).")
+    pack.add_argument("--remove", action="store_true", help="Delete the packed topology files.")
+    pack.set_defaults(func=cmd_pack_topologies)
+
+    bootstrap = subparsers.add_parser("bootstrap", parents=[files_parser],
+                                      help="Bootstrap confidence intervals of mean/geo-mean times and speedups per template.")
+    bootstrap.add_argument("--baseline", help="Result file or label (e.g. default) to compute paired speedups against.")
+    bootstrap.add_argument("--resamples", type=int, default=10000)
+    bootstrap.add_argument("--confidence", type=float, default=0.95)
+    bootstrap.add_argument("--exclude-errors", action="store_true", help="Leave out executions with an error.")
+    bootstrap.add_argument("--seed", type=int, default=0)
+    bootstrap.add_argument("--workers", type=int, help="Number of processes to resample in.")
+    bootstrap.add_argument("--output", help="Write the intervals to this CSV file instead of printing them.")
+    bootstrap.set_defaults(func=cmd_bootstrap)
+
+    significance = subparsers.add_parser("significance", parents=[files_parser],
+                                         help="Rank tests of the execution times of all files per template.")
+    significance.add_argument("--alpha", type=float, default=0.05)
+    significance.add_argument("--correction", default="holm", choices=["bonferroni", "holm", "fdr_bh", "none"])
+    significance.add_argument("--exclude-errors", action="store_true", help="Leave out executions with an error.")
+    significance.add_argument("--workers", type=int,
+                              help="Number of processes to test in, reading the times from shared memory.")
+    significance.add_argument("--output", help="Write the pairwise tests to this CSV file instead of printing them.")
+    significance.set_defaults(func=cmd_significance)
+
+    sweep = subparsers.add_parser("sweep", help="Topology analysis of a hyperparameter sweep.")
+    sweep.add_argument("sweep_dir", help="Directory containing the run_* sweep directories.")
+    sweep.add_argument("--output-dir", default="output")
+    sweep.add_argument("--read-ahead", type=int, default=0,
+                       help="Decode this many topology files ahead on a thread pool, for cold or network storage.")
+    sweep.set_defaults(func=cmd_sweep)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.timing:
+        print(f"Startup time: {time.perf_counter() - _START_TIME:.3f}s")
+    if args.profile or args.profile_trace:
+        from src.profiling import enable_profiling
+        enable_profiling(trace_path=args.profile_trace)
+    if getattr(args, "store", None) and args.command not in ("query", "ingest"):
+        # Routes the load_raw_data accessors to the store, see load_raw_data.store_backend, ingest
+        # and query open the store themselves
+        os.environ["ANALYSIS_STORE"] = args.store
+    if getattr(args, "memory_budget", None):
+        # Bounded-memory mode of the load_raw_data accessors, see src/spill.py
+        os.environ["ANALYSIS_MEMORY_BUDGET"] = args.memory_budget
+    args.func(args)
+    if args.timing:
+        print(f"Total time: {time.perf_counter() - _START_TIME:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
 import os
-from functools import partial
 import matplotlib.pyplot as plt
 
 from src.load_raw_data import load_json, aggregate_on, average_aggregated_data, average_number, average_list_number, \
     geo_mean_number, geo_mean_list, exclude_non_refinement_pattern, exclude_refinement_pattern, get_geo_means, \
-    get_means, execution_time_deviation_from_mean, get_n_errors, get_geo_means_error_filter, has_error_on, get_n_results
+    get_means, execution_time_deviation_from_mean, get_n_errors, get_geo_means_error_filter, get_n_results
+from src.completion import completed_by_all_means
 from src.visualize_data import plot_algorithm_comparison_v2
 
 
@@ -33,35 +33,14 @@ def main_process_raw_data(locations):
     return file_to_time, file_to_errors, file_to_results
 
 
-def main_process_all_completed(locations):
-    aggregated_datas = {}
-    errors_in_experiments = []
-    for location in locations:
-        aggregated_datas[location] = aggregate_on(load_json(location), ["sequenceElement", "template"])
-        has_error = has_error_on(aggregated_datas[location])
-        errors_in_experiments.append(has_error)
-    merged_any_experiment_error = {}
-    for key in errors_in_experiments[0]:
-        merged_any_experiment_error[key] = [max(values) for values in zip(*(d[key] for d in errors_in_experiments))]
-
-    def exclusion_function_filter_errors(data_point, idx, any_experiment_error):
-        template = data_point['sequenceElement']['template']
-        if any_experiment_error[template][idx] == 1:
-            return True
-        return False
-
-    bound_exclusion = partial(exclusion_function_filter_errors, any_experiment_error=merged_any_experiment_error)
-    file_to_mean_execution_time = {}
-    file_to_errors = {}
-    for file, aggregated_data in aggregated_datas.items():
-        mean_time_no_error = average_aggregated_data(aggregated_data, "time", average_number, bound_exclusion)
-
-        file_to_mean_execution_time[file] = mean_time_no_error
-
-        sum_e, prop_e, sum_e_nr, prop_e_nr = get_n_errors(aggregated_data)
-        file_to_errors[file] = sum_e
-
-    return file_to_mean_execution_time, file_to_errors
+def main_process_all_completed(locations, criterion="no_error", timeout_ms=180000):
+    """
+    Mean execution time per file and template over the executions that completed in every file
+    (aligned by template and repetition index), and the failures per file and template. criterion
+    is "no_error", "no_timeout" (also excludes executions of at least timeout_ms) or a function,
+    see src/completion.py.
+    """
+    return completed_by_all_means(locations, criterion, timeout_ms)
 
 
 if __name__ == "__main__":
@@ -1,3 +1,4 @@
+import argparse
 import json
 import os
 from argparse import ArgumentError
@@ -6,25 +7,28 @@ from typing import Literal
 
 import matplotlib.pyplot as plt
 import numpy as np
-import glob
 import re
 
-from src.load_raw_data import get_cumulative_data_per_sequence, get_raw_metrics
+from src.curve_decimation import decimate_curve
+from src.figure_manifest import FigureManifest, figure_hash
+from src.load_raw_data import get_cumulative_data_per_sequence, get_raw_metrics, find_result_files, result_label
+from src.profiling import profiled, stage
 
 
+@profiled("plot_cumulative.plot_cactus")
 def plot_cactus(files, output_dir, plotted_value: Literal["exec_time", "http_requests", "results"],
                 y_label, title, filter_timeouts = False,
-                filter_mode="all", drop_always_errors=True, log_y_axis=True):
+                filter_mode="all", drop_always_errors=True, log_y_axis=True, dpi=300, force=False,
+                decimate="minmax"):
     """
     Generates a cactus plot of sorted query execution times.
+    The plot is only re-rendered if its inputs changed since the last run, unless force is set.
+    Curves are decimated to the pixel width of the figure ("minmax", "lttb" or None to plot every vertex).
     """
-    fig, ax = plt.subplots(figsize=(12, 8))
-
-    # Generate distinct colors for up to 20 algorithms
-    colors = plt.cm.tab20(np.linspace(0, 1, len(files)))
+    curves = {}
 
-    for idx, path in enumerate(sorted(files)):
-        label = os.path.basename(path).replace("query-results-raw-", "").replace(".json", "")
+    for path in sorted(files):
+        label = result_label(path)
 
         # Extract unaggregated metrics
         _, times, timeouts, http_requests, results = get_raw_metrics(
@@ -46,9 +50,26 @@ def plot_cactus(files, output_dir, plotted_value: Literal["exec_time", "http_req
             sorted_values = np.sort(results)
         else:
             raise ValueError(f"Invalid argument for plotted_value {plotted_value}")
-        plot_data = np.cumsum(sorted_values)
+        curves[label] = np.cumsum(sorted_values)
+
+    output_path = os.path.join(output_dir, f"cactus_plot_{filter_mode}_{plotted_value}.png")
+    manifest = FigureManifest(output_dir, force=force)
+    digest = figure_hash(curves, y_label=y_label, title=title, filter_mode=filter_mode,
+                         log_y_axis=log_y_axis, dpi=dpi, decimate=decimate)
+    if manifest.is_current(output_path, digest):
+        print(f"Cactus plot {output_path} is up to date.")
+        return
+
+    fig, ax = plt.subplots(figsize=(12, 8))
+
+    # Generate distinct colors for up to 20 algorithms
+    colors = plt.cm.tab20(np.linspace(0, 1, len(files)))
+
+    for idx, (label, plot_data) in enumerate(curves.items()):
         # X-axis represents the count of successfully solved queries
         x_axis = np.arange(1, len(plot_data) + 1)
+        if decimate:
+            x_axis, plot_data = decimate_curve(x_axis, plot_data, fig, dpi=dpi, method=decimate)
 
         ax.plot(x_axis, plot_data, label=label, color=colors[idx], linewidth=2, alpha=0.9)
     if log_y_axis:
@@ -63,16 +84,16 @@ def plot_cactus(files, output_dir, plotted_value: Literal["exec_time", "http_req
 
     fig.tight_layout()
 
-    # Format output filename
-    output_path = os.path.join(output_dir, f"cactus_plot_{filter_mode}_{plotted_value}.png")
-    fig.savefig(output_path, dpi=300)
+    with stage("savefig"):
+        fig.savefig(output_path, dpi=dpi)
     plt.close(fig)
+    manifest.record(output_path, digest)
     print(f"Cactus plot saved to {output_path}")
 
-def main(output_dir, files=None):
+@profiled("plot_cumulative.main")
+def main(output_dir, files=None, dpi=300, force=False, decimate="minmax"):
     if not files:
-        pattern = os.path.join("data", "query-results-raw-*.json")
-        files = glob.glob(pattern)
+        files = find_result_files("data")
 
     if not files:
         print("No data files found.")
@@ -83,7 +104,7 @@ def main(output_dir, files=None):
 
     # 1. Parse files and group data by sequence
     for path in sorted(files):
-        label = os.path.basename(path).replace("query-results-raw-", "").replace(".json", "")
+        label = result_label(path)
         print(f"Processing {label}...")
 
         results_per_sequence = get_cumulative_data_per_sequence(
@@ -99,8 +120,17 @@ def main(output_dir, files=None):
                 'results': seq_data['cumulative_results']
             }
 
+    manifest = FigureManifest(output_dir, force=force)
+
     # 2. Generate a dual-axis plot for each sequence
     for seq_name, algorithms in sequence_data.items():
+        safe_seq_name = str(seq_name).replace(" ", "_").lower()
+        output_path = os.path.join(output_dir, f"cumulative_plot_{safe_seq_name}.png")
+        digest = figure_hash(algorithms, seq_name=seq_name, dpi=dpi, decimate=decimate)
+        if manifest.is_current(output_path, digest):
+            print(f"Plot {output_path} is up to date.")
+            continue
+
         fig, ax1 = plt.subplots(figsize=(10, 6))
         ax2 = ax1.twinx()  # Instantiate a second axes that shares the same x-axis
 
@@ -108,13 +138,19 @@ def main(output_dir, files=None):
         labels = []
 
         for label, data in algorithms.items():
+            x_times, times = np.arange(len(data['times'])), data['times'] / 1000
+            x_results, results = np.arange(len(data['results'])), data['results']
+            if decimate:
+                x_times, times = decimate_curve(x_times, times, fig, dpi=dpi, method=decimate)
+                x_results, results = decimate_curve(x_results, results, fig, dpi=dpi, method=decimate)
+
             # Plot cumulative time on primary y-axis (left)
-            line1 = ax1.plot(data['times'] / 1000, label=f"{label} (Time)", linewidth=1.5, alpha=0.8)
+            line1 = ax1.plot(x_times, times, label=f"{label} (Time)", linewidth=1.5, alpha=0.8)
             lines.extend(line1)
             labels.append(f"{label} (Time)")
 
             # Plot cumulative results on secondary y-axis (right)
-            line2 = ax2.plot(data['results'], label=f"{label} (Results)", linewidth=1.5, linestyle='--', alpha=0.6)
+            line2 = ax2.plot(x_results, results, label=f"{label} (Results)", linewidth=1.5, linestyle='--', alpha=0.6)
             lines.extend(line2)
             labels.append(f"{label} (Results)")
 
@@ -130,16 +166,18 @@ def main(output_dir, files=None):
         ax1.grid(True, which="both", ls="-", alpha=0.2)
         fig.tight_layout()
 
-        # Format output filename
-        safe_seq_name = str(seq_name).replace(" ", "_").lower()
-        output_path = os.path.join(output_dir, f"cumulative_plot_{safe_seq_name}.png")
-
         # Use bbox_inches='tight' to prevent the external legend from being cropped
-        fig.savefig(output_path, dpi=300, bbox_inches='tight')
+        with stage("savefig"):
+            fig.savefig(output_path, dpi=dpi, bbox_inches='tight')
         plt.close(fig)
+        manifest.record(output_path, digest)
         print(f"Plot saved to {output_path}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate cactus and cumulative execution time figures.")
+    parser.add_argument("--force", action="store_true", help="Re-render figures even if their inputs did not change.")
+    args = parser.parse_args()
+
     raw_data_default_n_b = os.path.join("data", "query-results-raw-default-n-b.json")
     raw_data_default = os.path.join("data", "query-results-raw-default.json")
 
@@ -199,8 +237,9 @@ if __name__ == "__main__":
                 filter_mode=filter_mode,
                 output_dir="output/execution_time_figures",
                 drop_always_errors=False,
-                log_y_axis=False)
-    main("output")
+                log_y_axis=False,
+                force=args.force)
+    main("output", force=args.force)
     # plot_cactus(all_locations_cache,
     #             plotted_value="exec_time",
     #             y_label="Execution Time (s, log scale)",
@@ -1,88 +1,212 @@
+"""
+Stages the query-results-raw.json files of data/random_new/<algorithm>/combination_<i> as
+data/random_new/query-results-raw-<algorithm>-<s|m|l>.json and restores data/random from data_bak/random.
+
+Files are content-addressed: every source is hashed, and files whose hash did not change since the
+last run are skipped. Files are hardlinked (or reflinked) instead of copied where the filesystem
+allows it, in parallel. Every staged directory gets a staging_manifest.json with the algorithm,
+size suffix, combination index and hash of each file.
+
+Run from the repository root:
+    python -m scratch.process_random_new [--base-dir DIR] [--copy] [--workers N]
+"""
+import argparse
 import os
 import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-def main():
-    base_dir = Path("/home/ruben-eschauzier/projects/process-caching-journal")
-    random_new_dir = base_dir / "data" / "random_new"
-    random_dir = base_dir / "data" / "random"
-    random_bak_dir = base_dir / "data_bak" / "random"
-    
-    # 1. Restore original data/random files from data_bak/random
-    print(f"Restoring original files in {random_dir} from {random_bak_dir}...")
-    if random_bak_dir.exists():
-        # Clear current files in random_dir
-        for f in random_dir.glob("query-results-raw-*.json"):
-            try:
+from src.staging_manifest import file_digest, load_manifest, write_manifest
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, reflinks are skipped
+    fcntl = None
+
+BASE_DIR = Path("/home/ruben-eschauzier/projects/process-caching-journal")
+# Map 0 -> s, 1 -> m, 2 -> l
+SIZE_MAP = {0: "s", 1: "m", 2: "l"}
+FICLONE = 0x40049409  # Linux ioctl to reflink (copy-on-write clone) a file
+
+
+def link_or_copy(src, dest, allow_link=True, allow_hardlink=True):
+    """
+    Places src at dest as a hardlink, falling back to a reflink and then to a full copy.
+    The file is created under a temporary name and moved into place, so dest is never half-written.
+    Returns the method used.
+    """
+    tmp_dest = dest.with_name(dest.name + ".tmp")
+    tmp_dest.unlink(missing_ok=True)
+    method = "copy"
+    if allow_link and allow_hardlink:
+        try:
+            os.link(src, tmp_dest)
+            method = "hardlink"
+        except OSError:
+            pass
+    if allow_link and method == "copy" and fcntl is not None:
+        try:
+            with open(src, 'rb') as fs, open(tmp_dest, 'wb') as fd:
+                fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+            shutil.copystat(src, tmp_dest)
+            method = "reflink"
+        except OSError:
+            tmp_dest.unlink(missing_ok=True)
+    if method == "copy":
+        shutil.copy2(src, tmp_dest)
+    os.replace(tmp_dest, dest)
+    return method
+
+
+def cached_digest(path, previous):
+    """Hash of path, reusing the hash of a previous manifest entry if size and mtime did not change."""
+    st = path.stat()
+    if previous and previous.get("source_bytes") == st.st_size and previous.get("source_mtime_ns") == st.st_mtime_ns:
+        return previous["hash"]
+    return file_digest(path)
+
+
+def stage_file(task, previous, allow_link, allow_hardlink):
+    """Stages one (src, dest, metadata) task, returns (dest name, manifest entry, action)."""
+    src, dest, metadata = task
+    digest = cached_digest(src, previous)
+    src_st = src.stat()
+
+    action = "unchanged"
+    if not (previous and previous["hash"] == digest and dest.exists()
+            and previous.get("bytes") == dest.stat().st_size and previous.get("mtime_ns") == dest.stat().st_mtime_ns):
+        action = link_or_copy(src, dest, allow_link, allow_hardlink)
+    dest_st = dest.stat()
+    entry = {
+        **metadata,
+        "source": str(src),
+        "hash": digest,
+        "source_bytes": src_st.st_size,
+        "source_mtime_ns": src_st.st_mtime_ns,
+        "bytes": dest_st.st_size,
+        "mtime_ns": dest_st.st_mtime_ns,
+        "method": previous["method"] if action == "unchanged" and previous else action,
+    }
+    return dest.name, entry, action
+
+
+def stage(tasks, dest_dir, workers=8, allow_link=True, allow_hardlink=True, remove_stale_pattern=None):
+    """
+    Stages (src, dest, metadata) tasks into dest_dir in parallel and writes its manifest.
+    Files matching remove_stale_pattern that are not staged are removed.
+    """
+    previous = load_manifest(dest_dir)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(
+            lambda task: stage_file(task, previous.get(task[1].name), allow_link, allow_hardlink), tasks
+        ))
+
+    entries = {name: entry for name, entry, _ in results}
+    for name, entry, action in results:
+        if action != "unchanged":
+            print(f"Staged {entry['source']} -> {dest_dir / name} ({action})")
+
+    if remove_stale_pattern:
+        for f in dest_dir.glob(remove_stale_pattern):
+            if f.name not in entries:
+                print(f"Removing stale {f}")
                 f.unlink()
-            except Exception as e:
-                print(f"Error removing {f}: {e}")
-        # Copy from backup
-        for f in random_bak_dir.glob("query-results-raw-*.json"):
-            shutil.copy2(f, random_dir / f.name)
-        print("Restoration complete.")
-    else:
-        print("Warning: Backup directory data_bak/random not found. Skipping restoration.")
-        
-    # Ensure destination directory random_new exists
-    random_new_dir.mkdir(parents=True, exist_ok=True)
-    
-    print(f"Scanning directories in {random_new_dir}...")
-    
-    # Iterate through all subdirectories in random_new
-    for algo_path in random_new_dir.iterdir():
+
+    # Keep entries of files staged by other runs that are still present
+    for name, entry in previous.items():
+        if name not in entries and (dest_dir / name).exists() and not remove_stale_pattern:
+            entries[name] = entry
+    write_manifest(dest_dir, entries)
+
+    n_unchanged = sum(1 for _, _, action in results if action == "unchanged")
+    print(f"{dest_dir}: {len(results) - n_unchanged} staged, {n_unchanged} unchanged")
+    return entries
+
+
+def combination_tasks(random_new_dir):
+    """Finds the query-results-raw.json of every combination and determines its destination name."""
+    tasks = []
+    for algo_path in sorted(random_new_dir.iterdir()):
         if not algo_path.is_dir():
             continue
-        
+
         algo_name = algo_path.name
-        print(f"Processing algorithm: {algo_name}")
-        
+
         # Look for combination directories
-        for combo_path in algo_path.iterdir():
+        for combo_path in sorted(algo_path.iterdir()):
             if not combo_path.is_dir():
                 continue
-            
+
             # Check if name is like combination_* or combinations_*
             combo_name = combo_path.name
             if not (combo_name.startswith("combination_") or combo_name.startswith("combinations_")):
                 continue
-            
+
             # Extract the index number
             try:
                 combo_idx = int(combo_name.split("_")[-1])
             except ValueError:
                 print(f"Skipping directory with invalid format: {combo_path}")
                 continue
-            
+
             # Locate query-results-raw.json
             raw_json_path = combo_path / "query-results-raw.json"
             if not raw_json_path.exists():
                 print(f"Warning: {raw_json_path} does not exist.")
                 continue
-            
+
             # Determine destination filename
             if algo_name == "default":
-                if combo_idx == 0:
-                    dest_name = "query-results-raw-default.json"
-                else:
+                if combo_idx != 0:
                     print(f"Warning: Found default with unexpected combination index {combo_idx}")
                     continue
+                size_suffix = None
+                dest_name = "query-results-raw-default.json"
             else:
-                # Map 0 -> s, 1 -> m, 2 -> l
-                size_map = {0: "s", 1: "m", 2: "l"}
-                if combo_idx in size_map:
-                    size_suffix = size_map[combo_idx]
-                else:
+                if combo_idx not in SIZE_MAP:
                     print(f"Warning: Unexpected combination index {combo_idx} for {algo_name}")
                     continue
-                
+                size_suffix = SIZE_MAP[combo_idx]
                 dest_name = f"query-results-raw-{algo_name}-{size_suffix}.json"
-            
-            dest_path = random_new_dir / dest_name
-            print(f"Copying {raw_json_path.relative_to(base_dir)} to {dest_path.relative_to(base_dir)}")
-            shutil.copy2(raw_json_path, dest_path)
-            
-    print("Processing complete!")
+
+            metadata = {"algorithm": algo_name, "size": size_suffix, "combination": combo_idx}
+            tasks.append((raw_json_path, random_new_dir / dest_name, metadata))
+    return tasks
+
+
+def main(base_dir=BASE_DIR, workers=8, allow_link=True):
+    start = time.perf_counter()
+    random_new_dir = base_dir / "data" / "random_new"
+    random_dir = base_dir / "data" / "random"
+    random_bak_dir = base_dir / "data_bak" / "random"
+
+    # 1. Restore original data/random files from data_bak/random
+    print(f"Restoring original files in {random_dir} from {random_bak_dir}...")
+    if random_bak_dir.exists():
+        random_dir.mkdir(parents=True, exist_ok=True)
+        tasks = [(f, random_dir / f.name, {"restored_from": str(random_bak_dir)})
+                 for f in sorted(random_bak_dir.glob("query-results-raw-*.json"))]
+        # Never hardlink the backup: a tool writing into data/random in place would modify it too
+        stage(tasks, random_dir, workers, allow_link, allow_hardlink=False,
+              remove_stale_pattern="query-results-raw-*.json")
+        print("Restoration complete.")
+    else:
+        print("Warning: Backup directory data_bak/random not found. Skipping restoration.")
+
+    # Ensure destination directory random_new exists
+    random_new_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"Scanning directories in {random_new_dir}...")
+    stage(combination_tasks(random_new_dir), random_new_dir, workers, allow_link)
+
+    print(f"Processing complete! ({time.perf_counter() - start:.2f}s)")
+
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Stage jbr combination results as query-results-raw-* files.")
+    parser.add_argument("--base-dir", type=Path, default=BASE_DIR)
+    parser.add_argument("--workers", type=int, default=8, help="Number of files hashed/copied in parallel.")
+    parser.add_argument("--copy", action="store_true", help="Always copy instead of hardlinking/reflinking.")
+    args = parser.parse_args()
+    main(args.base_dir, workers=args.workers, allow_link=not args.copy)
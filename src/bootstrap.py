@@ -0,0 +1,229 @@
+"""
+Bootstrap confidence intervals for the mean and geometric-mean execution time per template, and for
+the speedup of a configuration over a baseline, per (algorithm, template, filter_mode).
+
+Every group draws one (n_resamples x n) matrix of resample indices, turns it into per-resample
+occurrence counts with a single bincount, and gets the sums behind all its statistics (means, log-space
+geometric means, paired speedups) from one matrix product, instead of resampling in a Python loop. Large n_resamples are
+split into chunks (bounding the size of the index matrix) that can run in a process pool; every
+chunk has its own seed derived from the group, so the intervals do not depend on the number of workers.
+
+Speedups are paired: the i-th execution of a template in a file is compared with the i-th execution
+of that template in the baseline file, like main_process_all_completed aligns executions.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    from src.data_analysis import parse_algorithm_label
+    from src.load_raw_data import find_always_error_templates, load_json, result_label
+    from src.profiling import profiled, stage
+    from src.result_cache import memoize
+except ModuleNotFoundError:
+    from data_analysis import parse_algorithm_label
+    from load_raw_data import find_always_error_templates, load_json, result_label
+    from profiling import profiled, stage
+    from result_cache import memoize
+
+FILTER_MODES = ("all", "refinement_only", "no_refinement")
+# Maximum number of elements of one resample index matrix, larger n_resamples are chunked
+MAX_CHUNK_ELEMENTS = 1 << 22
+
+
+@memoize
+def template_times(location, drop_always_errors=False, timeout_ms=180000):
+    """
+    Returns {template: (times, has_error, refinement)} with one array element per execution of the
+    template, in file order. Templates failing in all executions are left out if drop_always_errors is set.
+    """
+    data = load_json(location)
+    always_error_templates = find_always_error_templates(data, timeout_ms) if drop_always_errors else frozenset()
+    columns = {}
+    for entry in data:
+        seq_element = entry.get('sequenceElement', {})
+        template = seq_element.get('template')
+        if template is None or template in always_error_templates:
+            continue
+        times, errors, refinement = columns.setdefault(template, ([], [], []))
+        times.append(entry.get('time', 0))
+        errors.append('error' in entry)
+        refinement.append(len(seq_element.get('refinementMetadata', {}).values()) > 0)
+    return {
+        template: (np.array(times, dtype=np.float64), np.array(errors, dtype=bool), np.array(refinement, dtype=bool))
+        for template, (times, errors, refinement) in columns.items()
+    }
+
+
+def filter_mask(has_error, refinement, filter_mode="all", exclude_errors=False):
+    """Selects the executions kept by filter_mode ("all", "refinement_only" or "no_refinement")."""
+    if filter_mode == "refinement_only":
+        mask = refinement.copy()
+    elif filter_mode == "no_refinement":
+        mask = ~refinement
+    else:
+        mask = np.ones(len(refinement), dtype=bool)
+    if exclude_errors:
+        mask &= ~has_error
+    return mask
+
+
+def group_columns(times, baseline_times=None):
+    """
+    The (k x n) matrix of per-execution values whose sums give the statistics of a group: times,
+    log times and which times are positive (non-positive times are left out of the geometric means),
+    and with a baseline its times, the log ratios baseline/time and which pairs are positive.
+    """
+    positive = times > 0
+    log_times = np.log(np.where(positive, times, 1.0))
+    columns = [times, log_times, positive]
+    if baseline_times is not None:
+        pair_positive = positive & (baseline_times > 0)
+        log_ratios = np.where(pair_positive, np.log(np.where(pair_positive, baseline_times, 1.0)) - log_times, 0.0)
+        columns += [baseline_times, log_ratios, pair_positive]
+    return np.vstack(columns).astype(np.float64)
+
+
+def statistics_from_sums(sums, n):
+    """Maps the column sums of group_columns (of one sample, or of every resample) to the statistics."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        statistics = {
+            "mean": sums[0] / n,
+            "geo_mean": np.exp(sums[1] / sums[2]),
+        }
+        if len(sums) > 3:
+            statistics["speedup"] = sums[3] / sums[0]
+            statistics["geo_speedup"] = np.exp(sums[4] / sums[5])
+    return statistics
+
+
+def resample_counts(rng, n, n_resamples):
+    """
+    Draws an (n_resamples x n) resample index matrix and returns how often every execution occurs in
+    every resample, so the sums of a resample are a dot product instead of a gather of n values per column.
+    """
+    idx = rng.integers(0, n, size=(n_resamples, n))
+    idx += np.arange(n_resamples)[:, None] * n
+    return np.bincount(idx.ravel(), minlength=n_resamples * n).reshape(n_resamples, n)
+
+
+def _bootstrap_chunk(task):
+    """Computes the statistics of n_resamples resamples of one group, returns {statistic: array}."""
+    columns, n_resamples, seed = task
+    n = columns.shape[1]
+    counts = resample_counts(np.random.default_rng(seed), n, n_resamples)
+    return statistics_from_sums((counts @ columns.T).T, n)
+
+
+def chunk_tasks(columns, n_resamples, seed_sequence):
+    """Splits the resamples of a group into tasks of at most MAX_CHUNK_ELEMENTS indices."""
+    chunk = max(1, min(n_resamples, MAX_CHUNK_ELEMENTS // max(columns.shape[1], 1)))
+    sizes = [min(chunk, n_resamples - start) for start in range(0, n_resamples, chunk)]
+    return [(columns, size, seed) for size, seed in zip(sizes, seed_sequence.spawn(len(sizes)))]
+
+
+def run_tasks(tasks, workers=None):
+    """Runs _bootstrap_chunk over tasks, in a process pool unless workers is None or 1."""
+    if workers is None or workers == 1 or len(tasks) <= 1:
+        return [_bootstrap_chunk(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_bootstrap_chunk, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+
+
+def percentile_interval(resamples, confidence=0.95):
+    """Percentile bootstrap interval of the finite resampled statistics, (nan, nan) if there are none."""
+    resamples = resamples[np.isfinite(resamples)]
+    if len(resamples) == 0:
+        return np.nan, np.nan
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(resamples, [alpha, 1 - alpha])
+    return low, high
+
+
+@profiled()
+def bootstrap_confidence_intervals(locations, baseline=None, filter_modes=FILTER_MODES, n_resamples=10000,
+                                   confidence=0.95, exclude_errors=False, drop_always_errors=False,
+                                   timeout_ms=180000, seed=0, workers=None):
+    """
+    Bootstrap confidence intervals of the mean and geometric-mean execution time (in ms) of every
+    template, per file and filter mode. If baseline is a result file, the paired speedup of every file
+    over it (ratio of means and geometric mean of per-execution ratios, > 1 is faster) is added.
+
+    Parameters:
+        locations: Result files.
+        baseline: Result file the speedups are relative to, or None.
+        filter_modes: Filter modes to compute the intervals for.
+        n_resamples: Number of bootstrap resamples per group.
+        confidence: Confidence level of the percentile intervals.
+        exclude_errors: Leave out executions with an error.
+        drop_always_errors: Leave out templates that fail (or time out) in all executions of a file.
+        seed: Seed of the resamples, the intervals are reproducible for a given seed.
+        workers: Number of processes the resample chunks are computed in (None: in this process).
+
+    Returns a DataFrame with one row per (file, filter mode, template): label, algorithm, size,
+    template, filter_mode, n (and n_paired with a baseline), and <statistic>, <statistic>_low,
+    <statistic>_high for every statistic.
+    """
+    baseline_columns = template_times(baseline, drop_always_errors, timeout_ms) if baseline is not None else None
+    groups, tasks = [], []
+    root_seed = np.random.SeedSequence(seed)
+
+    def add_tasks(columns, spawn_key):
+        # The seed of a group only depends on its position, not on the other groups
+        group_tasks = chunk_tasks(columns, n_resamples, np.random.SeedSequence(root_seed.entropy, spawn_key=spawn_key))
+        tasks.extend(group_tasks)
+        return columns, (len(tasks) - len(group_tasks), len(tasks))
+
+    with stage("bootstrap_groups"):
+        for file_index, location in enumerate(locations):
+            algorithm, size = parse_algorithm_label(location)
+            file_columns = template_times(location, drop_always_errors, timeout_ms)
+            for mode_index, filter_mode in enumerate(filter_modes):
+                for template_index, (template, (times, has_error, refinement)) in enumerate(file_columns.items()):
+                    mask = filter_mask(has_error, refinement, filter_mode, exclude_errors)
+                    group_times = times[mask]
+                    if len(group_times) == 0:
+                        continue
+                    key = (file_index, mode_index, template_index)
+                    group = {
+                        "label": result_label(location), "algorithm": algorithm, "size": size,
+                        "template": template, "filter_mode": filter_mode, "n": len(group_times),
+                        "_parts": [(("mean", "geo_mean"), *add_tasks(group_columns(group_times), key))],
+                    }
+                    if baseline_columns is not None:
+                        # The speedups pair the executions both files kept, templates the baseline
+                        # did not run keep their mean and geo_mean with NaN speedups
+                        group["n_paired"] = 0
+                        if template in baseline_columns:
+                            b_times, b_has_error, b_refinement = baseline_columns[template]
+                            n = min(len(times), len(b_times))
+                            paired = mask[:n] & filter_mask(b_has_error[:n], b_refinement[:n], filter_mode,
+                                                            exclude_errors)
+                            if paired.any():
+                                group["n_paired"] = int(paired.sum())
+                                columns = group_columns(times[:n][paired], b_times[:n][paired])
+                                group["_parts"].append((("speedup", "geo_speedup"), *add_tasks(columns, key + (1,))))
+                    groups.append(group)
+
+    with stage("bootstrap_resample", entries=sum(task[0].shape[1] * task[1] for task in tasks)):
+        results = run_tasks(tasks, workers)
+
+    rows = []
+    with stage("bootstrap_intervals", entries=len(groups)):
+        for group in groups:
+            parts = {names: part for names, *part in group.pop("_parts")}
+            for names in (("mean", "geo_mean"), ("speedup", "geo_speedup")):
+                if names not in parts:
+                    if baseline_columns is not None:
+                        for name in names:
+                            group[name] = group[f"{name}_low"] = group[f"{name}_high"] = np.nan
+                    continue
+                columns, (start, end) = parts[names]
+                estimates = statistics_from_sums(columns.sum(axis=1), columns.shape[1])
+                for name in names:
+                    resamples = np.concatenate([results[i][name] for i in range(start, end)])
+                    group[name] = float(estimates[name])
+                    group[f"{name}_low"], group[f"{name}_high"] = percentile_interval(resamples, confidence)
+            rows.append(group)
+    return pd.DataFrame(rows)
@@ -0,0 +1,114 @@
+"""
+Completed-by-all masks: the executions every configuration (result file) completed.
+
+Executions are aligned by template and repetition index (the i-th execution of a template in one
+file is the i-th execution of it in every other file). The executions of all templates are laid out
+as slots, template after template, and stacked into a (configuration x slot) matrix of failures,
+padded as failed where a file has fewer repetitions of a template. An execution is completed by all
+if no configuration failed it (OR over the configurations), and the masked means and failure counts
+of every file and template follow from one reduceat over the slots.
+
+A failure is an execution with an error ("no_error"), also one that took at least timeout_ms
+("no_timeout"), or whatever a callable criterion(times, has_error) -> failed mask returns.
+"""
+import numpy as np
+
+try:
+    from src.bootstrap import filter_mask, template_times
+    from src.profiling import profiled
+except ModuleNotFoundError:
+    from bootstrap import filter_mask, template_times
+    from profiling import profiled
+
+CRITERIA = ("no_error", "no_timeout")
+
+
+def failed_executions(times, has_error, criterion="no_error", timeout_ms=180000):
+    """Boolean mask of the executions that failed under criterion (see the module docstring)."""
+    if callable(criterion):
+        return np.asarray(criterion(times, has_error), dtype=bool)
+    if criterion == "no_error":
+        return has_error.copy()
+    if criterion == "no_timeout":
+        return has_error | (times >= timeout_ms)
+    raise ValueError(f"Invalid criterion {criterion}, choose one of {', '.join(CRITERIA)} or pass a function")
+
+
+class CompletionMatrix:
+    """
+    Aligned executions of several result files.
+
+    Attributes:
+        locations: The result files, the rows.
+        templates: The templates in sorted order, template i has the slots offsets[i]:offsets[i + 1].
+        times, failed, selected: (file x slot) arrays of the execution times, failures (padding
+            counts as failed) and executions kept by the filter mode (padding is not kept).
+        present: (file x template) mask of the templates a file ran.
+    """
+
+    def __init__(self, locations, criterion="no_error", timeout_ms=180000, filter_mode="all"):
+        self.locations = list(locations)
+        per_file = [template_times(location, False, timeout_ms) for location in self.locations]
+        self.templates = sorted({template for file_columns in per_file for template in file_columns})
+        repetitions = np.array([max((len(file_columns[template][0]) for file_columns in per_file
+                                     if template in file_columns), default=0) for template in self.templates],
+                               dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(repetitions)])
+
+        shape = (len(self.locations), int(self.offsets[-1]))
+        self.times = np.zeros(shape)
+        self.failed = np.ones(shape, dtype=bool)
+        self.selected = np.zeros(shape, dtype=bool)
+        self.present = np.zeros((len(self.locations), len(self.templates)), dtype=bool)
+        for row, file_columns in enumerate(per_file):
+            for i, template in enumerate(self.templates):
+                if template not in file_columns:
+                    continue
+                times, has_error, refinement = file_columns[template]
+                slots = slice(self.offsets[i], self.offsets[i] + len(times))
+                self.times[row, slots] = times
+                self.failed[row, slots] = failed_executions(times, has_error, criterion, timeout_ms)
+                self.selected[row, slots] = filter_mask(has_error, refinement, filter_mode)
+                self.present[row, i] = True
+
+    def completed_by_all(self):
+        """Mask over the slots of the executions no configuration failed."""
+        return ~self.failed.any(axis=0)
+
+    def per_template(self, values):
+        """Sums of a (file x slot) array per template, a (file x template) array."""
+        if values.shape[1] == 0:
+            return np.zeros((values.shape[0], len(self.templates)))
+        return np.add.reduceat(values, self.offsets[:-1], axis=1)
+
+    def masked_means(self):
+        """(file x template) mean times of the selected executions completed by all, NaN where there are none."""
+        mask = self.selected & self.completed_by_all()
+        counts = self.per_template(mask.astype(np.float64))
+        sums = self.per_template(np.where(mask, self.times, 0.0))
+        return np.divide(sums, counts, out=np.full(counts.shape, np.nan), where=counts > 0)
+
+    def failures(self):
+        """(file x template) number of failed executions of every file (padding not counted)."""
+        return self.per_template((self.failed & self.selected).astype(np.float64)).astype(np.int64)
+
+    def to_nested(self, values, missing=-1):
+        """{location: {template: value}} of a (file x template) array over the templates each file ran."""
+        return {
+            location: {template: missing if np.isnan(value) else value
+                       for template, value, present in zip(self.templates, row, present_row) if present}
+            for location, row, present_row in zip(self.locations, values.astype(np.float64), self.present)
+        }
+
+
+@profiled()
+def completed_by_all_means(locations, criterion="no_error", timeout_ms=180000, filter_mode="all"):
+    """
+    Mean execution time per file and template over the executions every file completed, and the
+    number of failed executions per file and template. Templates without such executions get -1,
+    like average_number. Returns ({location: {template: mean}}, {location: {template: failures}}).
+    """
+    matrix = CompletionMatrix(locations, criterion, timeout_ms, filter_mode)
+    failures = {location: {template: int(value) for template, value in counts.items()}
+                for location, counts in matrix.to_nested(matrix.failures()).items()}
+    return matrix.to_nested(matrix.masked_means()), failures
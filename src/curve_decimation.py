@@ -0,0 +1,86 @@
+import numpy as np
+
+
+def pixel_buckets(fig, dpi=None):
+    """Returns the number of horizontal pixels of a figure when saved at dpi (defaults to the figure dpi)."""
+    return max(int(np.ceil(fig.get_figwidth() * (dpi or fig.dpi))), 1)
+
+
+def min_max_decimate(x, y, n_buckets):
+    """
+    Reduces a line to at most 4 vertices per x-bucket: the first, last, minimum and maximum point.
+    With one bucket per horizontal pixel the rendered line is identical to the full line, as every
+    pixel column still spans the same vertical range and connects to the same neighbours.
+
+    Parameters:
+    x (np.ndarray): Monotonically increasing x coordinates.
+    y (np.ndarray): y coordinates.
+    n_buckets (int): Number of buckets along the x-axis, usually the figure width in pixels.
+
+    Returns:
+    The decimated (x, y) arrays, in the original order.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n = len(x)
+    if n <= 4 * n_buckets:
+        return x, y
+
+    edges = np.linspace(x[0], x[-1], n_buckets + 1)
+    starts = np.unique(np.searchsorted(x, edges[:-1], side='left'))
+    ends = np.append(starts[1:], n) - 1
+
+    # Sort by (bucket, y) once to find the argmin/argmax of every bucket without a Python loop
+    bucket_ids = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+    order = np.lexsort((y, bucket_ids))
+    argmins = order[starts]
+    argmaxs = order[ends]
+
+    keep = np.unique(np.concatenate([starts, ends, argmins, argmaxs]))
+    return x[keep], y[keep]
+
+
+def lttb_decimate(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling to n_out vertices. Keeps the perceived shape of the
+    line but, unlike min_max_decimate, does not guarantee that every extreme is preserved.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    bucket_edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=int)
+    keep[0] = 0
+    keep[-1] = n - 1
+
+    prev = 0
+    for i in range(n_out - 2):
+        start, end = bucket_edges[i], bucket_edges[i + 1]
+        next_start, next_end = end, bucket_edges[i + 2] if i + 2 < len(bucket_edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # Pick the point forming the largest triangle with the previous vertex and the next bucket average
+        area = np.abs((x[prev] - avg_x) * (y[start:end] - y[prev]) - (x[prev] - x[start:end]) * (avg_y - y[prev]))
+        prev = start + int(np.argmax(area))
+        keep[i + 1] = prev
+
+    return x[keep], y[keep]
+
+
+def decimate_curve(x, y, fig, dpi=None, method="minmax"):
+    """
+    Decimates a line to a vertex count derived from the figure width and dpi.
+
+    Parameters:
+    method (str): "minmax" (exact, default) or "lttb" (one vertex per pixel, approximate).
+    """
+    n_buckets = pixel_buckets(fig, dpi)
+    if method == "minmax":
+        return min_max_decimate(x, y, n_buckets)
+    if method == "lttb":
+        return lttb_decimate(x, y, n_buckets)
+    raise ValueError(f"Unknown decimation method {method}")
@@ -1,35 +1,50 @@
 import os
 
+try:
+    from src.json_backend import strip_json_suffix
+except ModuleNotFoundError:
+    from json_backend import strip_json_suffix
+
+ALGORITHM_NAMES = {
+    'cache': 'unindexed-cache',
+    'query-cache': 'indexed-cache',
+    'query-cache-estimate': 'indexed-cache-estimation',
+    'unindexed': 'unindexed-cache',
+    'index': 'indexed-cache',
+    'index-e': 'indexed-cache-estimation',
+    'index-e-o': 'indexed-cache-estimation-offline-traversal',
+    'store': 'indexed-store',
+    'store-e': 'indexed-store-estimation',
+    'store-e-o': 'indexed-store-estimation-offline-traversal',
+}
+
+
+def parse_algorithm_label(location):
+    """
+    Parses the algorithm and cache size from a result filename, e.g. query-results-raw-index-e-m.json
+    (or .json.gz/.json.zst) gives ("indexed-cache-estimation", "m"). Files without a size suffix give (clean name, None).
+    """
+    filename = strip_json_suffix(os.path.basename(location))
+    clean_name = filename.replace('query-results-raw-', '')
+
+    # Extract size suffix and base algorithm name
+    if clean_name[-2:].lower() in ['-s', '-m', '-l']:
+        size = clean_name[-1].lower()
+        base_type = clean_name[:-2]
+    else:
+        return clean_name, None
+
+    return ALGORITHM_NAMES.get(base_type, base_type), size
+
 
 def get_algorithm_labels(locations):
     """
     Takes a list of file paths and returns a list of formatted algorithm labels.
     """
     def map_single(location_string):
-        filename = os.path.basename(location_string).replace('.json', '')
-        clean_name = filename.replace('query-results-raw-', '')
-
-        # Extract size suffix and base algorithm name
-        if clean_name[-2:].lower() in ['-s', '-m', '-l']:
-            size = clean_name[-1].lower()
-            base_type = clean_name[:-2]
-        else:
-            return clean_name  # Fallback if no valid size suffix exists
-
-        mapping = {
-            'cache': 'unindexed-cache',
-            'query-cache': 'indexed-cache',
-            'query-cache-estimate': 'indexed-cache-estimation',
-            'unindexed': 'unindexed-cache',
-            'index': 'indexed-cache',
-            'index-e': 'indexed-cache-estimation',
-            'index-e-o': 'indexed-cache-estimation-offline-traversal',
-            'store': 'indexed-store',
-            'store-e': 'indexed-store-estimation',
-            'store-e-o': 'indexed-store-estimation-offline-traversal',
-        }
-
-        mapped_type = mapping.get(base_type, base_type)
-        return f"{mapped_type}-{size}"
+        algorithm, size = parse_algorithm_label(location_string)
+        if size is None:
+            return algorithm  # Fallback if no valid size suffix exists
+        return f"{algorithm}-{size}"
 
     return [map_single(loc) for loc in locations]
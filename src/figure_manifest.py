@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+MANIFEST_NAME = ".figure_manifest.json"
+
+
+def figure_hash(data, **params):
+    """
+    Computes a content hash of the inputs of a figure.
+
+    Parameters:
+    data: Arrays, (nested) dicts/lists of arrays or scalars that are plotted.
+    params: Plotting parameters that change the rendered output (filter_mode, dpi, labels, ...).
+    """
+    digest = hashlib.sha256()
+    _update_hash(digest, data)
+    _update_hash(digest, params)
+    return digest.hexdigest()
+
+
+def _update_hash(digest, value):
+    if isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        digest.update(f"ndarray:{array.dtype.str}:{array.shape}".encode('utf-8'))
+        if array.dtype.hasobject:
+            for item in array.ravel():
+                _update_hash(digest, item)
+        else:
+            digest.update(array.tobytes())
+    elif isinstance(value, dict):
+        digest.update(f"dict:{len(value)}".encode('utf-8'))
+        for key in sorted(value.keys(), key=str):
+            _update_hash(digest, str(key))
+            _update_hash(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"seq:{len(value)}".encode('utf-8'))
+        for item in value:
+            _update_hash(digest, item)
+    elif hasattr(value, 'to_numpy') and hasattr(value, 'columns'):
+        # pandas DataFrame: hash column names and values column by column
+        digest.update(f"frame:{value.shape}".encode('utf-8'))
+        for column in value.columns:
+            _update_hash(digest, str(column))
+            _update_hash(digest, value[column].to_numpy())
+    else:
+        digest.update(f"{type(value).__name__}:{value!r}".encode('utf-8'))
+
+
+class FigureManifest:
+    """
+    Records the input hash of every figure written to an output directory, so figures whose
+    inputs did not change are not rendered again.
+    """
+
+    def __init__(self, output_dir, force=False):
+        self.output_dir = output_dir
+        self.force = force
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    self.entries = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                print(f"Warning: Could not read figure manifest {self.path}. Rendering all figures.")
+                self.entries = {}
+
+    def is_current(self, output_path, digest):
+        """Returns True if output_path exists and was rendered from inputs with the same hash."""
+        if self.force:
+            return False
+        name = os.path.basename(output_path)
+        return self.entries.get(name) == digest and os.path.exists(output_path)
+
+    def record(self, output_path, digest):
+        self.entries[os.path.basename(output_path)] = digest
+        self.save()
+
+    def save(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -1,16 +1,32 @@
 import os
-import json
 import hashlib
 from pathlib import Path
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+try:
+    from src.load_raw_data import read_sequence_queries, find_topology_files, load_topology_file, prefetch_ordered
+    from src import json_backend
+    from src.profiling import accumulated, profiled, stage
+    from src.result_cache import memoize
+    from src.topology_archive import archive_path
+except ModuleNotFoundError:
+    from load_raw_data import read_sequence_queries, find_topology_files, load_topology_file, prefetch_ordered
+    import json_backend
+    from profiling import accumulated, profiled, stage
+    from result_cache import memoize
+    from topology_archive import archive_path
+
+SWEEP_DIR = Path("/home/ruben-eschauzier/projects/process-caching-journal/data/sweep-results")
+OUTPUT_DIR = Path("/home/ruben-eschauzier/projects/process-caching-journal/output")
+
 
 def generate_md5_hash(query_string: str) -> str:
     return hashlib.md5(query_string.encode('utf-8')).hexdigest()
 
 
+@accumulated()
 def simulate_lru_cache(sequence_queries_nodes, cache_size):
     if not sequence_queries_nodes:
         return 0.0
@@ -34,6 +50,7 @@ def simulate_lru_cache(sequence_queries_nodes, cache_size):
     return hits / total_accesses if total_accesses > 0 else 0.0
 
 
+@accumulated()
 def compute_jaccard_stats(sequence_queries_nodes):
     if len(sequence_queries_nodes) < 2:
         return 0.0, 0.0
@@ -53,8 +70,29 @@ def compute_jaccard_stats(sequence_queries_nodes):
     return 0.0, 0.0
 
 
-def analyze_sweep():
-    sweep_dir = Path("/home/ruben-eschauzier/projects/process-caching-journal/data/sweep-results")
+def topology_nodes(topology):
+    """Returns the set of sources visited in a topology, excluding the artificial root node."""
+    nodes = set(topology.get("indexToNodeDict", {}).values())
+    nodes.discard("root")
+    return nodes
+
+
+@accumulated("decode_topologies")
+def query_visited_nodes(topology_files):
+    """Union of the visited sources over all (repetition) topology files of a query."""
+    visited_in_query = set()
+    for topo_file in topology_files:
+        try:
+            visited_in_query.update(topology_nodes(load_topology_file(topo_file)))
+        except Exception:
+            pass
+    return visited_in_query
+
+
+@profiled()
+@memoize(paths=("sweep_dir",))
+def analyze_sweep(sweep_dir=SWEEP_DIR, read_ahead=0):
+    sweep_dir = Path(sweep_dir)
     runs = sorted(list(sweep_dir.glob("run_*")))
 
     rows = []
@@ -66,8 +104,7 @@ def analyze_sweep():
         if not metadata_file.exists():
             continue
 
-        with open(metadata_file, "r") as f:
-            meta = json.load(f)
+        meta = json_backend.load_file(metadata_file)
 
         hparams = meta.get("hyperparameters", {})
 
@@ -78,7 +115,7 @@ def analyze_sweep():
         sparql_dir = run / "generated" / "out-queries"
         topology_dir = run / "combinations" / "combination_0" / "output-topology-tracking"
 
-        if not sparql_dir.exists() or not topology_dir.exists():
+        if not sparql_dir.exists() or not (topology_dir.exists() or archive_path(topology_dir).exists()):
             print(f"Skipping {run_name} due to missing directories")
             continue
 
@@ -87,30 +124,11 @@ def analyze_sweep():
         for sparql_file in sparql_files:
             sequence_name = sparql_file.stem
 
-            with open(sparql_file, 'r', encoding='utf-8') as file:
-                content = file.read().strip()
-                queries = [q.strip() for q in content.split('\n\n') if q.strip()]
-
-            seq_queries_nodes = []
-            for query in queries:
-                q_hash = generate_md5_hash(query)
-                matching_files = [
-                    f for f in topology_dir.glob(f"*-{q_hash}.json")
-                    if not f.name.endswith('.tmp')
-                ]
-                matching_files.sort(key=lambda p: int(p.name.split('-')[0]))
-
-                visited_in_query = set()
-                for topo_file in matching_files:
-                    try:
-                        with open(topo_file, 'r', encoding='utf-8') as tf:
-                            topo = json.load(tf)
-                            nodes = set(topo.get("indexToNodeDict", {}).values())
-                            nodes.discard("root")
-                            visited_in_query.update(nodes)
-                    except Exception:
-                        pass
-                seq_queries_nodes.append(visited_in_query)
+            queries = read_sequence_queries(sparql_file)
+
+            # With read_ahead, the topology files of the next queries are decoded on a thread pool
+            query_files = (find_topology_files(topology_dir, generate_md5_hash(query)) for query in queries)
+            seq_queries_nodes = [nodes for _, nodes in prefetch_ordered(query_visited_nodes, query_files, read_ahead)]
 
             seq_length = len(queries)
             all_visited = set().union(*seq_queries_nodes) if seq_queries_nodes else set()
@@ -149,7 +167,8 @@ def analyze_sweep():
     return df
 
 
-def generate_sweep_plots(df):
+@profiled()
+def generate_sweep_plots(df, output_dir=OUTPUT_DIR):
     plt.style.use("seaborn-v0_8-whitegrid")
 
     hparams = [
@@ -203,19 +222,19 @@ def generate_sweep_plots(df):
     plt.suptitle("Hyperparameter Sweep Analysis on Sequence Topology Metrics", fontsize=18, fontweight="bold", y=0.98)
     plt.tight_layout()
 
-    output_dir = Path("/home/ruben-eschauzier/projects/process-caching-journal/output")
+    output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
     output_path = output_dir / "hyperparameter_sweep_analysis.png"
-    plt.savefig(output_path, dpi=300)
+    with stage("savefig"):
+        plt.savefig(output_path, dpi=300)
     plt.close()
 
 
-def main():
-    df = analyze_sweep()
-    generate_sweep_plots(df)
+def main(sweep_dir=SWEEP_DIR, output_dir=OUTPUT_DIR, read_ahead=0):
+    df = analyze_sweep(sweep_dir, read_ahead)
+    generate_sweep_plots(df, output_dir)
 
-    summary_path = Path(
-        "/home/ruben-eschauzier/projects/process-caching-journal/output/hyperparameter_sweep_summary.csv")
+    summary_path = Path(output_dir) / "hyperparameter_sweep_summary.csv"
     df.to_csv(summary_path, index=False)
 
 
@@ -0,0 +1,158 @@
+"""
+Single entry point for JSON decoding. The fastest installed backend is used (orjson, then
+pysimdjson, then ujson), falling back to the stdlib json module. Set JSON_BACKEND=<name> to
+force a backend, e.g. JSON_BACKEND=json to rule out decoder differences.
+
+Files ending in .gz or .zst are decompressed transparently while they are read (.zst needs the
+zstandard package). iter_array decodes the elements of a JSON array file one at a time, for
+analyses that must not hold a whole file in memory.
+"""
+import codecs
+import gzip
+import importlib
+import json
+import os
+import re
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BACKEND_PREFERENCE = ["orjson", "simdjson", "ujson", "json"]
+
+
+def _load_backend(name):
+    """Returns (loads, decode error class) of a backend, or None if it is not installed."""
+    if name == "json":
+        return json.loads, json.JSONDecodeError
+    try:
+        module = importlib.import_module(name)
+    except ImportError:
+        return None
+    # orjson and ujson define JSONDecodeError (a ValueError), pysimdjson raises ValueError
+    return module.loads, getattr(module, "JSONDecodeError", ValueError)
+
+
+def available_backends():
+    return [name for name in BACKEND_PREFERENCE if _load_backend(name) is not None]
+
+
+def get_loads(name):
+    backend = _load_backend(name)
+    if backend is None:
+        raise ValueError(f"JSON backend '{name}' is not installed, available: {available_backends()}")
+    return backend[0]
+
+
+def _select_backend():
+    requested = os.environ.get("JSON_BACKEND")
+    if requested:
+        backend = _load_backend(requested)
+        if backend is not None:
+            return requested, backend
+        print(f"Warning: JSON backend '{requested}' is not installed, using the stdlib json module.")
+        return "json", _load_backend("json")
+    for name in BACKEND_PREFERENCE:
+        backend = _load_backend(name)
+        if backend is not None:
+            return name, backend
+
+
+BACKEND, (_loads, _DecodeError) = _select_backend()
+# Catch this instead of json.JSONDecodeError, it covers the errors of every backend
+JSONDecodeError = (json.JSONDecodeError, _DecodeError)
+
+
+def loads(s):
+    """Decodes a JSON str or bytes object."""
+    if _loads is json.loads:
+        return json.loads(s)
+    try:
+        return _loads(s)
+    except _DecodeError:
+        # Fast decoders are stricter than the stdlib (e.g. NaN literals), let it have a go
+        return json.loads(s)
+
+
+JSON_SUFFIXES = (".json", ".json.gz", ".json.zst")
+
+
+def strip_json_suffix(name):
+    """Removes .json, .json.gz or .json.zst from a file name."""
+    for suffix in (".json.gz", ".json.zst", ".json"):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def is_json_file(name):
+    return str(name).endswith(JSON_SUFFIXES)
+
+
+def open_binary(path):
+    """Opens a (possibly gzip/zstd compressed) file for reading, decompressing while it is read."""
+    path = str(path)
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rb')
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError(f"Reading {path} requires the zstandard package (pip install zstandard)")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+def read_bytes(path):
+    """Reads the (decompressed) contents of a file, compressed files are decompressed chunk by chunk."""
+    with open_binary(path) as f:
+        return f.readall() if hasattr(f, "readall") else f.read()
+
+
+def load_file(path):
+    """Decodes a (possibly compressed) JSON file. It is read as bytes, so the backend can skip str decoding."""
+    return loads(read_bytes(path))
+
+
+_SEPARATORS = re.compile(r'[\s,]*')
+_ELEMENT_END = re.compile(r'\s*[,\]]')
+
+
+def iter_array(path, chunk_size=1 << 20):
+    """
+    Yields the elements of a (possibly compressed) JSON array file one at a time, reading chunk_size
+    bytes at a time, so only one chunk and one element are in memory. Elements are decoded with the
+    stdlib json module, which can decode from an offset in a buffer.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer, position, started, eof = "", 0, False, False
+    with open_binary(path) as f:
+        while True:
+            position = _SEPARATORS.match(buffer, position).end()
+            if position < len(buffer):
+                if not started:
+                    if buffer[position] != "[":
+                        raise ValueError(f"{path} is not a JSON array")
+                    started = True
+                    position += 1
+                    continue
+                if buffer[position] == "]":
+                    return
+                try:
+                    value, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # The element continues in the next chunk
+                    if eof:
+                        raise
+                else:
+                    # A number at the end of the buffer may continue in the next chunk, objects can not
+                    if isinstance(value, (dict, list)) or eof or _ELEMENT_END.match(buffer, end):
+                        yield value
+                        position = end
+                        continue
+            if eof:
+                raise ValueError(f"Unexpected end of {path}")
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + utf8.decode(chunk, final=eof)
+            position = 0
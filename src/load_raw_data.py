@@ -1,104 +1,337 @@
+import functools
 import hashlib
-import json
+import inspect
+import os
 import re
-from collections import defaultdict
+import warnings
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from pathlib import Path
-from xxlimited_35 import Null
 
 import numpy as np
 from statistics import geometric_mean
 
+try:
+    from src import json_backend
+    from src.profiling import accumulated, profiled, stage
+    from src.result_cache import memoize
+    from src.topology_archive import ArchiveMember, newer_than_archive, open_archive
+except ModuleNotFoundError:
+    import json_backend
+    from profiling import accumulated, profiled, stage
+    from result_cache import memoize
+    from topology_archive import ArchiveMember, newer_than_archive, open_archive
+
+CACHE_STATE_KEYS = [
+    "@comunica/persistent-cache-manager:sourceState",
+    "@comunica/persistent-cache-manager:sourceStateQuerySource",
+    "@comunica/persistent-cache-manager:cacheSourceStateIndexedDisk",
+    "@comunica/persistent-cache-manager:cacheSourceStateIndexedQuadStore",
+]
+
 
 def load_json(location):
-    with open(location, 'r') as f:
-        return json.load(f)
+    with stage("load_json") as s:
+        data = json_backend.load_file(location)
+        s.entries = len(data) if isinstance(data, list) else None
+    return data
+
+
+@accumulated("decode_cache_state")
+def parse_cache_state(entry):
+    """Decodes the serialized cache state of an entry, stored under one of CACHE_STATE_KEYS."""
+    cache_state_raw = entry.get(CACHE_STATE_KEYS[0]) or entry.get(CACHE_STATE_KEYS[1]) or \
+        entry.get(CACHE_STATE_KEYS[2]) or entry.get(CACHE_STATE_KEYS[3])
+    return json_backend.loads(cache_state_raw)
+
+
+FILE_ONLY_OPTIONS = ("drop_outliers", "sample", "memory_budget")
+
+
+def store_backend(method):
+    """
+    Lets a per-file accessor run on a ResultStore (see result_store.py) instead of the JSON file:
+    passing store=<ResultStore>, or setting ANALYSIS_STORE=<path>, answers the call with an
+    aggregate query on the store through store.<method>. Without a store the file is parsed as before.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, store=None, **kwargs):
+            if store is None and os.environ.get("ANALYSIS_STORE"):
+                try:
+                    from src.result_store import get_default_store
+                except ModuleNotFoundError:
+                    from result_store import get_default_store
+                store = get_default_store()
+            if store is None:
+                return func(*args, **kwargs)
+            # The store has no repetition-level outlier filtering, sampling or memory budget, those calls
+            # are answered from the file, also when the options are passed positionally
+            arguments = signature.bind(*args, **kwargs).arguments
+            if any(arguments.get(option) is not None for option in FILE_ONLY_OPTIONS):
+                return func(*args, **kwargs)
+            location = arguments.pop(next(iter(signature.parameters)))
+            store_kwargs = {key: value for key, value in arguments.items() if key not in FILE_ONLY_OPTIONS}
+            with stage(f"store.{method}"):
+                return getattr(store, method)(location, **store_kwargs)
+        return wrapper
+    return decorator
+
+
+def find_result_files(directory="data", pattern="query-results-raw-*.json"):
+    """
+    Returns the result files in directory matching pattern, in natural sort order. A pattern ending
+    in .json also matches .json.gz and .json.zst files; if a file exists both uncompressed and
+    compressed, the uncompressed one is used.
+    """
+    patterns = [pattern, pattern + ".gz", pattern + ".zst"] if pattern.endswith(".json") else [pattern]
+    files = {}
+    for p in patterns:
+        for path in sorted(Path(directory).glob(p)):
+            files.setdefault(json_backend.strip_json_suffix(str(path)), str(path))
+    return sorted(files.values(), key=natural_sort_key)
+
+
+def result_label(path):
+    """Label of a result file in plots and tables: query-results-raw-<label>.json(.gz|.zst)."""
+    return json_backend.strip_json_suffix(os.path.basename(path)).replace("query-results-raw-", "")
+
+
+def drop_outliers_from(data, rule):
+    """Removes the repetitions that are outliers under rule ("iqr" or "mad"), see outliers.py."""
+    try:
+        from src.outliers import drop_outlier_entries
+    except ModuleNotFoundError:
+        from outliers import drop_outlier_entries
+    return drop_outlier_entries(data, rule)
+
+
+def sample_from(data, sample, by="template"):
+    """Stratified sample of the entries (a fraction or a size, per template or sequence), see sampling.py."""
+    try:
+        from src.sampling import sample_entries
+    except ModuleNotFoundError:
+        from sampling import sample_entries
+    return sample_entries(data, sample, by)
+
+
+def bounded_per_sequence_from(location, make_partition_function, memory_budget, timeout_ms=None):
+    """Streams location through a *_by_sequence function within memory_budget, see spill.py."""
+    try:
+        from src.spill import bounded_per_sequence
+    except ModuleNotFoundError:
+        from spill import bounded_per_sequence
+    return bounded_per_sequence(location, make_partition_function, memory_budget, timeout_ms)
+
+
+def has_shards(location):
+    """Whether location was split into up-to-date shards (see sharding.py)."""
+    try:
+        from src.sharding import load_shard_index
+    except ModuleNotFoundError:
+        from sharding import load_shard_index
+    return load_shard_index(location) is not None
+
+
+def sharded_per_sequence_from(location, accessor, *args):
+    """Runs a per-sequence accessor of sharding.py (by name) in parallel over the shards of location."""
+    try:
+        from src import sharding
+    except ModuleNotFoundError:
+        import sharding
+    return getattr(sharding, accessor)(location, *args)
+
+
+def check_bounded_options(drop_outliers, sample):
+    if drop_outliers or sample is not None:
+        raise ValueError("drop_outliers and sample need the whole file in memory, they can not be combined "
+                         "with a memory budget")
+
+
+def memory_budget_or_default(memory_budget):
+    """memory_budget, or the ANALYSIS_MEMORY_BUDGET environment variable if it is None."""
+    if memory_budget is not None:
+        return memory_budget
+    return os.environ.get("ANALYSIS_MEMORY_BUDGET") or None
+
+
+def sample_groups(aggregated, sample):
+    """Samples the values of every group of an aggregate_on result, see sampling.py."""
+    try:
+        from src.sampling import sample_aggregated
+    except ModuleNotFoundError:
+        from sampling import sample_aggregated
+    return sample_aggregated(aggregated, sample)
+
 
 def natural_sort_key(s):
     return [int(text) if text.isdigit() else text.lower()
             for text in re.split('([0-9]+)', s)]
 
 
-def get_cumulative_data_per_sequence(location, filter_mode="all", drop_always_errors=False):
+def find_always_error_templates(data, timeout_ms=None):
     """
-    Extracts and averages sequence data, including execution time and result counts.
+    Returns the templates that fail in 100% of their executions. An execution fails if it has an
+    error or, when timeout_ms is given, if it took at least timeout_ms.
+    """
+    template_stats = defaultdict(lambda: {'total': 0, 'errors': 0})
+    for entry in data:
+        template = entry.get('sequenceElement', {}).get('template')
+        if template:
+            template_stats[template]['total'] += 1
+            if 'error' in entry or (timeout_ms is not None and entry.get('time', 0) >= timeout_ms):
+                template_stats[template]['errors'] += 1
+
+    return {
+        tpl for tpl, stats in template_stats.items()
+        if stats['total'] > 0 and stats['total'] == stats['errors']
+    }
 
-    Parameters:
-    location (str): Path to the JSON file.
-    filter_mode (str): Filtering strategy. Options: "all", "refinement_only", "no_refinement".
-    drop_always_errors (bool): Excludes templates that fail in 100% of their executions.
+
+def passes_filters(seq_element, filter_mode="all", always_error_templates=frozenset()):
+    """False if the template always fails or filter_mode excludes the entry's (non-)refinement pattern."""
+    if seq_element.get('template') in always_error_templates:
+        return False
+    has_pattern = len(seq_element.get('refinementMetadata', {}).values()) > 0
+    if filter_mode == "refinement_only" and not has_pattern:
+        return False
+    if filter_mode == "no_refinement" and has_pattern:
+        return False
+    return True
+
+
+def sequence_step_aggregates(names, steps, columns):
     """
-    data = load_json(location)
+    Per-(sequence, step) counts, sums and means of value columns, from one bincount per column over
+    the factorized sequence names and step ids, and the cumulative means per sequence (a cumsum over
+    the steps, absent steps add nothing).
 
-    # Pre-calculate template error rates
-    always_error_templates = set()
-    if drop_always_errors:
-        template_stats = defaultdict(lambda: {'total': 0, 'errors': 0})
-        for entry in data:
-            template = entry.get('sequenceElement', {}).get('template')
-            if template:
-                template_stats[template]['total'] += 1
-                if 'error' in entry:
-                    template_stats[template]['errors'] += 1
-
-        always_error_templates = {
-            tpl for tpl, stats in template_stats.items()
-            if stats['total'] > 0 and stats['total'] == stats['errors']
-        }
+    Parameters:
+        names: Sequence name of every value.
+        steps: Step id of every value.
+        columns: {column: values}, aligned with names and steps.
 
-    aggregated_by_sequence = aggregate_on(data, ['name'])
+    Returns a dict with sequences (names, the rows), steps (step ids, the columns), counts, and
+    sums, means and cumulative ({column: sequence x step array}).
+    """
+    sequence_index = {}
+    codes = np.fromiter((sequence_index.setdefault(name, len(sequence_index)) for name in names),
+                        dtype=np.int64, count=len(names))
+    step_ids, step_codes = np.unique(np.asarray(steps, dtype=np.int64), return_inverse=True)
+    shape = (len(sequence_index), len(step_ids))
+    keys = codes * shape[1] + step_codes
+    counts = np.bincount(keys, minlength=shape[0] * shape[1]).reshape(shape)
+    sums, means, cumulative = {}, {}, {}
+    for column, values in columns.items():
+        sums[column] = np.bincount(keys, weights=np.asarray(values, dtype=np.float64),
+                                   minlength=shape[0] * shape[1]).reshape(shape)
+        means[column] = np.divide(sums[column], counts, out=np.zeros(shape), where=counts > 0)
+        cumulative[column] = np.cumsum(means[column], axis=1)
+    return {"sequences": list(sequence_index), "steps": step_ids, "counts": counts, "sums": sums, "means": means,
+            "cumulative": cumulative}
+
+
+def per_sequence_rows(aggregates, outputs):
+    """
+    {sequence: {output: values}} of sequence_step_aggregates in natural sequence order, over the
+    steps the sequence has values for. outputs maps an output name to ("means" or "cumulative", column).
+    """
+    rows = {name: i for i, name in enumerate(aggregates["sequences"])}
     results = {}
+    for name in sorted(rows, key=natural_sort_key):
+        present = aggregates["counts"][rows[name]] > 0
+        results[name] = {
+            output: aggregates[kind][column][rows[name], present] for output, (kind, column) in outputs.items()
+        }
+    return results
 
-    for seq_name in sorted(aggregated_by_sequence.keys(), key=natural_sort_key):
-        step_times = defaultdict(list)
-        step_result_counts = defaultdict(list)
 
-        for entry in aggregated_by_sequence[seq_name]:
+def cumulative_data_by_sequence(data, filter_mode="all", always_error_templates=frozenset()):
+    """
+    Averages the execution time and result count per step over the repetitions of every sequence
+    in data, with the cumulative curves. Sequences that filtering removed entirely are left out.
+    """
+    names, steps, times, result_counts = [], [], [], []
+    with stage("cumulative_columns", entries=len(data)):
+        for entry in data:
+            name = entry['name']
             try:
                 step_id = int(entry['id'])
-                seq_element = entry.get('sequenceElement', {})
-                template = seq_element.get('template')
+            except (ValueError, KeyError):
+                continue
+            if not passes_filters(entry.get('sequenceElement', {}), filter_mode, always_error_templates):
+                continue
+            names.append(name)
+            steps.append(step_id)
+            times.append(entry.get('time', 0))
+            result_counts.append(entry.get('results', 0))
 
-                # Exclude templates with a 100% error rate
-                if drop_always_errors and template in always_error_templates:
-                    continue
+    aggregates = sequence_step_aggregates(names, steps, {"time": times, "results": result_counts})
+    return per_sequence_rows(aggregates, {
+        'averages': ("means", "time"),
+        'cumulative': ("cumulative", "time"),
+        'average_results': ("means", "results"),
+        'cumulative_results': ("cumulative", "results"),
+    })
 
-                ref_meta = seq_element.get('refinementMetadata', {})
 
-                # Updated pattern evaluation logic
-                has_pattern = len(ref_meta.values()) > 0
+def single_sequence(results):
+    """The result of a *_by_sequence function for the entries of one sequence, None if it has none."""
+    return next(iter(results.values()), None)
 
-                # Apply filtering logic
-                if filter_mode == "refinement_only" and not has_pattern:
-                    continue
-                if filter_mode == "no_refinement" and has_pattern:
-                    continue
 
-                step_times[step_id].append(entry.get('time', 0))
-                step_result_counts[step_id].append(entry.get('results', 0))
+def cumulative_sequence_data(entries, filter_mode="all", always_error_templates=frozenset()):
+    """
+    Averages the execution time and result count per step over the repetitions of a single
+    sequence. Returns None if filtering removed all entries.
+    """
+    return single_sequence(cumulative_data_by_sequence(entries, filter_mode, always_error_templates))
 
-            except (ValueError, KeyError):
-                continue
 
-        # Skip sequence if filtering removed all entries
-        if not step_times:
-            continue
+@store_backend("cumulative_data_per_sequence")
+@profiled()
+@memoize
+def get_cumulative_data_per_sequence(location, filter_mode="all", drop_always_errors=False, drop_outliers=None,
+                                     sample=None, memory_budget=None):
+    """
+    Extracts and averages sequence data, including execution time and result counts.
 
-        # Average metrics for each step across repetitions
-        sorted_step_ids = sorted(step_times.keys())
-        avg_step_times = [np.mean(step_times[sid]) for sid in sorted_step_ids]
-        avg_step_results = [np.mean(step_result_counts[sid]) for sid in sorted_step_ids]
-
-        # Store isolated data per sequence
-        results[seq_name] = {
-            'averages': np.array(avg_step_times),
-            'cumulative': np.cumsum(avg_step_times),
-            'average_results': np.array(avg_step_results),
-            'cumulative_results': np.cumsum(avg_step_results)
-        }
+    Parameters:
+    location (str): Path to the JSON file.
+    filter_mode (str): Filtering strategy. Options: "all", "refinement_only", "no_refinement".
+    drop_always_errors (bool): Excludes templates that fail in 100% of their executions.
+    drop_outliers (str): Excludes outlier repetitions per (template, step), "iqr" or "mad". None keeps all.
+    sample (float or int): Only uses a sample of whole sequences, a fraction or a number of sequences. None uses all.
+    memory_budget (int or str): Streams the file and spills grouped entries to disk beyond this many bytes
+        (e.g. "512M"), see spill.py. Defaults to ANALYSIS_MEMORY_BUDGET, None reads the file into memory.
 
-    return results
+    Without a memory budget, outlier filtering or sampling, a file split into shards (cli.py shard)
+    is processed shard by shard in parallel instead.
+    """
+    memory_budget = memory_budget_or_default(memory_budget)
+    if memory_budget:
+        check_bounded_options(drop_outliers, sample)
+        return bounded_per_sequence_from(location, lambda always_error_templates: partial(
+            cumulative_data_by_sequence, filter_mode=filter_mode,
+            always_error_templates=always_error_templates if drop_always_errors else frozenset()), memory_budget)
+    if not drop_outliers and sample is None and has_shards(location):
+        return sharded_per_sequence_from(location, "sharded_cumulative_data_per_sequence", filter_mode,
+                                         drop_always_errors)
 
+    data = load_json(location)
+
+    # Pre-calculate template error rates
+    always_error_templates = find_always_error_templates(data) if drop_always_errors else frozenset()
+    if drop_outliers:
+        data = drop_outliers_from(data, drop_outliers)
+    if sample is not None:
+        data = sample_from(data, sample, by="sequence")
+    return cumulative_data_by_sequence(data, filter_mode, always_error_templates)
+
+@profiled()
 def get_geo_means(aggregated):
     geo_mean_time = average_aggregated_data(aggregated, "time", geo_mean_number, lambda x, i: False)
     geo_mean_timestamps = average_aggregated_data(aggregated, "timestamps", geo_mean_list, lambda x, i: False)
@@ -118,6 +351,7 @@ def get_geo_means(aggregated):
         geo_mean_time_no_refinement, geo_mean_time_timestamps_no_refinement
 
 
+@profiled()
 def get_geo_means_error_filter(aggregated):
     bound_exclude_non_rf = partial(exclude_non_refinement_pattern, exclude_errors=True)
     bound_exclude_rdf = partial(exclude_refinement_pattern, exclude_errors=True)
@@ -139,7 +373,15 @@ def get_geo_means_error_filter(aggregated):
         geo_mean_time_no_refinement, geo_mean_time_timestamps_no_refinement
 
 
-def get_means(aggregated):
+@profiled()
+def get_means(aggregated, sample=None):
+    """
+    Mean time and timestamps per template, for all executions and per refinement filter. sample (a
+    fraction or a size per template) averages a sample of every template instead, see
+    sampling.approximate_means for the standard errors.
+    """
+    if sample is not None:
+        aggregated = sample_groups(aggregated, sample)
     average_time = average_aggregated_data(aggregated, "time", average_number, lambda x, i: False)
     average_timestamps = average_aggregated_data(aggregated, "timestamps", average_list_number, lambda x, i: False)
 
@@ -160,6 +402,7 @@ def get_means(aggregated):
         mean_time_no_refinement, mean_time_timestamps_no_refinement
 
 
+@profiled()
 def get_n_errors(aggregated):
     def sum_errors(aggregated_to_average):
         errors_to_number = [1 if ele is not None else 0 for ele in aggregated_to_average]
@@ -191,107 +434,92 @@ def get_n_errors(aggregated):
     return summed_errors, proportion_errors, sum_errors_no_refinement, proportion_errors_no_refinement
 
 
-def get_cache_metrics_per_sequence(location, filter_mode="all", drop_always_errors=False, timeout_ms=180000):
-    data = load_json(location)
-
-    # Pre-calculate template error rates, including timeouts
-    always_error_templates = set()
-    if drop_always_errors:
-        template_stats = defaultdict(lambda: {'total': 0, 'errors': 0})
+def cache_metrics_by_sequence(data, filter_mode="all", always_error_templates=frozenset()):
+    """
+    Averages the hit rate and eviction percentage per step over the repetitions of every sequence
+    in data. Entries without a readable cache state and sequences that filtering removed entirely
+    are left out.
+    """
+    names, steps, hit_rates, evictions = [], [], [], []
+    with stage("cache_metric_columns", entries=len(data)):
         for entry in data:
-            template = entry.get('sequenceElement', {}).get('template')
-            if template:
-                template_stats[template]['total'] += 1
-                if 'error' in entry or entry.get('time', 0) >= timeout_ms:
-                    template_stats[template]['errors'] += 1
-
-        always_error_templates = {
-            tpl for tpl, stats in template_stats.items()
-            if stats['total'] > 0 and stats['total'] == stats['errors']
-        }
-
-    aggregated_by_sequence = aggregate_on(data, ['name'])
-    results = {}
-
-    for seq_name in sorted(aggregated_by_sequence.keys(), key=natural_sort_key):
-        step_hitrates = defaultdict(list)
-        step_evictions = defaultdict(list)
-
-        for entry in aggregated_by_sequence[seq_name]:
+            name = entry['name']
             try:
                 step_id = int(entry['id'])
-                seq_element = entry.get('sequenceElement', {})
-                template = seq_element.get('template')
-
-                # Apply error filtering
-                if drop_always_errors and template in always_error_templates:
-                    continue
-
-                ref_meta = seq_element.get('refinementMetadata', {})
-                has_pattern = len(ref_meta.values()) > 0
-
-                # Apply mode filtering
-                if filter_mode == "refinement_only" and not has_pattern:
+                if not passes_filters(entry.get('sequenceElement', {}), filter_mode, always_error_templates):
                     continue
-                if filter_mode == "no_refinement" and has_pattern:
-                    continue
-
-                # Parse cache states
-                cache_state_raw = entry.get("@comunica/persistent-cache-manager:sourceState") or \
-                            entry.get("@comunica/persistent-cache-manager:sourceStateQuerySource") or \
-                            entry.get("@comunica/persistent-cache-manager:cacheSourceStateIndexedDisk") or \
-                            entry.get("@comunica/persistent-cache-manager:cacheSourceStateIndexedQuadStore")
-
-                cache_state = json.loads(cache_state_raw)
-
-                hits = cache_state.get('hits', 0)
-                misses = cache_state.get('misses', 0)
-                eviction_pct = cache_state.get('evictionPercentage', 0)
-                http_requests = entry.get('httpRequests', 0)
-
-                denominator = misses + hits
-                hitrate = hits / denominator if denominator > 0 else 0.0
-
-                step_hitrates[step_id].append(hitrate)
-                step_evictions[step_id].append(eviction_pct)
-
-            except (ValueError, KeyError, json.JSONDecodeError):
+                cache_state = parse_cache_state(entry)
+            except (ValueError, KeyError):
                 continue
 
-        # Skip empty sequences
-        if not step_hitrates:
-            continue
+            hits = cache_state.get('hits', 0)
+            misses = cache_state.get('misses', 0)
+            denominator = misses + hits
+            names.append(name)
+            steps.append(step_id)
+            hit_rates.append(hits / denominator if denominator > 0 else 0.0)
+            evictions.append(cache_state.get('evictionPercentage', 0))
 
-        sorted_step_ids = sorted(step_hitrates.keys())
-        avg_hitrates = [np.mean(step_hitrates[sid]) for sid in sorted_step_ids]
-        avg_evictions = [np.mean(step_evictions[sid]) for sid in sorted_step_ids]
+    aggregates = sequence_step_aggregates(names, steps, {"hit_rate": hit_rates, "eviction": evictions})
+    return per_sequence_rows(aggregates, {
+        'hitrates': ("means", "hit_rate"),
+        'eviction_percentages': ("means", "eviction"),
+    })
 
-        results[seq_name] = {
-            'hitrates': np.array(avg_hitrates),
-            'eviction_percentages': np.array(avg_evictions)
-        }
 
-    return results
+def cache_metrics_sequence_data(entries, filter_mode="all", always_error_templates=frozenset()):
+    """
+    Averages the hit rate and eviction percentage per step over the repetitions of a single
+    sequence. Returns None if filtering removed all entries.
+    """
+    return single_sequence(cache_metrics_by_sequence(entries, filter_mode, always_error_templates))
+
+
+@store_backend("cache_metrics_per_sequence")
+@profiled()
+@memoize
+def get_cache_metrics_per_sequence(location, filter_mode="all", drop_always_errors=False, timeout_ms=180000, drop_outliers=None,
+                                   sample=None, memory_budget=None):
+    memory_budget = memory_budget_or_default(memory_budget)
+    if memory_budget:
+        check_bounded_options(drop_outliers, sample)
+        return bounded_per_sequence_from(location, lambda always_error_templates: partial(
+            cache_metrics_by_sequence, filter_mode=filter_mode,
+            always_error_templates=always_error_templates if drop_always_errors else frozenset()),
+            memory_budget, timeout_ms)
+    if not drop_outliers and sample is None and has_shards(location):
+        # Like get_cumulative_data_per_sequence, files split into shards are processed in parallel
+        return sharded_per_sequence_from(location, "sharded_cache_metrics_per_sequence", filter_mode,
+                                         drop_always_errors, timeout_ms)
 
+    data = load_json(location)
 
-def get_raw_metrics(location, filter_mode="all", drop_always_errors=False, timeout_ms=180000):
+    # Pre-calculate template error rates, including timeouts
+    always_error_templates = find_always_error_templates(data, timeout_ms) if drop_always_errors else frozenset()
+    if drop_outliers:
+        data = drop_outliers_from(data, drop_outliers)
+    if sample is not None:
+        data = sample_from(data, sample, by="sequence")
+    return cache_metrics_by_sequence(data, filter_mode, always_error_templates)
+
+
+@store_backend("raw_metrics")
+@profiled()
+@memoize
+def get_raw_metrics(location, filter_mode="all", drop_always_errors=False, timeout_ms=180000, drop_outliers=None,
+                    sample=None):
+    """
+    Per-entry metrics of a result file. sample (a fraction or a size) keeps a sample stratified by
+    template, see sampling.approximate_raw_metrics for estimates with standard errors.
+    """
     data = load_json(location)
 
     # Pre-calculate template error rates, including timeouts
-    always_error_templates = set()
-    if drop_always_errors:
-        template_stats = defaultdict(lambda: {'total': 0, 'errors': 0})
-        for entry in data:
-            template = entry.get('sequenceElement', {}).get('template')
-            if template:
-                template_stats[template]['total'] += 1
-                if 'error' in entry or entry.get('time', 0) >= timeout_ms:
-                    template_stats[template]['errors'] += 1
-
-        always_error_templates = {
-            tpl for tpl, stats in template_stats.items()
-            if stats['total'] > 0 and stats['total'] == stats['errors']
-        }
+    always_error_templates = find_always_error_templates(data, timeout_ms) if drop_always_errors else frozenset()
+    if drop_outliers:
+        data = drop_outliers_from(data, drop_outliers)
+    if sample is not None:
+        data = sample_from(data, sample)
 
     hit_rates, times, timeouts, http_requests, results = [], [], [], [], []
 
@@ -301,7 +529,7 @@ def get_raw_metrics(location, filter_mode="all", drop_always_errors=False, timeo
             template = seq_element.get('template')
 
             # Apply error filtering
-            if drop_always_errors and template in always_error_templates:
+            if template in always_error_templates:
                 continue
 
             ref_meta = seq_element.get('refinementMetadata', {})
@@ -316,11 +544,7 @@ def get_raw_metrics(location, filter_mode="all", drop_always_errors=False, timeo
             time_ms = entry.get('time', 0)
             is_timeout = 'error' in entry or time_ms >= timeout_ms
 
-            cache_state_raw = entry.get("@comunica/persistent-cache-manager:sourceState") or \
-                              entry.get("@comunica/persistent-cache-manager:sourceStateQuerySource") or \
-                              entry.get("@comunica/persistent-cache-manager:cacheSourceStateIndexedDisk") or \
-                              entry.get("@comunica/persistent-cache-manager:cacheSourceStateIndexedQuadStore")
-            cache_state = json.loads(cache_state_raw)
+            cache_state = parse_cache_state(entry)
 
             hits = cache_state.get('hits', 0)
             misses = cache_state.get('misses', 0)
@@ -336,12 +560,13 @@ def get_raw_metrics(location, filter_mode="all", drop_always_errors=False, timeo
             http_requests.append(http_request_count)
             results.append(result_count)
 
-        except (ValueError, KeyError, json.JSONDecodeError):
+        except (ValueError, KeyError):
             continue
 
     return np.array(hit_rates), np.array(times), np.array(timeouts), np.array(http_requests), np.array(results)
 
 
+@profiled()
 def get_n_results(aggregated):
     mean_results = average_aggregated_data(aggregated, "results", average_number, lambda x, i: False)
     mean_results_rf_only = average_aggregated_data(
@@ -373,21 +598,23 @@ def errors_deviation_from_mean(aggregated_per_sequence, template_to_errors_proba
 
 def aggregate_on(data, aggregate_keys, selection_keys=None):
     aggregated = {}
-    for data_point in data:
-        aggregation_value = find_at_keys(data_point, aggregate_keys)
-        if not hashable(aggregation_value):
-            raise ValueError("Value associated with aggregation keys not hashable")
-
-        if aggregation_value not in aggregated:
-            aggregated[aggregation_value] = []
-        if selection_keys:
-            to_save = find_at_keys(data_point, selection_keys)
-        else:
-            to_save = data_point
-        aggregated[aggregation_value].append(to_save)
+    with stage("aggregate_on", entries=len(data)):
+        for data_point in data:
+            aggregation_value = find_at_keys(data_point, aggregate_keys)
+            if not hashable(aggregation_value):
+                raise ValueError("Value associated with aggregation keys not hashable")
+
+            if aggregation_value not in aggregated:
+                aggregated[aggregation_value] = []
+            if selection_keys:
+                to_save = find_at_keys(data_point, selection_keys)
+            else:
+                to_save = data_point
+            aggregated[aggregation_value].append(to_save)
     return aggregated
 
 
+@profiled()
 def average_aggregated_data(aggregated, average_key, average_function, exclusion_function):
     averaged_results = {}
     for agg_key, value in aggregated.items():
@@ -497,54 +724,150 @@ def generate_md5_hash(query_string: str) -> str:
     return hashlib.md5(query_string.encode('utf-8')).hexdigest()
 
 
-def yield_sequence_topologies(sparql_dir: str, topology_dir: str, max_sequences=None):
+@accumulated()
+def read_sequence_queries(sparql_file):
+    """Reads the queries of a sequence file, queries are separated by blank lines."""
+    with open(sparql_file, 'r', encoding='utf-8') as file:
+        content = file.read().strip()
+    return [q.strip() for q in content.split('\n\n') if q.strip()]
+
+
+@accumulated("scan_topology_files")
+def find_topology_files(topology_path, query_hash):
     """
-    Generator that reads SPARQL queries and yields their timestamped topology files
-    one sequence at a time. Files are processed in alphabetical order.
+    Returns the topology files of a query, sorted chronologically by their timestamp prefix
+    so they are in the order of the repetitions. Unfinished .tmp files are excluded. Files may be
+    gzip/zstd compressed. If the directory was packed (see topology_archive.py), the members of
+    the archive are returned instead, load them with load_topology_file. Files written to the
+    directory after it was packed are merged in, they replace archive members of the same name.
     """
-    sparql_path = Path(sparql_dir)
-    topology_path = Path(topology_dir)
+    archive = open_archive(topology_path)
+    if archive is None:
+        return _loose_topology_files(topology_path, query_hash)
+    members = archive.members(query_hash)
+    if not newer_than_archive(topology_path, archive):
+        return members
+    warnings.warn(f"{topology_path} changed after it was packed into {archive.path}, merging its files with "
+                  f"the archive (re-run pack-topologies to update it)", stacklevel=2)
+    loose = _loose_topology_files(topology_path, query_hash)
+    loose_names = {f.name for f in loose}
+    merged = [member for member in members if member.name not in loose_names] + loose
+    merged.sort(key=lambda f: int(f.name.split('-')[0]))
+    return merged
+
+
+def _loose_topology_files(topology_path, query_hash):
+    matching_files = [
+        f for f in Path(topology_path).glob(f"*-{query_hash}.json*")
+        if json_backend.is_json_file(f.name)
+    ]
+    matching_files.sort(key=lambda p: int(p.name.split('-')[0]))
+    return matching_files
+
+
+def load_topology_file(topology_file):
+    """Decodes a topology file returned by find_topology_files."""
+    if isinstance(topology_file, ArchiveMember):
+        return json_backend.loads(topology_file.read_bytes())
+    return json_backend.load_file(topology_file)
+
+
+def prefetch_ordered(func, items, read_ahead=16, max_workers=None):
+    """
+    Yields (item, func(item)) for every item, in order, while func already runs on a thread pool
+    for up to read_ahead items ahead of the consumer. Items are pulled from the iterable lazily,
+    so at most read_ahead results are held in memory. read_ahead=0 runs func in the calling thread.
+    Exceptions raised by func are re-raised when their item is reached.
+    """
+    if read_ahead <= 0:
+        for item in items:
+            yield item, func(item)
+        return
 
-    # Sort files alphabetically to guarantee consistent processing order
-    sparql_files = sorted(list(sparql_path.glob('*.sparql')))
+    pool = ThreadPoolExecutor(max_workers=max_workers or min(read_ahead, 8))
+    pending = deque()
+    try:
+        for item in items:
+            pending.append((item, pool.submit(func, item)))
+            if len(pending) > read_ahead:
+                done_item, future = pending.popleft()
+                yield done_item, future.result()
+        while pending:
+            done_item, future = pending.popleft()
+            yield done_item, future.result()
+    finally:
+        # Also reached when the consumer stops early, queued reads are dropped
+        pool.shutdown(wait=True, cancel_futures=True)
 
-    for i, sparql_file in enumerate(sparql_files):
-        # Adjust limit logic (>= ensures exactly max_sequences are yielded)
-        if max_sequences is not None and i >= max_sequences:
-            break
 
-        sequence_name = sparql_file.stem
-        sequence_data = []
+_DECODE_FAILED = object()
 
-        with open(sparql_file, 'r', encoding='utf-8') as file:
-            content = file.read().strip()
-            queries = [q.strip() for q in content.split('\n\n') if q.strip()]
 
-        for query_string in queries:
-            query_hash = generate_md5_hash(query_string)
+def _topology_read_plan(sparql_files, topology_path):
+    """
+    Flattens sequences into (sequence name, query index, query, topology file) items in processing
+    order. Queries without topology files get a single item with file None, sequences without
+    queries an item with query index None, so every sequence and query appears in the plan.
+    """
+    for sparql_file in sparql_files:
+        queries = read_sequence_queries(sparql_file)
+        if not queries:
+            yield sparql_file.stem, None, None, None
+        for query_idx, query_string in enumerate(queries):
+            matching_files = find_topology_files(topology_path, generate_md5_hash(query_string))
+            for topo_file in matching_files or [None]:
+                yield sparql_file.stem, query_idx, query_string, topo_file
+
+
+@accumulated("decode_topologies")
+def _load_topology(plan_item):
+    topo_file = plan_item[3]
+    if topo_file is None:
+        return None
+    try:
+        return load_topology_file(topo_file)
+    except json_backend.JSONDecodeError:
+        return _DECODE_FAILED
 
-            # Find all topology files matching the hash, explicitly excluding .tmp files
-            matching_files = [
-                f for f in topology_path.glob(f"*-{query_hash}.json")
-                if not f.name.endswith('.tmp')
-            ]
 
-            # Sort chronologically by the timestamp prefix to order the repetitions
-            matching_files.sort(key=lambda p: int(p.name.split('-')[0]))
+def yield_sequence_topologies(sparql_dir: str, topology_dir: str, max_sequences=None, read_ahead=0):
+    """
+    Generator that reads SPARQL queries and yields their timestamped topology files
+    one sequence at a time. Files are processed in alphabetical order.
 
-            topologies = []
-            for topo_file in matching_files:
-                try:
-                    with open(topo_file, 'r', encoding='utf-8') as tf:
-                        topologies.append(json.load(tf))
-                except json.JSONDecodeError:
-                    print(f"Warning: Failed to decode JSON from {topo_file.name}. Skipping.")
+    With read_ahead > 0 the next read_ahead topology files, also those of the following sequences,
+    are read and decoded on a thread pool while the current sequence is being processed. This pays
+    off on cold or network storage; on a warm local disk the decoding is bound by the GIL and the
+    files are best read one at a time (the default).
+    """
+    sparql_path = Path(sparql_dir)
+    topology_path = Path(topology_dir)
 
+    # Sort files alphabetically to guarantee consistent processing order
+    sparql_files = sorted(list(sparql_path.glob('*.sparql')))
+    if max_sequences is not None:
+        sparql_files = sparql_files[:max_sequences]
+
+    plan = _topology_read_plan(sparql_files, topology_path)
+    sequence_name, sequence_data = None, []
+    for (name, query_idx, query_string, topo_file), topology in prefetch_ordered(_load_topology, plan, read_ahead):
+        if name != sequence_name:
+            if sequence_name is not None:
+                # Yield a single sequence dict and pause execution
+                yield sequence_name, {"sequence": sequence_data}
+            sequence_name, sequence_data = name, []
+
+        if query_idx is None:
+            continue
+        if query_idx == len(sequence_data):
             sequence_data.append({
                 "queryString": query_string,
-                "topologies": topologies
+                "topologies": []
             })
+        if topology is _DECODE_FAILED:
+            print(f"Warning: Failed to decode JSON from {topo_file.name}. Skipping.")
+        elif topology is not None:
+            sequence_data[-1]["topologies"].append(topology)
 
-        # Yield a single sequence dict and pause execution
+    if sequence_name is not None:
         yield sequence_name, {"sequence": sequence_data}
-
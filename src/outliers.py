@@ -0,0 +1,179 @@
+"""
+Robust outlier detection of repetition-level execution times.
+
+Executions are grouped by (template, step) (or any other group_by keys) and every group gets fences
+from its median/MAD or quartiles/IQR, computed for all groups in one grouped pass over the
+sorted times. The result is a boolean mask over the entries of a file, which can:
+    - drop the outliers before a per-file accessor runs (drop_outliers="iqr" or "mad" on
+      get_raw_metrics, get_cumulative_data_per_sequence and get_cache_metrics_per_sequence),
+    - be combined with other exclusion functions of average_aggregated_data, after mark_outliers
+      flagged the entries (exclude_outliers),
+    - be summarized per file and rule with outlier_report.
+Executions with an error are never outliers, the error filters handle them.
+"""
+import numpy as np
+import pandas as pd
+
+try:
+    from src.load_raw_data import load_json, result_label
+    from src.profiling import profiled, stage
+    from src.result_cache import memoize
+except ModuleNotFoundError:
+    from load_raw_data import load_json, result_label
+    from profiling import profiled, stage
+    from result_cache import memoize
+
+RULES = ("iqr", "mad")
+# Fence multipliers: Tukey's 1.5 x IQR, and 3.5 x the MAD scaled to a standard deviation (1.4826 x MAD)
+DEFAULT_K = {"iqr": 1.5, "mad": 3.5}
+MAD_SCALE = 1.4826
+OUTLIER_KEY = "outlier"
+
+
+def _group_key(entry, group_by):
+    seq_element = entry.get('sequenceElement', {})
+    key = []
+    for field in group_by:
+        if field == "template":
+            key.append(seq_element.get('template'))
+        elif field == "step":
+            key.append(int(entry['id']))
+        else:
+            key.append(entry.get(field))
+    return tuple(key)
+
+
+def _grouped_quantile(sorted_values, starts, counts, q):
+    """Linearly interpolated q-quantile (like np.percentile) of every group of sorted_values."""
+    position = starts + q * (counts - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, starts + counts - 1)
+    fraction = position - lower
+    return sorted_values[lower] + fraction * (sorted_values[upper] - sorted_values[lower])
+
+
+def grouped_fences(codes, values, n_groups, rule="iqr", k=None, min_group_size=3):
+    """
+    Lower and upper fence of every group of values (codes in 0..n_groups - 1). Groups with fewer than
+    min_group_size values, or (for mad) a MAD of 0, get infinite fences so nothing in them is flagged.
+    """
+    if rule not in RULES:
+        raise ValueError(f"Invalid rule {rule}, choose one of {', '.join(RULES)}")
+    k = DEFAULT_K[rule] if k is None else k
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    present = counts > 0
+    sorted_values = values[np.lexsort((values, codes))]
+    low, high = np.full(n_groups, -np.inf), np.full(n_groups, np.inf)
+
+    if rule == "iqr":
+        q1 = _grouped_quantile(sorted_values, starts[present], counts[present], 0.25)
+        q3 = _grouped_quantile(sorted_values, starts[present], counts[present], 0.75)
+        low[present], high[present] = q1 - k * (q3 - q1), q3 + k * (q3 - q1)
+    else:
+        median = np.zeros(n_groups)
+        median[present] = _grouped_quantile(sorted_values, starts[present], counts[present], 0.5)
+        deviations = np.abs(values - median[codes])
+        sorted_deviations = deviations[np.lexsort((deviations, codes))]
+        mad = np.zeros(n_groups)
+        mad[present] = _grouped_quantile(sorted_deviations, starts[present], counts[present], 0.5)
+        spread = np.where(mad > 0, k * MAD_SCALE * mad, np.inf)
+        low[present], high[present] = median[present] - spread[present], median[present] + spread[present]
+
+    too_small = counts < min_group_size
+    low[too_small], high[too_small] = -np.inf, np.inf
+    return low, high
+
+
+@profiled()
+def find_outliers(data, rule="iqr", k=None, group_by=("template", "step"), tails="upper", min_group_size=3):
+    """
+    Boolean mask over data, True for the executions outside the fences of their group.
+
+    Parameters:
+        data: Entries of a result file.
+        rule: "iqr" (quartiles +- k x IQR) or "mad" (median +- k x 1.4826 x MAD).
+        k: Fence multiplier, DEFAULT_K[rule] by default.
+        group_by: Keys the repetitions are grouped on: "template", "step" or any entry field, e.g.
+            ("template", "name", "id") for the repetitions of one query instantiation.
+        tails: "upper" only flags slow executions (like extract_raw_metrics_filter_outliers), "both" also fast ones.
+        min_group_size: Groups with fewer executions are never filtered.
+    """
+    group_index = {}
+    codes = np.full(len(data), -1, dtype=np.int64)
+    times = np.zeros(len(data), dtype=np.float64)
+    with stage("outlier_groups", entries=len(data)):
+        for i, entry in enumerate(data):
+            if 'error' in entry or entry.get('time') is None:
+                continue
+            try:
+                key = _group_key(entry, group_by)
+            except (ValueError, KeyError, TypeError):
+                continue
+            code = group_index.get(key)
+            if code is None:
+                code = group_index[key] = len(group_index)
+            codes[i] = code
+            times[i] = entry['time']
+
+    grouped = codes >= 0
+    mask = np.zeros(len(data), dtype=bool)
+    if not grouped.any():
+        return mask
+    low, high = grouped_fences(codes[grouped], times[grouped], len(group_index), rule, k, min_group_size)
+    group_codes, group_times = codes[grouped], times[grouped]
+    outliers = group_times > high[group_codes]
+    if tails == "both":
+        outliers |= group_times < low[group_codes]
+    mask[grouped] = outliers
+    return mask
+
+
+def drop_outlier_entries(data, rule="iqr", **kwargs):
+    """Returns the entries of data that are not outliers under rule (see find_outliers)."""
+    mask = find_outliers(data, rule, **kwargs)
+    return [entry for entry, is_outlier in zip(data, mask) if not is_outlier]
+
+
+@memoize
+def outlier_mask(location, rule="iqr", k=None, group_by=("template", "step"), tails="upper", min_group_size=3):
+    """find_outliers of a result file, memoized."""
+    return find_outliers(load_json(location), rule, k, group_by, tails, min_group_size)
+
+
+def mark_outliers(data, mask):
+    """Flags the entries of data selected by mask with an "outlier" key, for exclude_outliers."""
+    for entry, is_outlier in zip(data, mask):
+        if is_outlier:
+            entry[OUTLIER_KEY] = True
+        else:
+            entry.pop(OUTLIER_KEY, None)
+    return data
+
+
+def exclude_outliers(data_point, idx):
+    """Exclusion function of average_aggregated_data dropping entries flagged by mark_outliers."""
+    return OUTLIER_KEY in data_point
+
+
+def combine_exclusions(*exclusion_functions):
+    """Exclusion function excluding a data point if any of exclusion_functions does."""
+    def exclusion_function(data_point, idx):
+        return any(function(data_point, idx) for function in exclusion_functions)
+    return exclusion_function
+
+
+def outlier_report(locations, rules=RULES, group_by=("template", "step"), tails="upper", min_group_size=3):
+    """Number and percentage of entries every rule flags as outliers, per file."""
+    rows = []
+    for location in locations:
+        for rule in rules:
+            mask = outlier_mask(location, rule, None, tuple(group_by), tails, min_group_size)
+            rows.append({
+                "label": result_label(location),
+                "rule": rule,
+                "entries": len(mask),
+                "removed": int(mask.sum()),
+                "removed_pct": 100 * mask.mean() if len(mask) else 0.0,
+            })
+    return pd.DataFrame(rows)
@@ -0,0 +1,164 @@
+"""
+Dolan-Moré performance profiles of configurations (result files) over the queries they all ran.
+
+A query is a (sequence name, step id, template) triple, summarized over its repetitions by the
+median. For every query the performance ratio of a configuration is its cost divided by the best
+cost of any configuration; failed queries (error, no results, or a time of at least timeout_ms)
+have an infinite cost. The profile of a configuration is the fraction of queries with a ratio of at
+most tau, evaluated on a grid of taus with searchsorted on the sorted ratios.
+
+The per-file medians are memoized and filter modes are masks over them, so switching filter modes,
+metrics or the set of configurations only repeats the cheap array operations:
+
+    costs, labels = cost_matrix(locations, metric="time", filter_mode="no_refinement")
+    taus, profiles = performance_profile(performance_ratios(costs))
+"""
+import numpy as np
+
+try:
+    from src.data_analysis import get_algorithm_labels
+    from src.load_raw_data import load_json
+    from src.profiling import profiled
+    from src.result_cache import memoize
+except ModuleNotFoundError:
+    from data_analysis import get_algorithm_labels
+    from load_raw_data import load_json
+    from profiling import profiled
+    from result_cache import memoize
+
+# Cost of a repetition per metric, lower is better. Throughput is turned into a cost by inverting it,
+# so the ratio of a configuration is best throughput / throughput, like in the notebooks.
+METRICS = ("time", "first_ts", "last_ts", "throughput")
+
+
+def _grouped_median(codes, values, n_groups):
+    """Median of values per group code (0..n_groups - 1), every group must be non-empty."""
+    order = np.lexsort((values, codes))
+    sorted_values = values[order]
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    return (sorted_values[starts + (counts - 1) // 2] + sorted_values[starts + counts // 2]) / 2
+
+
+@memoize
+def query_costs(location, timeout_ms=None):
+    """
+    Returns (queries, costs, refinement) of a result file: the (name, id, template) of every query,
+    a dict with the median cost over its repetitions per metric (inf for failed repetitions), and
+    whether the query is part of a refinement pattern.
+    """
+    data = load_json(location)
+    query_index = {}
+    codes = np.empty(len(data), dtype=np.int64)
+    refinement = []
+    raw = {metric: np.empty(len(data), dtype=np.float64) for metric in METRICS}
+
+    for i, entry in enumerate(data):
+        seq_element = entry.get('sequenceElement', {})
+        key = (entry.get('name'), entry.get('id'), seq_element.get('template', 'unknown'))
+        code = query_index.get(key)
+        if code is None:
+            code = query_index[key] = len(query_index)
+            refinement.append(len(seq_element.get('refinementMetadata', {}).values()) > 0)
+        codes[i] = code
+
+        time_ms = entry.get('time', 0)
+        timestamps = entry.get('timestamps', [])
+        failed = 'error' in entry or not timestamps or (timeout_ms is not None and time_ms >= timeout_ms)
+        if failed:
+            for metric in METRICS:
+                raw[metric][i] = np.inf
+            continue
+        raw["time"][i] = time_ms
+        raw["first_ts"][i] = timestamps[0]
+        raw["last_ts"][i] = timestamps[-1]
+        raw["throughput"][i] = timestamps[-1] / len(timestamps) if timestamps[-1] > 0 else np.inf
+
+    costs = {metric: _grouped_median(codes, values, len(query_index)) for metric, values in raw.items()}
+    return list(query_index), costs, np.array(refinement, dtype=bool)
+
+
+@profiled()
+def cost_matrix(locations, metric="time", filter_mode="all", timeout_ms=None, labels=None):
+    """
+    Aligns the median costs of a metric of every file into a (query x configuration) matrix over the
+    union of their queries, with inf where a configuration failed or did not run a query.
+
+    Parameters:
+        locations: Result files, one per configuration.
+        metric: One of METRICS.
+        filter_mode: "all", "refinement_only" or "no_refinement", applied per query.
+        timeout_ms: Repetitions taking at least this long count as failed.
+        labels: Labels of the configurations, get_algorithm_labels(locations) by default.
+
+    Returns (costs, labels).
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Invalid metric {metric}, choose one of {', '.join(METRICS)}")
+    per_file = [query_costs(location, timeout_ms) for location in locations]
+
+    query_index, refinement = {}, []
+    for queries, _, file_refinement in per_file:
+        for query, is_refinement in zip(queries, file_refinement):
+            if query not in query_index:
+                query_index[query] = len(query_index)
+                refinement.append(is_refinement)
+
+    costs = np.full((len(query_index), len(locations)), np.inf)
+    for column, (queries, file_costs, _) in enumerate(per_file):
+        rows = np.fromiter((query_index[query] for query in queries), dtype=np.int64, count=len(queries))
+        costs[rows, column] = file_costs[metric]
+
+    refinement = np.array(refinement, dtype=bool)
+    if filter_mode == "refinement_only":
+        costs = costs[refinement]
+    elif filter_mode == "no_refinement":
+        costs = costs[~refinement]
+    return costs, labels if labels is not None else get_algorithm_labels(locations)
+
+
+def performance_ratios(costs):
+    """
+    Ratio of every cost to the best cost of its query (row). Queries no configuration completed
+    have an infinite ratio everywhere; a configuration matching a best cost of 0 has ratio 1.
+    """
+    best = costs.min(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = costs / best
+    ratios[costs == best] = 1.0
+    ratios[~np.isfinite(best[:, 0])] = np.inf
+    return ratios
+
+
+def tau_grid(ratios, n_points=200, max_tau=None):
+    """Log-spaced taus from 1 to max_tau (default: 1.1 x the largest finite ratio, at least 2)."""
+    if max_tau is None:
+        finite = ratios[np.isfinite(ratios)]
+        max_tau = max(2.0, finite.max() * 1.1) if len(finite) > 0 else 2.0
+    return np.logspace(0, np.log10(max_tau), n_points)
+
+
+def performance_profile(ratios, taus=None):
+    """
+    Evaluates the performance profile of every configuration (column of ratios) on taus.
+
+    Returns (taus, profiles), profiles[c, t] being the fraction of queries configuration c solves
+    within a factor taus[t] of the best configuration.
+    """
+    if taus is None:
+        taus = tau_grid(ratios)
+    n_queries = ratios.shape[0]
+    if n_queries == 0:
+        return taus, np.zeros((ratios.shape[1], len(taus)))
+    sorted_ratios = np.sort(ratios, axis=0)
+    profiles = np.vstack([
+        np.searchsorted(sorted_ratios[:, column], taus, side='right') for column in range(ratios.shape[1])
+    ]) / n_queries
+    return taus, profiles
+
+
+def profile_from_files(locations, metric="time", filter_mode="all", timeout_ms=None, taus=None, labels=None):
+    """cost_matrix, performance_ratios and performance_profile in one call, returns (taus, profiles, labels)."""
+    costs, labels = cost_matrix(locations, metric, filter_mode, timeout_ms, labels)
+    taus, profiles = performance_profile(performance_ratios(costs), taus)
+    return taus, profiles, labels
@@ -0,0 +1,221 @@
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+_enabled = False
+_records = []
+_accumulated = defaultdict(lambda: {"calls": 0, "wall": 0.0, "cpu": 0.0})
+_lock = threading.Lock()
+_origin = time.perf_counter()
+
+
+class StageRecord:
+    """Measurements of a single execution of a pipeline stage."""
+    __slots__ = ("name", "start", "wall", "cpu", "entries", "peak_rss_mb", "tid", "depth")
+
+    def __init__(self, name, entries=None):
+        self.name = name
+        self.entries = entries
+        self.start = 0.0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_rss_mb = None
+        self.tid = threading.get_ident()
+        self.depth = 0
+
+
+_depth = threading.local()
+
+
+def peak_rss_mb():
+    """Peak resident set size of the process so far, in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def enable_profiling(trace_path=None, summary=True):
+    """
+    Starts recording stage timings. At interpreter exit the recorded stages are written as a
+    Chrome trace (chrome://tracing, Perfetto) to trace_path and/or printed as a summary table.
+    """
+    global _enabled
+    _enabled = True
+    if trace_path:
+        atexit.register(write_chrome_trace, trace_path)
+    if summary:
+        atexit.register(print_summary)
+
+
+def profiling_enabled():
+    return _enabled
+
+
+@contextmanager
+def stage(name, entries=None):
+    """
+    Context manager timing a pipeline stage. Records wall time, CPU time, the number of entries
+    processed and the peak RSS. The number of entries may also be set on the yielded record, e.g.
+    `with stage("parse") as s: ...; s.entries = len(data)`. Does nothing unless profiling is enabled.
+    """
+    record = StageRecord(name, entries)
+    if not _enabled:
+        yield record
+        return
+
+    record.depth = getattr(_depth, "value", 0)
+    _depth.value = record.depth + 1
+    start_wall = time.perf_counter()
+    start_cpu = time.thread_time()
+    try:
+        yield record
+    finally:
+        record.wall = time.perf_counter() - start_wall
+        record.cpu = time.thread_time() - start_cpu
+        record.start = start_wall - _origin
+        record.peak_rss_mb = peak_rss_mb()
+        _depth.value = record.depth
+        with _lock:
+            _records.append(record)
+
+
+def profiled(name=None):
+    """Decorator version of stage, using the qualified function name by default."""
+    def decorator(func):
+        stage_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def accumulated(name=None):
+    """
+    Decorator for small functions called once per entry (e.g. decoding a cache state). Instead of
+    recording every call, the calls, wall time and CPU time are summed per name and reported as a
+    single row in the summary. Adds only a flag check when profiling is disabled.
+    """
+    def decorator(func):
+        stage_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start_wall = time.perf_counter()
+            start_cpu = time.thread_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                wall = time.perf_counter() - start_wall
+                cpu = time.thread_time() - start_cpu
+                # May be called from reader threads, see load_raw_data.prefetch_ordered
+                with _lock:
+                    totals = _accumulated[stage_name]
+                    totals["calls"] += 1
+                    totals["wall"] += wall
+                    totals["cpu"] += cpu
+        return wrapper
+    return decorator
+
+
+def get_records():
+    with _lock:
+        return list(_records)
+
+
+def reset():
+    with _lock:
+        _records.clear()
+        _accumulated.clear()
+
+
+def write_chrome_trace(path):
+    """Writes the recorded stages as complete ("X") events in the Chrome trace event format."""
+    pid = os.getpid()
+    events = []
+    for record in get_records():
+        events.append({
+            "name": record.name,
+            "cat": "pipeline",
+            "ph": "X",
+            "ts": record.start * 1e6,
+            "dur": record.wall * 1e6,
+            "pid": pid,
+            "tid": record.tid,
+            "args": {
+                "cpu_ms": record.cpu * 1000,
+                "entries": record.entries,
+                "peak_rss_mb": record.peak_rss_mb,
+            },
+        })
+    for name, totals in _accumulated.items():
+        # Per-call functions are summarized in a single instant event at the end of the trace
+        events.append({
+            "name": f"{name} (accumulated)",
+            "cat": "accumulated",
+            "ph": "i",
+            "s": "p",
+            "ts": (time.perf_counter() - _origin) * 1e6,
+            "pid": pid,
+            "tid": 0,
+            "args": {"calls": totals["calls"], "wall_ms": totals["wall"] * 1000, "cpu_ms": totals["cpu"] * 1000},
+        })
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    print(f"Profiling trace written to {path}")
+
+
+def summarize():
+    """Aggregates the recorded stages per name: calls, wall/CPU time, entries and peak RSS."""
+    summary = defaultdict(lambda: {"calls": 0, "wall": 0.0, "cpu": 0.0, "entries": 0, "peak_rss_mb": 0.0})
+    for record in get_records():
+        row = summary[record.name]
+        row["calls"] += 1
+        row["wall"] += record.wall
+        row["cpu"] += record.cpu
+        row["entries"] += record.entries or 0
+        row["peak_rss_mb"] = max(row["peak_rss_mb"], record.peak_rss_mb or 0.0)
+    for name, totals in _accumulated.items():
+        row = summary[f"{name} (accumulated)"]
+        row["calls"] += totals["calls"]
+        row["wall"] += totals["wall"]
+        row["cpu"] += totals["cpu"]
+        row["entries"] += totals["calls"]
+    return dict(summary)
+
+
+def print_summary():
+    summary = summarize()
+    if not summary:
+        return
+    header = f"{'stage':<50} {'calls':>6} {'wall (s)':>10} {'cpu (s)':>10} {'entries':>10} {'entries/s':>12} {'peak RSS MB':>12}"
+    print(header)
+    print("-" * len(header))
+    for name, row in sorted(summary.items(), key=lambda item: -item[1]["wall"]):
+        rate = f"{row['entries'] / row['wall']:,.0f}" if row["entries"] and row["wall"] > 0 else "-"
+        print(f"{name:<50} {row['calls']:>6} {row['wall']:>10.3f} {row['cpu']:>10.3f} {row['entries']:>10} "
+              f"{rate:>12} {row['peak_rss_mb']:>12.1f}")
+
+
+# PIPELINE_PROFILE=1 prints a summary at exit, PIPELINE_PROFILE=<path>.json also writes a Chrome trace
+if os.environ.get("PIPELINE_PROFILE"):
+    _setting = os.environ["PIPELINE_PROFILE"]
+    enable_profiling(trace_path=None if _setting == "1" else _setting)
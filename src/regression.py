@@ -0,0 +1,265 @@
+"""
+Performance-regression detection between a baseline and a candidate benchmark run.
+
+Executions are aligned by template and repetition index (the i-th execution of a template in the
+candidate is paired with the i-th execution in the baseline). Per template, three changes are tested:
+    - slowdown: geometric mean of the paired time ratios candidate/baseline, with a bootstrap
+      confidence interval, and a Mann-Whitney test of the times. Pairs where either execution
+      failed are left out, failures are judged by the error rate.
+    - error rate increase: one-sided two-proportion z-test.
+    - hit rate drop: difference of the mean hit rates, and a Mann-Whitney test of the hit rates.
+P-values are Holm-corrected over the templates of a file. A change is flagged when it is significant
+and larger than its threshold; compare_runs returns a machine-readable verdict (passed is False if
+anything was flagged) and compare_table a summary table of it.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import special
+
+try:
+    from src.bootstrap import chunk_tasks, filter_mask, group_columns, percentile_interval, run_tasks, \
+        statistics_from_sums
+    from src.load_raw_data import find_result_files, load_json, parse_cache_state, result_label
+    from src.profiling import profiled
+    from src.result_cache import memoize
+    from src.significance import adjust_p_values, rank_tests
+except ModuleNotFoundError:
+    from bootstrap import chunk_tasks, filter_mask, group_columns, percentile_interval, run_tasks, \
+        statistics_from_sums
+    from load_raw_data import find_result_files, load_json, parse_cache_state, result_label
+    from profiling import profiled
+    from result_cache import memoize
+    from significance import adjust_p_values, rank_tests
+
+DEFAULT_THRESHOLDS = {
+    "slowdown": 1.10,  # Geometric mean of the time ratios candidate/baseline
+    "error_rate": 0.01,  # Absolute increase of the error rate
+    "hit_rate": 0.02,  # Absolute drop of the mean hit rate
+}
+
+
+@memoize
+def template_metrics(location, timeout_ms=180000):
+    """
+    Returns {template: dict of arrays} with time, failed (error or time >= timeout_ms), refinement,
+    hit_rate and cache_valid of every execution of the template, in file order.
+    """
+    columns = {}
+    for entry in load_json(location):
+        seq_element = entry.get('sequenceElement', {})
+        template = seq_element.get('template')
+        if template is None:
+            continue
+        row = columns.setdefault(template, {"time": [], "failed": [], "refinement": [], "hit_rate": [],
+                                            "cache_valid": []})
+        time_ms = entry.get('time', 0)
+        row["time"].append(time_ms)
+        row["failed"].append('error' in entry or time_ms >= timeout_ms)
+        row["refinement"].append(len(seq_element.get('refinementMetadata', {}).values()) > 0)
+        try:
+            cache_state = parse_cache_state(entry)
+            hits, misses = cache_state.get('hits', 0), cache_state.get('misses', 0)
+            row["hit_rate"].append(hits / (hits + misses) if hits + misses > 0 else 0.0)
+            row["cache_valid"].append(True)
+        except (ValueError, KeyError, TypeError):
+            row["hit_rate"].append(0.0)
+            row["cache_valid"].append(False)
+    return {
+        template: {
+            "time": np.array(row["time"], dtype=np.float64),
+            "failed": np.array(row["failed"], dtype=bool),
+            "refinement": np.array(row["refinement"], dtype=bool),
+            "hit_rate": np.array(row["hit_rate"], dtype=np.float64),
+            "cache_valid": np.array(row["cache_valid"], dtype=bool),
+        }
+        for template, row in columns.items()
+    }
+
+
+def proportion_increase_p_value(errors_base, n_base, errors_candidate, n_candidate):
+    """One-sided p-value of a two-proportion z-test that the candidate proportion is larger."""
+    if n_base == 0 or n_candidate == 0:
+        return np.nan
+    pooled = (errors_base + errors_candidate) / (n_base + n_candidate)
+    variance = pooled * (1 - pooled) * (1 / n_base + 1 / n_candidate)
+    if variance == 0:
+        return 1.0
+    z = (errors_candidate / n_candidate - errors_base / n_base) / np.sqrt(variance)
+    return float(special.ndtr(-z))
+
+
+def _rank_p_value(baseline, candidate):
+    if len(baseline) == 0 or len(candidate) == 0:
+        return np.nan
+    return float(rank_tests([baseline, candidate])["p"][0, 1])
+
+
+@profiled()
+def compare_files(baseline, candidate, filter_mode="all", thresholds=None, alpha=0.05, n_resamples=2000,
+                  confidence=0.95, timeout_ms=180000, seed=0, workers=None):
+    """
+    Per-template comparison of a candidate result file with a baseline result file.
+
+    Parameters:
+        baseline, candidate: Result files.
+        filter_mode: "all", "refinement_only" or "no_refinement".
+        thresholds: Minimal changes to flag, DEFAULT_THRESHOLDS updated with this dict.
+        alpha: Significance level of the Holm-corrected p-values.
+        n_resamples: Bootstrap resamples of the slowdown interval.
+        confidence: Confidence level of the slowdown interval.
+        seed: Seed of the bootstrap, the comparison is reproducible for a given seed.
+        workers: Number of processes the bootstrap runs in (None: in this process).
+
+    Returns a list of dicts, one per template both files ran, with the measured changes, their
+    (corrected) p-values and the list of flags ("slowdown", "error_rate", "hit_rate").
+    """
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    base_columns = template_metrics(baseline, timeout_ms)
+    candidate_columns = template_metrics(candidate, timeout_ms)
+    templates = sorted(set(base_columns) & set(candidate_columns))
+
+    rows, tasks, task_ranges, all_columns = [], [], [], []
+    root_seed = np.random.SeedSequence(seed)
+    for template_index, template in enumerate(templates):
+        base, cand = base_columns[template], candidate_columns[template]
+        n = min(len(base["time"]), len(cand["time"]))
+        base = {key: values[:n] for key, values in base.items()}
+        cand = {key: values[:n] for key, values in cand.items()}
+        mask = filter_mask(base["failed"], base["refinement"], filter_mode) \
+            & filter_mask(cand["failed"], cand["refinement"], filter_mode)
+        completed = mask & ~base["failed"] & ~cand["failed"]
+        hit_rate_valid = mask & base["cache_valid"] & cand["cache_valid"]
+
+        row = {
+            "template": template,
+            "n": int(mask.sum()),
+            "n_completed": int(completed.sum()),
+            "baseline_errors": int(base["failed"][mask].sum()),
+            "candidate_errors": int(cand["failed"][mask].sum()),
+        }
+        row["baseline_error_rate"] = row["baseline_errors"] / row["n"] if row["n"] else np.nan
+        row["candidate_error_rate"] = row["candidate_errors"] / row["n"] if row["n"] else np.nan
+        row["error_rate_p"] = proportion_increase_p_value(row["baseline_errors"], row["n"],
+                                                         row["candidate_errors"], row["n"])
+        row["baseline_hit_rate"] = float(base["hit_rate"][hit_rate_valid].mean()) if hit_rate_valid.any() else np.nan
+        row["candidate_hit_rate"] = float(cand["hit_rate"][hit_rate_valid].mean()) if hit_rate_valid.any() \
+            else np.nan
+        row["hit_rate_p"] = _rank_p_value(base["hit_rate"][hit_rate_valid], cand["hit_rate"][hit_rate_valid])
+        row["time_p"] = _rank_p_value(base["time"][completed], cand["time"][completed])
+        rows.append(row)
+
+        columns = None
+        if row["n_completed"] > 0:
+            # Speedup of the baseline over the candidate is the slowdown of the candidate
+            columns = group_columns(base["time"][completed], cand["time"][completed])
+            group_seed = np.random.SeedSequence(root_seed.entropy, spawn_key=(template_index,))
+            group_tasks = chunk_tasks(columns, n_resamples, group_seed)
+            task_ranges.append((len(tasks), len(tasks) + len(group_tasks)))
+            tasks.extend(group_tasks)
+        else:
+            task_ranges.append((len(tasks), len(tasks)))
+        all_columns.append(columns)
+
+    results = run_tasks(tasks, workers)
+    for row, (start, end), columns in zip(rows, task_ranges, all_columns):
+        if columns is None:
+            row["slowdown"] = row["slowdown_low"] = row["slowdown_high"] = np.nan
+            continue
+        row["slowdown"] = float(statistics_from_sums(columns.sum(axis=1), columns.shape[1])["geo_speedup"])
+        resamples = np.concatenate([results[i]["geo_speedup"] for i in range(start, end)])
+        row["slowdown_low"], row["slowdown_high"] = percentile_interval(resamples, confidence)
+
+    for p_column in ("time_p", "error_rate_p", "hit_rate_p"):
+        adjusted = adjust_p_values([row[p_column] for row in rows], "holm")
+        for row, p_value in zip(rows, adjusted):
+            row[p_column + "_adjusted"] = float(p_value)
+
+    for row in rows:
+        flags = []
+        if row["slowdown"] >= thresholds["slowdown"] and row["slowdown_low"] > 1 and row["time_p_adjusted"] < alpha:
+            flags.append("slowdown")
+        if row["candidate_error_rate"] - row["baseline_error_rate"] >= thresholds["error_rate"] \
+                and row["error_rate_p_adjusted"] < alpha:
+            flags.append("error_rate")
+        if row["baseline_hit_rate"] - row["candidate_hit_rate"] >= thresholds["hit_rate"] \
+                and row["hit_rate_p_adjusted"] < alpha:
+            flags.append("hit_rate")
+        row["flags"] = flags
+    return rows
+
+
+def pair_result_files(baseline, candidate):
+    """
+    Pairs the files of two runs: two files are compared directly, two directories by label
+    (query-results-raw-<label>.json). Returns [(label, baseline file, candidate file)].
+    """
+    if not (os.path.isdir(baseline) and os.path.isdir(candidate)):
+        return [(result_label(candidate), baseline, candidate)]
+    base_files = {result_label(path): path for path in find_result_files(baseline)}
+    candidate_files = {result_label(path): path for path in find_result_files(candidate)}
+    for label in sorted(set(base_files) ^ set(candidate_files)):
+        print(f"Warning: {label} is only in the {'baseline' if label in base_files else 'candidate'} run, skipped")
+    return [(label, base_files[label], candidate_files[label]) for label in base_files if label in candidate_files]
+
+
+def _json_value(value):
+    if isinstance(value, (np.floating, float)):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+def compare_runs(baseline, candidate, **kwargs):
+    """
+    Compares a candidate run with a baseline run (two result files, or two directories of result
+    files paired by label) with compare_files. Returns the verdict as a JSON-serializable dict:
+    passed, the flagged regressions, and the per-file, per-template comparisons.
+    """
+    files = []
+    regressions = []
+    for label, base_file, candidate_file in pair_result_files(str(baseline), str(candidate)):
+        rows = [{key: _json_value(value) for key, value in row.items()}
+                for row in compare_files(base_file, candidate_file, **kwargs)]
+        files.append({"label": label, "baseline": base_file, "candidate": candidate_file, "templates": rows})
+        regressions += [{"label": label, "template": row["template"], "flag": flag}
+                        for row in rows for flag in row["flags"]]
+    return {
+        "baseline": str(baseline),
+        "candidate": str(candidate),
+        "settings": {key: value for key, value in kwargs.items() if key != "workers"},
+        "passed": not regressions,
+        "regressions": regressions,
+        "files": files,
+    }
+
+
+def _format(value, precision=3):
+    return "nan" if value is None else f"{value:.{precision}f}"
+
+
+def compare_table(verdict):
+    """Summary table of a compare_runs verdict, one row per (file, template)."""
+    rows = []
+    for file in verdict["files"]:
+        for row in file["templates"]:
+            rows.append({
+                "label": file["label"],
+                "template": row["template"],
+                "n": row["n"],
+                "slowdown": _format(row["slowdown"]),
+                "slowdown_ci": f"[{_format(row['slowdown_low'])}, {_format(row['slowdown_high'])}]",
+                "time_p": _format(row["time_p_adjusted"], 4),
+                "errors": f"{row['baseline_errors']} -> {row['candidate_errors']}",
+                "hit_rate": f"{_format(row['baseline_hit_rate'])} -> {_format(row['candidate_hit_rate'])}",
+                "flags": ",".join(row["flags"]),
+            })
+    return pd.DataFrame(rows)
+
+
+def write_verdict(verdict, path):
+    with open(path, 'w') as f:
+        json.dump(verdict, f, indent=2)
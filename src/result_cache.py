@@ -0,0 +1,265 @@
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+
+try:
+    from src.staging_manifest import file_digest, manifest_digest
+except ModuleNotFoundError:
+    from staging_manifest import file_digest, manifest_digest
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "ANALYSIS_CACHE_DIR", str(Path(__file__).resolve().parent.parent / ".analysis_cache")
+)
+UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_byte_size(value):
+    """Bytes of a size given as a number of bytes or a string like "512M" or "2G"."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    value = value.strip().upper().removesuffix("B")
+    if value and value[-1] in UNITS:
+        return int(float(value[:-1]) * UNITS[value[-1]])
+    return int(value)
+
+
+DEFAULT_MAX_BYTES = parse_byte_size(os.environ.get("ANALYSIS_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+CACHE_ENABLED = os.environ.get("ANALYSIS_CACHE", "1") != "0"
+
+
+class ResultCache:
+    """
+    Disk-backed store for analysis results. Entries are pickled, zlib-compressed blobs on disk,
+    indexed in a small SQLite database that tracks their size and last access time. When the
+    total size exceeds max_bytes the least recently used entries are evicted.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._fingerprints = {}
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS entries ("
+                         "key TEXT PRIMARY KEY, function TEXT, size INTEGER, created REAL, last_access REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)")
+            conn.execute("CREATE TABLE IF NOT EXISTS fingerprints ("
+                         "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT)")
+
+    def _connect(self):
+        return sqlite3.connect(self.directory / "index.sqlite", timeout=30)
+
+    def _entry_path(self, key):
+        return self.directory / key[:2] / f"{key}.pkl.z"
+
+    def _count(self, conn, name):
+        conn.execute("INSERT INTO stats (name, value) VALUES (?, 1) "
+                     "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get(self, key):
+        """Returns (True, value) on a hit and (False, None) on a miss."""
+        path = self._entry_path(key)
+        with self._connect() as conn:
+            row = conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or not path.exists():
+                self._count(conn, "misses")
+                return False, None
+            try:
+                with open(path, 'rb') as f:
+                    value = pickle.loads(zlib.decompress(f.read()))
+            except (OSError, zlib.error, pickle.UnpicklingError, EOFError):
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._count(conn, "misses")
+                return False, None
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._count(conn, "hits")
+        return True, value
+
+    def put(self, key, value, function_name=""):
+        blob = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 3)
+        if len(blob) > self.max_bytes:
+            return
+        path = self._entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO entries (key, function, size, created, last_access) "
+                         "VALUES (?, ?, ?, ?, ?)", (key, function_name, len(blob), now, now))
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes."""
+        with self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access ASC").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._entry_path(key).unlink(missing_ok=True)
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._count(conn, "evictions")
+                total -= size
+
+    def clear(self):
+        with self._connect() as conn:
+            for (key,) in conn.execute("SELECT key FROM entries").fetchall():
+                self._entry_path(key).unlink(missing_ok=True)
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM stats")
+
+    def stats(self):
+        with self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "evictions": counters.get("evictions", 0),
+            "hit_rate": hits / (hits + misses) if hits + misses > 0 else 0.0,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+    def fingerprint(self, path):
+        """
+        Content fingerprint of a file or directory. File digests are remembered per
+        (size, mtime), so unchanged files are only hashed once. Directories are fingerprinted
+        on the names, sizes and modification times of the files they contain.
+        """
+        path = Path(path).resolve()
+        if path.is_dir():
+            digest = hashlib.blake2b(digest_size=16)
+            for child in sorted(path.rglob("*")):
+                if child.is_file():
+                    st = child.stat()
+                    digest.update(f"{child.relative_to(path)}:{st.st_size}:{st.st_mtime_ns}\n".encode('utf-8'))
+            return digest.hexdigest()
+
+        st = path.stat()
+        stat_key = (str(path), st.st_size, st.st_mtime_ns)
+        if stat_key in self._fingerprints:
+            return self._fingerprints[stat_key]
+
+        with self._connect() as conn:
+            row = conn.execute("SELECT digest FROM fingerprints WHERE path = ? AND size = ? AND mtime_ns = ?",
+                               stat_key).fetchone()
+        if row is not None:
+            self._fingerprints[stat_key] = row[0]
+            return row[0]
+
+        # Staged files carry their hash in the staging manifest, see scratch/process_random_new.py
+        value = manifest_digest(path) or file_digest(path)
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO fingerprints (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)",
+                         (*stat_key, value))
+        self._fingerprints[stat_key] = value
+        return value
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResultCache()
+    return _default_cache
+
+
+def _normalize_argument(value, cache, is_path=False):
+    """
+    A hashable representation of an argument. If is_path is set, paths to existing files/directories
+    (also inside lists, tuples, sets and dicts) are replaced by their content fingerprint.
+    """
+    if is_path and isinstance(value, (str, os.PathLike)) and os.path.exists(value):
+        return ("path", cache.fingerprint(value))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = [_normalize_argument(v, cache, is_path) for v in value]
+        if isinstance(value, (set, frozenset)):
+            items = sorted(items, key=repr)
+        return (type(value).__name__, tuple(items))
+    if isinstance(value, dict):
+        return ("dict", tuple(sorted((repr(k), _normalize_argument(v, cache, is_path)) for k, v in value.items())))
+    return repr(value)
+
+
+@functools.lru_cache(maxsize=None)
+def _source_digest(path):
+    try:
+        return hashlib.blake2b(Path(path).read_bytes(), digest_size=8).hexdigest()
+    except OSError:
+        return ""
+
+
+def _function_identity(func):
+    """
+    Name and source hash of a memoized function. The hash covers the function, its module and every
+    module of src, so changes to the helpers it calls also invalidate its entries.
+    """
+    try:
+        source = inspect.getsource(func)
+        module_file = inspect.getsourcefile(func)
+    except (OSError, TypeError):
+        source, module_file = "", None
+    digests = [_source_digest(module_file)] if module_file else []
+    digests += [_source_digest(path) for path in sorted(Path(__file__).resolve().parent.glob("*.py"))]
+    # Use the bare module name, so "src.load_raw_data" and "load_raw_data" share entries
+    module = func.__module__.rsplit('.', 1)[-1]
+    source_hash = hashlib.blake2b("\n".join([source] + digests).encode('utf-8'), digest_size=8).hexdigest()
+    return f"{module}.{func.__qualname__}", source_hash
+
+
+def memoize(func=None, *, cache=None, paths=("location",)):
+    """
+    Decorator that persists the results of an analysis function on disk.
+
+    The cache key combines the function name and source (see _function_identity), the bound
+    arguments and the content fingerprints of the files/directories passed in the parameters named
+    in paths (the location by default, e.g. @memoize(paths=("files",)) for a list of files), so
+    results are recomputed when the code, the parameters or the input files change. The undecorated
+    function is available as .uncached. Set ANALYSIS_CACHE=0 to disable caching.
+    """
+    if func is None:
+        return functools.partial(memoize, cache=cache, paths=paths)
+
+    signature = inspect.signature(func)
+    unknown = set(paths) - set(signature.parameters)
+    if unknown:
+        raise TypeError(f"{func.__qualname__} has no parameters {', '.join(sorted(unknown))} to fingerprint")
+    name, source_hash = _function_identity(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not CACHE_ENABLED:
+            return func(*args, **kwargs)
+        store = cache or get_default_cache()
+
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = tuple((k, _normalize_argument(v, store, k in paths)) for k, v in bound.arguments.items())
+        key = hashlib.blake2b(repr((name, source_hash, arguments)).encode('utf-8'), digest_size=20).hexdigest()
+
+        hit, value = store.get(key)
+        if hit:
+            return value
+        value = func(*args, **kwargs)
+        store.put(key, value, function_name=name)
+        return value
+
+    wrapper.uncached = func
+    return wrapper
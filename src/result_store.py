@@ -0,0 +1,311 @@
+import json
+import math
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from src.data_analysis import parse_algorithm_label
+    from src.load_raw_data import load_json, natural_sort_key, parse_cache_state, result_label
+    from src.profiling import profiled, stage
+except ModuleNotFoundError:
+    from data_analysis import parse_algorithm_label
+    from load_raw_data import load_json, natural_sort_key, parse_cache_state, result_label
+    from profiling import profiled, stage
+
+DEFAULT_STORE_PATH = os.environ.get(
+    "ANALYSIS_STORE_PATH", str(Path(__file__).resolve().parent.parent / "output" / "results.sqlite")
+)
+
+# Columns that can be aggregated with ResultStore.aggregate, mapped to their SQL expression
+METRICS = {
+    "time": "time",
+    "results": "results",
+    "http_requests": "http_requests",
+    "hits": "hits",
+    "misses": "misses",
+    "hit_rate": "CASE WHEN hits + misses > 0 THEN CAST(hits AS REAL) / (hits + misses) ELSE 0.0 END",
+    "eviction_percentage": "eviction_percentage",
+    "evictions": "evictions",
+    "error": "has_error",
+}
+AGGREGATES = {
+    "avg": "AVG({})",
+    "sum": "SUM({})",
+    "min": "MIN({})",
+    "max": "MAX({})",
+    "count": "COUNT({})",
+    "geo_mean": "py_exp(AVG(py_ln({})))",
+}
+# Columns that can be filtered on and grouped by
+COLUMNS = ["label", "algorithm", "size", "name", "id", "step", "template", "session_id", "refinement",
+           "has_error", "cache_valid"]
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS files ("
+    "file_id INTEGER PRIMARY KEY, path TEXT UNIQUE, label TEXT, algorithm TEXT, size TEXT, "
+    "file_size INTEGER, mtime_ns INTEGER, n_entries INTEGER, ingested REAL)",
+    "CREATE TABLE IF NOT EXISTS executions ("
+    "file_id INTEGER, seq INTEGER, label TEXT, algorithm TEXT, size TEXT, name TEXT, id TEXT, step INTEGER, "
+    "template TEXT, session_id TEXT, refinement INTEGER, time REAL, results INTEGER, http_requests INTEGER, "
+    "has_error INTEGER, error TEXT, cache_valid INTEGER, hits INTEGER, misses INTEGER, "
+    "eviction_percentage REAL, evictions INTEGER, timestamps TEXT)",
+    "CREATE INDEX IF NOT EXISTS executions_algorithm_template ON executions (algorithm, template)",
+    "CREATE INDEX IF NOT EXISTS executions_algorithm_name_id ON executions (algorithm, name, id)",
+    "CREATE INDEX IF NOT EXISTS executions_session ON executions (session_id)",
+    # Used by the per-file accessors
+    "CREATE INDEX IF NOT EXISTS executions_file ON executions (file_id, name, step)",
+]
+
+
+def _safe_ln(value):
+    return math.log(value) if value is not None and value > 0 else None
+
+
+def _safe_exp(value):
+    # SQLite only has EXP when compiled with its math functions
+    return math.exp(value) if value is not None else None
+
+
+def entry_to_row(entry):
+    """Flattens a result entry into the columns of the executions table (without file metadata)."""
+    seq_element = entry.get('sequenceElement', {})
+    try:
+        step = int(entry['id'])
+    except (ValueError, KeyError, TypeError):
+        step = None
+    try:
+        cache_state = parse_cache_state(entry)
+        cache_valid = 1
+    except (ValueError, KeyError, TypeError):
+        cache_state = {}
+        cache_valid = 0
+    error = entry.get('error')
+    return (
+        entry.get('name'), entry.get('id'), step, seq_element.get('template'),
+        seq_element.get('session', {}).get('sessionId'),
+        int(len(seq_element.get('refinementMetadata', {}).values()) > 0),
+        entry.get('time', 0), entry.get('results', 0), entry.get('httpRequests', 0),
+        int('error' in entry), error if error is None or isinstance(error, str) else json.dumps(error),
+        cache_valid, cache_state.get('hits', 0), cache_state.get('misses', 0),
+        cache_state.get('evictionPercentage', 0), cache_state.get('evictions', 0),
+        json.dumps(entry.get('timestamps', [])),
+    )
+
+
+class ResultStore:
+    """
+    Embedded SQLite database holding the entries of every ingested result file, one row per query
+    execution with its parsed cache state and the algorithm/size parsed from the filename.
+    Files are re-ingested automatically when their size or modification time changes.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30)
+        self._conn.create_function("py_ln", 1, _safe_ln, deterministic=True)
+        self._conn.create_function("py_exp", 1, _safe_exp, deterministic=True)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+
+    def close(self):
+        self._conn.close()
+
+    def execute(self, sql, params=()):
+        """Runs an ad-hoc SQL query and returns all rows."""
+        return self._conn.execute(sql, params).fetchall()
+
+    def files(self):
+        return self.execute("SELECT path, label, algorithm, size, n_entries FROM files ORDER BY path")
+
+    def _file_row(self, location):
+        return self._conn.execute("SELECT file_id, file_size, mtime_ns FROM files WHERE path = ?",
+                                  (str(Path(location).resolve()),)).fetchone()
+
+    def is_current(self, location):
+        row = self._file_row(location)
+        if row is None:
+            return False
+        st = os.stat(location)
+        return row[1] == st.st_size and row[2] == st.st_mtime_ns
+
+    @profiled()
+    def ingest(self, location, force=False):
+        """
+        Loads a result file into the store, replacing earlier rows of the same file.
+        Skips files that did not change since they were ingested, unless force is set.
+
+        Returns the number of ingested entries (0 if the file was skipped).
+        """
+        if not force and self.is_current(location):
+            return 0
+        path = str(Path(location).resolve())
+        st = os.stat(location)
+        label = result_label(location)
+        algorithm, size = parse_algorithm_label(location)
+        data = load_json(location)
+
+        with stage("store_insert", entries=len(data)), self._conn:
+            old = self._file_row(location)
+            if old is not None:
+                self._conn.execute("DELETE FROM executions WHERE file_id = ?", (old[0],))
+                self._conn.execute("DELETE FROM files WHERE file_id = ?", (old[0],))
+            file_id = self._conn.execute(
+                "INSERT INTO files (path, label, algorithm, size, file_size, mtime_ns, n_entries, ingested) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, label, algorithm, size, st.st_size, st.st_mtime_ns, len(data), time.time())
+            ).lastrowid
+            self._conn.executemany(
+                "INSERT INTO executions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((file_id, seq, label, algorithm, size, *entry_to_row(entry)) for seq, entry in enumerate(data))
+            )
+        return len(data)
+
+    def ensure(self, location):
+        """Ingests location if needed and returns its file_id."""
+        self.ingest(location)
+        return self._file_row(location)[0]
+
+    def _file_filter(self, location, filter_mode, drop_always_errors, timeout_ms):
+        """
+        SQL condition and parameters selecting the entries of a file, mirroring the filter_mode and
+        drop_always_errors options of the load_raw_data accessors. A timeout_ms of None counts only
+        explicit errors when determining the templates that always fail.
+        """
+        file_id = self.ensure(location)
+        conditions, params = ["file_id = ?"], [file_id]
+        if filter_mode == "refinement_only":
+            conditions.append("refinement = 1")
+        elif filter_mode == "no_refinement":
+            conditions.append("refinement = 0")
+        if drop_always_errors:
+            failed = "has_error" if timeout_ms is None else "(has_error OR time >= ?)"
+            conditions.append(
+                "(template IS NULL OR template NOT IN ("
+                "SELECT template FROM executions WHERE file_id = ? AND template IS NOT NULL AND template != '' "
+                f"GROUP BY template HAVING SUM({failed}) = COUNT(*)))"
+            )
+            params.append(file_id)
+            if timeout_ms is not None:
+                params.append(timeout_ms)
+        return " AND ".join(conditions), params
+
+    def _per_step(self, where, params, expressions):
+        rows = self.execute(f"SELECT name, step, {', '.join(expressions)} FROM executions "
+                            f"WHERE {where} AND step IS NOT NULL GROUP BY name, step ORDER BY name, step", params)
+        per_sequence = {}
+        for name, _, *values in rows:
+            per_sequence.setdefault(name, []).append(values)
+        return {name: np.array(per_sequence[name], dtype=float).T
+                for name in sorted(per_sequence, key=natural_sort_key)}
+
+    def cumulative_data_per_sequence(self, location, filter_mode="all", drop_always_errors=False):
+        """Store-backed equivalent of load_raw_data.get_cumulative_data_per_sequence."""
+        where, params = self._file_filter(location, filter_mode, drop_always_errors, None)
+        results = {}
+        for name, (avg_times, avg_results) in self._per_step(where, params, ["AVG(time)", "AVG(results)"]).items():
+            results[name] = {
+                'averages': avg_times,
+                'cumulative': np.cumsum(avg_times),
+                'average_results': avg_results,
+                'cumulative_results': np.cumsum(avg_results)
+            }
+        return results
+
+    def cache_metrics_per_sequence(self, location, filter_mode="all", drop_always_errors=False, timeout_ms=180000):
+        """Store-backed equivalent of load_raw_data.get_cache_metrics_per_sequence."""
+        where, params = self._file_filter(location, filter_mode, drop_always_errors, timeout_ms)
+        per_step = self._per_step(f"{where} AND cache_valid = 1", params,
+                                  [f"AVG({METRICS['hit_rate']})", "AVG(eviction_percentage)"])
+        return {name: {'hitrates': hitrates, 'eviction_percentages': evictions}
+                for name, (hitrates, evictions) in per_step.items()}
+
+    def raw_metrics(self, location, filter_mode="all", drop_always_errors=False, timeout_ms=180000):
+        """Store-backed equivalent of load_raw_data.get_raw_metrics."""
+        where, params = self._file_filter(location, filter_mode, drop_always_errors, timeout_ms)
+        rows = self.execute(f"SELECT {METRICS['hit_rate']}, time, has_error OR time >= ?, http_requests, results "
+                            f"FROM executions WHERE {where} AND cache_valid = 1 ORDER BY seq",
+                            [timeout_ms, *params])
+        if not rows:
+            return tuple(np.array([]) for _ in range(5))
+        hit_rates, times, timeouts, http_requests, results = zip(*rows)
+        return (np.array(hit_rates), np.array(times), np.array(timeouts, dtype=bool),
+                np.array(http_requests), np.array(results))
+
+    def aggregate(self, metric="time", how="avg", by=("algorithm", "template"), **filters):
+        """
+        Aggregates a metric over all ingested files, grouped by the given columns.
+
+        Parameters:
+        metric (str): One of METRICS, e.g. "time", "hit_rate" or "http_requests".
+        how (str): One of AGGREGATES: "avg", "sum", "min", "max", "count" or "geo_mean".
+        by (tuple): Columns to group on, see COLUMNS.
+        filters: Column equality filters, e.g. algorithm="indexed-cache", size="m", refinement=1.
+            A list or tuple value matches any of its values.
+
+        Returns a dict mapping the group values (a single value when grouping on one column) to the aggregate.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}', choose from {list(METRICS)}")
+        if how not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate '{how}', choose from {list(AGGREGATES)}")
+        unknown = [c for c in [*by, *filters] if c not in COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown columns {unknown}, choose from {COLUMNS}")
+
+        conditions, params = [], []
+        for column, value in filters.items():
+            if isinstance(value, (list, tuple, set)):
+                conditions.append(f"{column} IN ({', '.join('?' * len(value))})")
+                params.extend(value)
+            else:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if metric not in ("time", "results", "http_requests", "error"):
+            conditions.append("cache_valid = 1")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        group_by = f"GROUP BY {', '.join(by)}" if by else ""
+        select = ", ".join([*by, AGGREGATES[how].format(METRICS[metric])])
+
+        rows = self.execute(f"SELECT {select} FROM executions {where} {group_by}", params)
+        if not by:
+            return rows[0][0]
+        if len(by) == 1:
+            return {row[0]: row[1] for row in rows}
+        return {tuple(row[:-1]): row[-1] for row in rows}
+
+
+_default_store = None
+
+
+def get_default_store():
+    """The store at ANALYSIS_STORE (if set), used by the load_raw_data accessors when no store is passed."""
+    global _default_store
+    path = os.environ.get("ANALYSIS_STORE")
+    if not path:
+        return None
+    if _default_store is None or _default_store.path != Path(path):
+        _default_store = ResultStore(path)
+    return _default_store
+
+
+def ingest_files(files, store_path=DEFAULT_STORE_PATH, force=False):
+    """Ingests every result file into the store at store_path, skipping files that did not change."""
+    store = ResultStore(store_path)
+    start = time.perf_counter()
+    for location in files:
+        n_entries = store.ingest(location, force=force)
+        if n_entries:
+            print(f"Ingested {n_entries} entries from {location}")
+        else:
+            print(f"Up to date: {location}")
+    print(f"Store {store.path} holds {store.execute('SELECT COUNT(*) FROM executions')[0][0]} entries "
+          f"({time.perf_counter() - start:.2f}s)")
+    return store
@@ -0,0 +1,220 @@
+"""
+Sampling of result files for fast approximate analyses.
+
+A sample is given as a fraction (a float in (0, 1]) or a size (an int). Entries are sampled per
+stratum, by template (stratified sampling, every template keeps its share of the sample and at
+least min_per_stratum entries) or by sequence (whole sequences are sampled, so per-sequence
+analyses see complete sequences). Samples are deterministic for a given seed.
+
+The loaders and aggregators take the sample as a sample= argument (get_raw_metrics, get_means, the
+per-sequence accessors, and the session and eviction analyses of cache_metrics_plots, which decode
+the cache states of the sampled entries only and add standard errors). The estimate functions here
+return means with standard errors: approximate_raw_metrics and approximate_means.
+"""
+import math
+
+import numpy as np
+
+try:
+    from src.load_raw_data import find_always_error_templates, load_json, parse_cache_state
+    from src.profiling import profiled, stage
+except ModuleNotFoundError:
+    from load_raw_data import find_always_error_templates, load_json, parse_cache_state
+    from profiling import profiled, stage
+
+MIN_PER_STRATUM = 2
+
+
+def stratum_sizes(population, sample, min_per_stratum=MIN_PER_STRATUM):
+    """
+    Number of entries to sample per stratum: a fraction of every stratum, or a total size allocated
+    proportionally to the strata, at least min_per_stratum (or the whole stratum if it is smaller).
+    """
+    population = np.asarray(population)
+    if isinstance(sample, float):
+        if not 0 < sample <= 1:
+            raise ValueError(f"A sample fraction must be in (0, 1], got {sample}")
+        sizes = np.ceil(sample * population)
+    else:
+        if sample < 1:
+            raise ValueError(f"A sample size must be at least 1, got {sample}")
+        total = population.sum()
+        sizes = np.ceil(sample * population / total) if total > 0 else np.zeros(len(population))
+    sizes = np.maximum(sizes, np.minimum(min_per_stratum, population))
+    return np.minimum(sizes, population).astype(np.int64)
+
+
+def stratified_sample_mask(codes, sample, seed=0, min_per_stratum=MIN_PER_STRATUM):
+    """
+    Samples entries per stratum code (codes < 0 are never sampled).
+    Returns (mask, population per stratum, sample size per stratum).
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    eligible = np.flatnonzero(codes >= 0)
+    n_strata = int(codes.max()) + 1 if len(eligible) else 0
+    population = np.bincount(codes[eligible], minlength=n_strata)
+    sizes = stratum_sizes(population, sample, min_per_stratum)
+
+    # A random rank within every stratum, entries with a rank below the stratum size are sampled
+    keys = np.random.default_rng(seed).random(len(eligible))
+    order = eligible[np.lexsort((keys, codes[eligible]))]
+    starts = np.cumsum(population) - population
+    ranks = np.arange(len(order)) - starts[codes[order]]
+    mask = np.zeros(len(codes), dtype=bool)
+    mask[order[ranks < sizes[codes[order]]]] = True
+    return mask, population, sizes
+
+
+def _factorize(keys):
+    index = {}
+    codes = np.fromiter((-1 if key is None else index.setdefault(key, len(index)) for key in keys),
+                        dtype=np.int64, count=len(keys))
+    return codes
+
+
+def sample_mask(keys, sample, seed=0):
+    """Boolean mask of a sample stratified by keys (one stratum key per entry, None is never sampled)."""
+    mask, _, _ = stratified_sample_mask(_factorize(keys), sample, seed)
+    return mask
+
+
+def sample_entries(data, sample, by="template", seed=0):
+    """
+    Returns a sample of the entries of a result file, in file order. by="template" samples each
+    template separately; by="sequence" samples whole sequences (sample is then a fraction or a number
+    of sequences). Without a sample (None) data is returned as is.
+    """
+    if sample is None:
+        return data
+    with stage("sample_entries", entries=len(data)):
+        if by == "template":
+            mask = sample_mask([entry.get('sequenceElement', {}).get('template') for entry in data], sample, seed)
+        elif by == "sequence":
+            names = list(dict.fromkeys(entry.get('name') for entry in data))
+            # One stratum of sequences, sampled as units
+            sequence_mask, _, _ = stratified_sample_mask(np.zeros(len(names), dtype=np.int64), sample, seed,
+                                                         min_per_stratum=1)
+            sampled_names = {name for name, keep in zip(names, sequence_mask) if keep}
+            mask = [entry.get('name') in sampled_names for entry in data]
+        else:
+            raise ValueError(f"Invalid by {by}, choose template or sequence")
+    return [entry for entry, keep in zip(data, mask) if keep]
+
+
+def sample_aggregated(aggregated, sample, seed=0):
+    """Samples the values of every group of an aggregate_on result (keeping their order), e.g. per template."""
+    if sample is None:
+        return aggregated
+    rng = np.random.default_rng(seed)
+    sampled = {}
+    for key, values in aggregated.items():
+        size = int(stratum_sizes([len(values)], sample)[0])
+        keep = np.sort(rng.choice(len(values), size=size, replace=False)) if size < len(values) else range(len(values))
+        sampled[key] = [values[i] for i in keep]
+    return sampled
+
+
+def stratified_estimate(values, codes, population):
+    """
+    Stratified estimate of the mean of values (with their stratum codes) and its standard error,
+    with finite population correction. NaN values are outside the domain of the estimate (e.g. the
+    time of a timed out execution): every stratum is weighted by its population times the fraction
+    of its sampled values in the domain. Returns (mean, standard error, n).
+    """
+    n_strata = len(population)
+    drawn = np.bincount(codes, minlength=n_strata).astype(np.float64)
+    valid = ~np.isnan(values)
+    values, codes = values[valid], codes[valid]
+    n_h = np.bincount(codes, minlength=n_strata).astype(np.float64)
+    sums = np.bincount(codes, weights=values, minlength=n_strata)
+    squares = np.bincount(codes, weights=values ** 2, minlength=n_strata)
+    sampled = n_h > 0
+    if not sampled.any():
+        return np.nan, np.nan, 0
+    # Estimated domain size per stratum, strata without valid sampled values are left out of the estimate
+    domain = np.where(sampled, population * n_h / np.maximum(drawn, 1), 0.0)
+    weights = domain / domain.sum()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = np.where(sampled, sums / n_h, 0.0)
+        variances = np.where(n_h > 1, (squares - n_h * means ** 2) / (n_h - 1), 0.0)
+        fpc = np.where(population > 0, 1 - drawn / np.maximum(population, 1), 0.0)
+        variance = np.sum(np.where(sampled, weights ** 2 * np.clip(fpc, 0, 1) * np.maximum(variances, 0) / n_h, 0.0))
+    return float(np.sum(weights * means)), math.sqrt(variance), int(n_h.sum())
+
+
+@profiled()
+def approximate_raw_metrics(location, sample=0.1, filter_mode="all", drop_always_errors=False, timeout_ms=180000,
+                            seed=0):
+    """
+    Estimates the means of the get_raw_metrics metrics (hit_rate, timeout rate, http_requests and
+    results) from a sample stratified by template, and the mean and geometric mean ("geo_time") of
+    the time of the completed executions, like the exact summary. Only the filters run over every
+    entry, the cache states are only decoded for the sampled ones.
+
+    Returns {metric: {"mean", "se", "n", "population"}}.
+    """
+    data = load_json(location)
+    always_error_templates = find_always_error_templates(data, timeout_ms) if drop_always_errors else frozenset()
+
+    templates = []
+    for entry in data:
+        seq_element = entry.get('sequenceElement', {})
+        template = seq_element.get('template')
+        has_pattern = len(seq_element.get('refinementMetadata', {}).values()) > 0
+        if template in always_error_templates or (filter_mode == "refinement_only" and not has_pattern) \
+                or (filter_mode == "no_refinement" and has_pattern):
+            template = None
+        templates.append(template)
+    codes = _factorize(templates)
+    mask, population, _ = stratified_sample_mask(codes, sample, seed)
+
+    sampled = np.flatnonzero(mask)
+    metrics = {name: np.full(len(sampled), np.nan) for name in ("time", "log_time", "hit_rate", "timeout",
+                                                                 "http_requests", "results")}
+    for i, index in enumerate(sampled):
+        entry = data[index]
+        try:
+            cache_state = parse_cache_state(entry)
+        except (ValueError, KeyError, TypeError):
+            # get_raw_metrics skips entries without a cache state
+            continue
+        hits, misses = cache_state.get('hits', 0), cache_state.get('misses', 0)
+        time_ms = entry.get('time', 0)
+        timed_out = 'error' in entry or time_ms >= timeout_ms
+        if not timed_out:
+            metrics["time"][i] = time_ms
+            if time_ms > 0:
+                metrics["log_time"][i] = math.log(time_ms)
+        metrics["hit_rate"][i] = hits / (hits + misses) if hits + misses > 0 else 0.0
+        metrics["timeout"][i] = timed_out
+        metrics["http_requests"][i] = entry.get('httpRequests', 0)
+        metrics["results"][i] = entry.get('results', 0)
+
+    estimates = {}
+    for name, values in metrics.items():
+        mean, se, n = stratified_estimate(values, codes[sampled], population)
+        estimates[name] = {"mean": mean, "se": se, "n": n, "population": int(population.sum())}
+    # Geometric mean of the completed times, with the standard error of the delta method
+    log_time = estimates.pop("log_time")
+    geo_mean = math.exp(log_time["mean"]) if log_time["n"] else np.nan
+    estimates["geo_time"] = dict(log_time, mean=geo_mean, se=geo_mean * log_time["se"])
+    return estimates
+
+
+def approximate_means(aggregated, sample=0.1, average_key="time", seed=0):
+    """
+    Mean of average_key per group of an aggregate_on result (e.g. per template) from a sample of every
+    group, with its standard error. Returns {group: (mean, standard error, n)}; groups without values give (-1, nan, 0).
+    """
+    estimates = {}
+    for key, values in sample_aggregated(aggregated, sample, seed).items():
+        selected = np.array([value[average_key] for value in values if average_key in value], dtype=np.float64)
+        population = len(aggregated[key])
+        if len(selected) == 0:
+            estimates[key] = (-1, np.nan, 0)
+            continue
+        fpc = 1 - len(selected) / population if population else 0.0
+        se = np.std(selected, ddof=1) / math.sqrt(len(selected)) * math.sqrt(max(fpc, 0)) if len(selected) > 1 \
+            else np.nan
+        estimates[key] = (float(np.mean(selected)), float(se), len(selected))
+    return estimates
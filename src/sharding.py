@@ -0,0 +1,221 @@
+"""
+Splits result files by sequence name into shards, so per-sequence analyses can run in parallel
+processes (or on several machines sharing a filesystem), each worker reading only its shards.
+
+A result file query-results-raw-<label>.json is split into query-results-raw-<label>.shards/ with
+shard-<i>.json files (the entries of a group of whole sequences, in their original order) and an
+index.json. The index records the source size/mtime, the sequences and entry count of every shard,
+and per-template error statistics, so the drop_always_errors filters work without reading all shards.
+
+Once a file has up-to-date shards, load_raw_data.get_cumulative_data_per_sequence and
+get_cache_metrics_per_sequence (and so the cumulative and cache-state commands) process them in
+parallel instead of the whole file.
+"""
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+try:
+    from src import json_backend
+    from src.load_raw_data import aggregate_on, cache_metrics_by_sequence, cumulative_data_by_sequence, load_json, \
+        natural_sort_key
+    from src.profiling import profiled
+except ModuleNotFoundError:
+    import json_backend
+    from load_raw_data import aggregate_on, cache_metrics_by_sequence, cumulative_data_by_sequence, load_json, \
+        natural_sort_key
+    from profiling import profiled
+
+INDEX_NAME = "index.json"
+DEFAULT_SHARDS = 32
+
+
+def shard_dir_of(location):
+    location = Path(location)
+    return location.with_name(json_backend.strip_json_suffix(location.name) + ".shards")
+
+
+def template_error_stats(data):
+    """
+    Per template: the number of executions, of errors, and the minimum time of the executions
+    without error. A template always fails with a timeout t iff min_ok_time is None or >= t.
+    """
+    stats = defaultdict(lambda: {"total": 0, "errors": 0, "min_ok_time": None})
+    for entry in data:
+        template = entry.get('sequenceElement', {}).get('template')
+        if not template:
+            continue
+        row = stats[template]
+        row["total"] += 1
+        if 'error' in entry:
+            row["errors"] += 1
+        else:
+            time_ms = entry.get('time', 0)
+            if row["min_ok_time"] is None or time_ms < row["min_ok_time"]:
+                row["min_ok_time"] = time_ms
+    return dict(stats)
+
+
+def always_error_templates_from_index(index, timeout_ms=None):
+    """Same result as load_raw_data.find_always_error_templates, computed from the shard index."""
+    return {
+        template for template, row in index["templates"].items()
+        if row["total"] > 0 and (row["errors"] == row["total"] or (
+            timeout_ms is not None and row["min_ok_time"] is not None and row["min_ok_time"] >= timeout_ms
+        ))
+    }
+
+
+def load_shard_index(location):
+    """Returns the shard index of a result file, or None if it was not sharded or changed since."""
+    index_path = shard_dir_of(location) / INDEX_NAME
+    if not index_path.exists():
+        return None
+    with open(index_path, 'r') as f:
+        index = json.load(f)
+    st = os.stat(location)
+    if index["source_bytes"] != st.st_size or index["source_mtime_ns"] != st.st_mtime_ns:
+        return None
+    return index
+
+
+@profiled()
+def shard_result_file(location, n_shards=DEFAULT_SHARDS, force=False):
+    """
+    Splits a result file by sequence name into at most n_shards shards of whole sequences.
+    Sequences are assigned in natural order to contiguous shards of roughly equal entry counts,
+    so the split is deterministic. Existing shards of an unchanged file are reused unless force is set.
+
+    Returns the shard index.
+    """
+    if not force:
+        index = load_shard_index(location)
+        if index is not None and index["requested_shards"] == n_shards:
+            return index
+
+    data = load_json(location)
+    by_sequence = aggregate_on(data, ['name'])
+    names = sorted(by_sequence.keys(), key=natural_sort_key)
+    requested_shards = n_shards
+    n_shards = max(1, min(n_shards, len(names)))
+    target = len(data) / n_shards
+
+    shards, current, current_entries = [], [], 0
+    for name in names:
+        current.append(name)
+        current_entries += len(by_sequence[name])
+        if current_entries >= target * (len(shards) + 1) and len(shards) < n_shards - 1:
+            shards.append(current)
+            current = []
+    if current or not shards:
+        shards.append(current)
+
+    shard_dir = shard_dir_of(location)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    for stale in shard_dir.glob("shard-*.json"):
+        stale.unlink()
+
+    # Distribute the entries in one pass, keeping their original order within every shard
+    shard_of = {name: i for i, shard_names in enumerate(shards) for name in shard_names}
+    shard_data = [[] for _ in shards]
+    for entry in data:
+        shard_data[shard_of[entry['name']]].append(entry)
+
+    shard_entries = []
+    for i, (shard_names, entries) in enumerate(zip(shards, shard_data)):
+        file_name = f"shard-{i:04d}.json"
+        with open(shard_dir / file_name, 'w') as f:
+            json.dump(entries, f)
+        shard_entries.append({"file": file_name, "sequences": shard_names, "n_entries": len(entries)})
+
+    st = os.stat(location)
+    index = {
+        "source": str(Path(location).resolve()),
+        "source_bytes": st.st_size,
+        "source_mtime_ns": st.st_mtime_ns,
+        "n_entries": len(data),
+        "requested_shards": requested_shards,
+        "shards": shard_entries,
+        "templates": template_error_stats(data),
+    }
+    tmp_path = shard_dir / (INDEX_NAME + ".tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, shard_dir / INDEX_NAME)
+    print(f"Split {location} into {len(shards)} shards ({len(names)} sequences) in {shard_dir}")
+    return index
+
+
+def shard_index_of(location, n_shards=None):
+    """The up-to-date shard index of a result file, splitting it first if needed (see sharded_*)."""
+    index = load_shard_index(location) if n_shards is None else None
+    return index if index is not None else shard_result_file(location, n_shards or DEFAULT_SHARDS)
+
+
+def process_shard(shard_path, shard_function):
+    """Applies shard_function to the entries of a shard, returns [(sequence name, result)]."""
+    return list(shard_function(load_json(shard_path)).items())
+
+
+def process_shards(location, shard_function, shard_ids=None, workers=None):
+    """
+    Runs shard_function over the given shards (default: all) in a process pool. shard_function maps
+    the entries of whole sequences to {sequence: result}, like load_raw_data.cumulative_data_by_sequence,
+    so every shard is aggregated at once. Workers on other machines can call this with their own
+    shard_ids and merge the results with merge_sequence_results. shard_function must be picklable
+    (a module-level function or partial).
+    """
+    index = load_shard_index(location)
+    if index is None:
+        raise FileNotFoundError(f"{location} has no up-to-date shards, run shard_result_file first")
+    shard_dir = shard_dir_of(location)
+    shard_ids = range(len(index["shards"])) if shard_ids is None else shard_ids
+    paths = [shard_dir / index["shards"][i]["file"] for i in shard_ids]
+
+    func = partial(process_shard, shard_function=shard_function)
+    if workers == 1 or len(paths) <= 1:
+        return [func(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, paths))
+
+
+def merge_sequence_results(partials):
+    """
+    Merges per-shard [(sequence name, result)] lists into one dict in natural sequence order,
+    skipping None results, so the outcome does not depend on how shards were distributed.
+    """
+    merged = {}
+    for partial_result in partials:
+        for name, result in partial_result:
+            if result is not None:
+                merged[name] = result
+    return {name: merged[name] for name in sorted(merged, key=natural_sort_key)}
+
+
+@profiled()
+def sharded_cumulative_data_per_sequence(location, filter_mode="all", drop_always_errors=False, workers=None,
+                                         n_shards=None):
+    """
+    Sharded, parallel equivalent of load_raw_data.get_cumulative_data_per_sequence. n_shards=None uses
+    the existing shards of the file (whatever their number), splitting it into DEFAULT_SHARDS if it has none.
+    """
+    index = shard_index_of(location, n_shards)
+    always_error_templates = always_error_templates_from_index(index) if drop_always_errors else frozenset()
+    shard_function = partial(cumulative_data_by_sequence, filter_mode=filter_mode,
+                             always_error_templates=frozenset(always_error_templates))
+    return merge_sequence_results(process_shards(location, shard_function, workers=workers))
+
+
+@profiled()
+def sharded_cache_metrics_per_sequence(location, filter_mode="all", drop_always_errors=False, timeout_ms=180000,
+                                       workers=None, n_shards=None):
+    """Sharded, parallel equivalent of load_raw_data.get_cache_metrics_per_sequence, see above for n_shards."""
+    index = shard_index_of(location, n_shards)
+    always_error_templates = always_error_templates_from_index(index, timeout_ms) if drop_always_errors \
+        else frozenset()
+    shard_function = partial(cache_metrics_by_sequence, filter_mode=filter_mode,
+                             always_error_templates=frozenset(always_error_templates))
+    return merge_sequence_results(process_shards(location, shard_function, workers=workers))
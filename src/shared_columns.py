@@ -0,0 +1,278 @@
+"""
+Loads the numeric columns of a result file into a single multiprocessing.shared_memory block, so
+worker processes can attach to them as zero-copy NumPy views instead of each receiving a pickled
+copy of the entries or reparsing the file.
+
+    with share_result_file(location) as columns:
+        results = map_with_columns(worker_function, columns.handle, tasks)
+
+significance.pairwise_significance runs its workers on a shared block of the stacked times of all
+result files (stack_columns) this way.
+
+worker_function(columns, task) runs in a process pool whose workers attach to the block once.
+String columns (template, name, session) are factorized into integer codes; the categories are
+passed along in the (picklable) handle. The timestamps lists are stored ragged, as concatenated
+values plus offsets: the timestamps of row i are timestamps_values[timestamps_offsets[i]:timestamps_offsets[i + 1]].
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory, util
+
+import numpy as np
+
+try:
+    from src.load_raw_data import load_json, parse_cache_state
+    from src.result_cache import memoize
+except ModuleNotFoundError:
+    from load_raw_data import load_json, parse_cache_state
+    from result_cache import memoize
+
+# Offsets of the columns in the shared block are aligned to this many bytes
+_ALIGNMENT = 64
+
+
+def _factorize(values, categories, index):
+    """Returns the integer code of every value (-1 for None), extending categories/index in place."""
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        if value is None:
+            codes[i] = -1
+            continue
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(categories)
+            categories.append(value)
+        codes[i] = code
+    return codes
+
+
+@memoize
+def load_columns(location):
+    """
+    Returns (columns, categories) of a result file: a dict of NumPy arrays with one row per entry,
+    and the categories of the factorized string columns (the code of a value is its index).
+    """
+    data = load_json(location)
+    n = len(data)
+    time_ms = np.empty(n, dtype=np.float64)
+    results = np.empty(n, dtype=np.int64)
+    http_requests = np.empty(n, dtype=np.int64)
+    hits = np.zeros(n, dtype=np.int64)
+    misses = np.zeros(n, dtype=np.int64)
+    eviction_percentage = np.zeros(n, dtype=np.float64)
+    evictions = np.zeros(n, dtype=np.int64)
+    has_error = np.zeros(n, dtype=bool)
+    cache_valid = np.zeros(n, dtype=bool)
+    refinement = np.zeros(n, dtype=bool)
+    step = np.full(n, -1, dtype=np.int64)
+    timestamps_offsets = np.zeros(n + 1, dtype=np.int64)
+    timestamps = []
+    templates, names, sessions = [], [], []
+
+    for i, entry in enumerate(data):
+        seq_element = entry.get('sequenceElement') or {}
+        time_ms[i] = entry.get('time') or 0
+        results[i] = entry.get('results') or 0
+        http_requests[i] = entry.get('httpRequests') or 0
+        has_error[i] = 'error' in entry
+        refinement[i] = len((seq_element.get('refinementMetadata') or {}).values()) > 0
+        try:
+            step[i] = int(entry['id'])
+        except (ValueError, KeyError, TypeError):
+            pass
+        try:
+            cache_state = parse_cache_state(entry)
+            hits[i] = cache_state.get('hits') or 0
+            misses[i] = cache_state.get('misses') or 0
+            eviction_percentage[i] = cache_state.get('evictionPercentage') or 0
+            evictions[i] = cache_state.get('evictions') or 0
+            cache_valid[i] = True
+        except (ValueError, KeyError, TypeError):
+            pass
+        # Keys may be present with a null value
+        entry_timestamps = entry.get('timestamps') or []
+        timestamps.extend(entry_timestamps)
+        timestamps_offsets[i + 1] = timestamps_offsets[i] + len(entry_timestamps)
+        templates.append(seq_element.get('template'))
+        names.append(entry.get('name'))
+        sessions.append((seq_element.get('session') or {}).get('sessionId'))
+
+    categories = {"template": [], "name": [], "session": []}
+    columns = {
+        "time": time_ms,
+        "results": results,
+        "http_requests": http_requests,
+        "hits": hits,
+        "misses": misses,
+        "eviction_percentage": eviction_percentage,
+        "evictions": evictions,
+        "has_error": has_error,
+        "cache_valid": cache_valid,
+        "refinement": refinement,
+        "step": step,
+        "timestamps_values": np.array(timestamps, dtype=np.float64),
+        "timestamps_offsets": timestamps_offsets,
+        "template_codes": _factorize(templates, categories["template"], {}),
+        "name_codes": _factorize(names, categories["name"], {}),
+        "session_codes": _factorize(sessions, categories["session"], {}),
+    }
+    return columns, categories
+
+
+class SharedColumnsHandle:
+    """Picklable description of a shared block: its name, the column layout and the categories."""
+    __slots__ = ("name", "layout", "categories", "n_rows")
+
+    def __init__(self, name, layout, categories, n_rows):
+        self.name = name
+        self.layout = layout
+        self.categories = categories
+        self.n_rows = n_rows
+
+    def __getstate__(self):
+        return self.name, self.layout, self.categories, self.n_rows
+
+    def __setstate__(self, state):
+        self.name, self.layout, self.categories, self.n_rows = state
+
+
+class SharedColumns:
+    """
+    Columns backed by a shared memory block. The creating process owns the block and unlinks it on
+    close(); processes that attach only detach. Views handed out by [] are invalid after close(),
+    drop them first (NumPy keeps the buffer exported, so close() raises BufferError otherwise).
+    """
+
+    def __init__(self, shm, handle, owner):
+        self._shm = shm
+        self.handle = handle
+        self.owner = owner
+        self.categories = handle.categories
+        self._views = {
+            column: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            for column, (dtype, shape, offset) in handle.layout.items()
+        }
+        for view in self._views.values():
+            if not owner:
+                # Workers read, the owner is the only writer
+                view.flags.writeable = False
+
+    @classmethod
+    def create(cls, columns, categories):
+        """Copies the columns into a new shared memory block owned by this process."""
+        layout, size = {}, 0
+        for column, array in columns.items():
+            size = -(-size // _ALIGNMENT) * _ALIGNMENT
+            layout[column] = (array.dtype.str, array.shape, size)
+            size += array.nbytes
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        n_rows = len(columns["time"]) if "time" in columns else 0
+        shared = cls(shm, SharedColumnsHandle(shm.name, layout, categories, n_rows), owner=True)
+        for column, array in columns.items():
+            shared._views[column][...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, handle):
+        """Attaches to an existing block without taking ownership, the owner decides when it is freed."""
+        try:
+            shm = shared_memory.SharedMemory(name=handle.name, track=False)
+        except TypeError:
+            # Before Python 3.13 attaching registers the block with the resource tracker. Pool workers
+            # share the tracker of the owner, so this registers nothing new and the owner still unlinks it.
+            shm = shared_memory.SharedMemory(name=handle.name)
+        return cls(shm, handle, owner=False)
+
+    def __getitem__(self, column):
+        return self._views[column]
+
+    def __contains__(self, column):
+        return column in self._views
+
+    def keys(self):
+        return self._views.keys()
+
+    def __len__(self):
+        return self.handle.n_rows
+
+    @property
+    def nbytes(self):
+        return self._shm.size
+
+    def timestamps(self, row):
+        offsets = self._views["timestamps_offsets"]
+        return self._views["timestamps_values"][offsets[row]:offsets[row + 1]]
+
+    def decode(self, column, codes):
+        """Maps the codes of a factorized column ("template", "name" or "session") back to their values."""
+        categories = self.categories[column]
+        return [categories[code] if code >= 0 else None for code in np.atleast_1d(codes)]
+
+    def close(self):
+        if self._shm is None:
+            return
+        self._views.clear()
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def stack_columns(locations, names=("time", "has_error", "refinement", "template_codes")):
+    """
+    The row columns names of several result files stacked into one set of columns, with a "file"
+    column (the index of the location of every row). Factorized columns (<column>_codes) are recoded
+    to categories shared by all files. Returns (columns, categories).
+    """
+    stacked = {name: [] for name in names}
+    stacked["file"] = []
+    categories = {}
+    for file_index, location in enumerate(locations):
+        columns, file_categories = load_columns(location)
+        for name in names:
+            values = columns[name]
+            if name.endswith("_codes"):
+                column = name.removesuffix("_codes")
+                shared, index = categories.setdefault(column, ([], {}))
+                recode = np.append(_factorize(file_categories[column], shared, index), -1)
+                # Code -1 (None) indexes the appended -1
+                values = recode[values]
+            stacked[name].append(values)
+        stacked["file"].append(np.full(len(columns["time"]), file_index, dtype=np.int32))
+    stacked = {name: np.concatenate(parts) if parts else np.empty(0) for name, parts in stacked.items()}
+    return stacked, {column: shared for column, (shared, _) in categories.items()}
+
+
+def share_result_file(location):
+    """Loads the columns of a result file into a new shared memory block, use as a context manager."""
+    columns, categories = load_columns(location)
+    return SharedColumns.create(columns, categories)
+
+
+_worker_columns = None
+
+
+def _attach_worker(handle):
+    global _worker_columns
+    _worker_columns = SharedColumns.attach(handle)
+    # Pool workers exit without running atexit handlers, multiprocessing finalizers do run
+    util.Finalize(None, _worker_columns.close, exitpriority=10)
+
+
+def _run_with_columns(func, task):
+    return func(_worker_columns, task)
+
+
+def map_with_columns(func, handle, tasks, workers=None):
+    """
+    Runs func(columns, task) for every task in a process pool, in order. Every worker attaches to
+    the shared block once when it starts, so the columns are never copied. func must be picklable.
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=_attach_worker, initargs=(handle,)) as pool:
+        return list(pool.map(partial(_run_with_columns, func), tasks))
@@ -0,0 +1,250 @@
+"""
+Batched significance tests of the execution times of all configurations (result files) per template.
+
+Per template, the executions of every configuration are pooled and sorted once. From the sorted
+pool, a cumulative count per configuration gives for every execution how many executions of each
+other configuration are smaller (ties counting half), so the Mann-Whitney U statistics of all
+configuration pairs are one matrix product, and the Kruskal-Wallis H statistic follows from the
+same midranks. P-values use the normal approximation with tie and continuity correction (like
+scipy.stats.mannwhitneyu(method="asymptotic")), and are corrected for the pairs tested per template.
+
+With workers, the kept execution times of all files are sorted by (template, file) into one shared
+memory block (see shared_columns.py) and every task only carries the row ranges of its template, so
+the workers read the times without a copy per worker.
+"""
+import numpy as np
+import pandas as pd
+from scipy import special
+
+try:
+    from src.bootstrap import filter_mask, template_times
+    from src.data_analysis import get_algorithm_labels
+    from src.profiling import profiled
+    from src.shared_columns import SharedColumns, map_with_columns, stack_columns
+except ModuleNotFoundError:
+    from bootstrap import filter_mask, template_times
+    from data_analysis import get_algorithm_labels
+    from profiling import profiled
+    from shared_columns import SharedColumns, map_with_columns, stack_columns
+
+CORRECTIONS = ("bonferroni", "holm", "fdr_bh", "none")
+
+
+def adjust_p_values(p_values, method="holm"):
+    """Multiple-testing correction of a 1D array of p-values (NaNs are left out of the family)."""
+    p_values = np.asarray(p_values, dtype=np.float64)
+    adjusted = np.full_like(p_values, np.nan)
+    valid = np.flatnonzero(~np.isnan(p_values))
+    m = len(valid)
+    if m == 0 or method == "none":
+        adjusted[valid] = p_values[valid]
+        return adjusted
+    p = p_values[valid]
+    if method == "bonferroni":
+        result = p * m
+    elif method == "holm":
+        order = np.argsort(p)
+        result = np.empty(m)
+        result[order] = np.maximum.accumulate(p[order] * (m - np.arange(m)))
+    elif method == "fdr_bh":
+        order = np.argsort(p)[::-1]
+        result = np.empty(m)
+        result[order] = np.minimum.accumulate(p[order] * m / np.arange(m, 0, -1))
+    else:
+        raise ValueError(f"Invalid correction {method}, choose one of {', '.join(CORRECTIONS)}")
+    adjusted[valid] = np.minimum(result, 1.0)
+    return adjusted
+
+
+def rank_tests(samples):
+    """
+    Mann-Whitney U tests of all pairs and the Kruskal-Wallis test of a list of 1D samples.
+
+    Returns a dict with u (u[a, b]: U statistic of sample a against b), p (two-sided p-values of the
+    pairs, NaN on the diagonal and for empty samples), h and h_p_value (Kruskal-Wallis).
+    """
+    sizes = np.array([len(sample) for sample in samples], dtype=np.int64)
+    n_samples = len(samples)
+    values = np.concatenate(samples) if n_samples else np.empty(0)
+    labels = np.repeat(np.arange(n_samples), sizes)
+
+    order = np.argsort(values, kind='stable')
+    values, labels = values[order], labels[order]
+    n = len(values)
+    # Tie blocks of the pool: [block_starts[k], block_ends[k])
+    block_starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]]) if n else np.empty(0, dtype=np.int64)
+    block_ends = np.r_[block_starts[1:], n]
+    block_of = np.repeat(np.arange(len(block_starts)), block_ends - block_starts)
+
+    one_hot = np.zeros((n, n_samples))
+    one_hot[np.arange(n), labels] = 1.0
+    cumulative = np.vstack([np.zeros((1, n_samples)), np.cumsum(one_hot, axis=0)])
+    below = cumulative[block_starts]  # Per tie block and sample: number of smaller values
+    within = cumulative[block_ends] - below  # Per tie block and sample: number of tied values
+
+    # u[a, b] = sum over x in a of (#b < x + #b == x / 2)
+    smaller_or_tied = (below + within / 2)[block_of]
+    u = one_hot.T @ smaller_or_tied
+
+    # Tie correction of every pair: sum over the tie blocks of t^3 - t, with t = within_a + within_b
+    cubes = (within ** 3).sum(axis=0)
+    cross = (within ** 2).T @ within
+    ties = cubes[:, None] + cubes[None, :] + 3 * cross + 3 * cross.T - (sizes[:, None] + sizes[None, :])
+
+    n_a, n_b = sizes[:, None].astype(np.float64), sizes[None, :].astype(np.float64)
+    n_ab = n_a + n_b
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mu = n_a * n_b / 2
+        sigma = np.sqrt(n_a * n_b / 12 * ((n_ab + 1) - ties / (n_ab * (n_ab - 1))))
+        z = (np.maximum(u, u.T) - mu - 0.5) / sigma
+        p = np.minimum(2 * special.ndtr(-z), 1.0)
+    p[(n_a == 0) | (n_b == 0) | (sigma == 0)] = np.nan
+    np.fill_diagonal(p, np.nan)
+
+    # Kruskal-Wallis on the midranks of the pool
+    midranks = (block_starts + block_ends + 1) / 2
+    rank_sums = one_hot.T @ midranks[block_of] if n else np.zeros(n_samples)
+    non_empty = sizes > 0
+    h, h_p_value = np.nan, np.nan
+    if non_empty.sum() >= 2:
+        block_sizes = (block_ends - block_starts).astype(np.float64)
+        tie_correction = 1 - ((block_sizes ** 3 - block_sizes).sum() / (n ** 3 - n))
+        if tie_correction > 0:
+            h = (12 / (n * (n + 1)) * (rank_sums[non_empty] ** 2 / sizes[non_empty]).sum() - 3 * (n + 1)) \
+                / tie_correction
+            h_p_value = special.chdtrc(non_empty.sum() - 1, h)
+    return {"u": u, "p": p, "h": h, "h_p_value": h_p_value}
+
+
+def _template_tests(task):
+    template, samples = task
+    tests = rank_tests(samples)
+    tests["medians"] = np.array([np.median(sample) if len(sample) else np.nan for sample in samples])
+    tests["sizes"] = np.array([len(sample) for sample in samples])
+    return template, tests
+
+
+def _shared_template_tests(columns, task):
+    template, ranges = task
+    return _template_tests((template, [columns["time"][start:end] for start, end in ranges]))
+
+
+def shared_template_times(locations, filter_mode="all", exclude_errors=False, drop_always_errors=False,
+                          timeout_ms=180000):
+    """
+    The kept execution times of all files sorted by (template, file), in file order within every
+    file, as one "time" column. Returns (columns, {template: [(start, end) of every file]}), with the
+    templates any file ran (leaving out the templates a file always fails with drop_always_errors).
+    """
+    columns, categories = stack_columns(locations)
+    templates, files = columns["template_codes"], columns["file"]
+    n_files, n_templates = len(locations), len(categories.get("template", []))
+    named = templates >= 0
+    cells = files * n_templates + np.where(named, templates, 0)
+    present = np.bincount(cells[named], minlength=n_files * n_templates) > 0
+    if drop_always_errors:
+        failed = columns["has_error"] | (columns["time"] >= timeout_ms)
+        totals = np.bincount(cells[named], minlength=n_files * n_templates)
+        failures = np.bincount(cells[named], weights=failed[named], minlength=n_files * n_templates)
+        # Like find_always_error_templates, which ignores empty template names
+        always_error = (totals > 0) & (failures == totals) & \
+            np.tile([template != "" for template in categories.get("template", [])], n_files).astype(bool)
+        present &= ~always_error
+        named &= ~always_error[cells]
+    keep = np.flatnonzero(named & filter_mask(columns["has_error"], columns["refinement"], filter_mode,
+                                              exclude_errors))
+    rows = keep[np.lexsort((files[keep], templates[keep]))]
+    counts = np.bincount(templates[rows] * n_files + files[rows], minlength=n_templates * n_files)
+    ends = np.cumsum(counts).reshape(n_templates, n_files)
+    starts = ends - counts.reshape(n_templates, n_files)
+    present = present.reshape(n_files, n_templates).T
+    ranges = {
+        template: [(int(start), int(end)) for start, end in zip(starts[code], ends[code])]
+        for code, template in enumerate(categories.get("template", [])) if present[code].any()
+    }
+    return {"time": columns["time"][rows]}, ranges
+
+
+@profiled()
+def pairwise_significance(locations, filter_mode="all", exclude_errors=False, drop_always_errors=False,
+                          timeout_ms=180000, alpha=0.05, correction="holm", labels=None, workers=None):
+    """
+    Tests for every template whether the execution times of configurations differ, for all pairs of
+    configurations at once (Mann-Whitney U) and over all configurations (Kruskal-Wallis).
+
+    Parameters:
+        locations: Result files, one per configuration.
+        filter_mode: "all", "refinement_only" or "no_refinement".
+        exclude_errors: Leave out executions with an error.
+        alpha: Significance level of the corrected p-values.
+        correction: Correction for the pairs tested per template, one of CORRECTIONS.
+        labels: Labels of the configurations, get_algorithm_labels(locations) by default.
+        workers: Number of processes the templates are tested in (None: in this process).
+
+    Returns (pairs, kruskal): a DataFrame with one row per (template, label_1, label_2) pair with
+    u_statistic, p_value, p_adjusted, is_significant, median_diff and direction, and a DataFrame with
+    the Kruskal-Wallis statistic and p-value per template.
+    """
+    labels = labels if labels is not None else get_algorithm_labels(locations)
+    if workers is None or workers == 1:
+        per_file = [template_times(location, drop_always_errors, timeout_ms) for location in locations]
+        templates = sorted({template for file_columns in per_file for template in file_columns})
+        tasks = []
+        for template in templates:
+            samples = []
+            for file_columns in per_file:
+                if template not in file_columns:
+                    samples.append(np.empty(0))
+                    continue
+                times, has_error, refinement = file_columns[template]
+                samples.append(times[filter_mask(has_error, refinement, filter_mode, exclude_errors)])
+            tasks.append((template, samples))
+        results = [_template_tests(task) for task in tasks]
+    else:
+        columns, ranges = shared_template_times(locations, filter_mode, exclude_errors, drop_always_errors,
+                                                timeout_ms)
+        with SharedColumns.create(columns, {}) as shared:
+            results = map_with_columns(_shared_template_tests, shared.handle, sorted(ranges.items()),
+                                       workers=workers)
+
+    first, second = np.triu_indices(len(labels), k=1)
+    pair_frames, kruskal_rows = [], []
+    for template, tests in results:
+        p_values = tests["p"][first, second]
+        p_adjusted = adjust_p_values(p_values, correction)
+        median_diff = tests["medians"][first] - tests["medians"][second]
+        significant = p_adjusted < alpha
+        label_1 = np.asarray(labels, dtype=object)[first]
+        label_2 = np.asarray(labels, dtype=object)[second]
+        # Like post_hoc_pairwise_tests: "a > b" means a has the higher median execution time
+        direction = [
+            "No significant difference" if not is_significant else
+            f"{a} > {b}" if diff > 0 else f"{a} < {b}" if diff < 0 else "Significant (Medians Equal, Dist. Differs)"
+            for a, b, diff, is_significant in zip(label_1, label_2, median_diff, significant)
+        ]
+        pair_frames.append(pd.DataFrame({
+            "template": template,
+            "label_1": label_1,
+            "label_2": label_2,
+            "n_1": tests["sizes"][first],
+            "n_2": tests["sizes"][second],
+            "u_statistic": tests["u"][first, second],
+            "p_value": p_values,
+            "p_adjusted": p_adjusted,
+            "is_significant": significant,
+            "median_diff": median_diff,
+            "direction": direction,
+        }))
+        kruskal_rows.append({"template": template, "kruskal_stat": tests["h"], "kruskal_p_value": tests["h_p_value"]})
+    pairs = pd.concat(pair_frames, ignore_index=True) if pair_frames else pd.DataFrame()
+    return pairs, pd.DataFrame(kruskal_rows)
+
+
+def significance_matrix(pairs, template, column="p_adjusted"):
+    """Symmetric (label x label) matrix of a column of pairwise_significance for one template."""
+    rows = pairs[pairs["template"] == template]
+    labels = list(dict.fromkeys(list(rows["label_1"]) + list(rows["label_2"])))
+    matrix = pd.DataFrame(np.nan, index=labels, columns=labels)
+    for label_1, label_2, value in zip(rows["label_1"], rows["label_2"], rows[column]):
+        matrix.loc[label_1, label_2] = matrix.loc[label_2, label_1] = value
+    return matrix
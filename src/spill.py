@@ -0,0 +1,174 @@
+"""
+Bounded-memory execution of the per-sequence accessors, for result files larger than the memory of
+the machine analysing them.
+
+The result file is streamed entry by entry (json_backend.iter_array). Every entry is reduced to the
+fields the per-sequence functions read and buffered in the partition of its sequence (a hash of the
+sequence name). When the buffers exceed the memory budget, they are appended to temporary partition
+files. At the end, the partitions are processed one at a time with the
+usual *_by_sequence function of load_raw_data and the results merged in natural sequence order, so
+the results equal the in-memory accessors while at most the budget plus one partition is held in memory.
+
+The partition files hold one JSON line per slimmed entry rather than columns: the *_by_sequence
+functions take entries, and the cache state they parse is a nested object of varying size, so
+a columnar layout would have to be turned back into entries when the partition is read.
+
+    get_cumulative_data_per_sequence(location, memory_budget="512M")
+
+or ANALYSIS_MEMORY_BUDGET=512M for every call (cli.py --memory-budget).
+"""
+import json
+import math
+import os
+import shutil
+import tempfile
+import zlib
+
+try:
+    from src import json_backend
+    from src.load_raw_data import CACHE_STATE_KEYS, natural_sort_key
+    from src.profiling import profiled, stage
+    from src.result_cache import parse_byte_size
+    from src.sharding import always_error_templates_from_index, template_error_stats
+except ModuleNotFoundError:
+    import json_backend
+    from load_raw_data import CACHE_STATE_KEYS, natural_sort_key
+    from profiling import profiled, stage
+    from result_cache import parse_byte_size
+    from sharding import always_error_templates_from_index, template_error_stats
+
+# Compressed files are assumed to expand this much, and decoded entries to take this many times
+# their JSON size, when choosing the number of partitions
+COMPRESSION_FACTOR = 5
+OBJECT_OVERHEAD = 4
+MAX_PARTITIONS = 256
+
+
+def slim_entry(entry):
+    """The fields of an entry the per-sequence functions read."""
+    seq_element = entry.get('sequenceElement', {})
+    slim = {key: entry[key] for key in ('name', 'id', 'time', 'results', 'error') if key in entry}
+    slim['sequenceElement'] = {key: seq_element[key] for key in ('template', 'refinementMetadata')
+                               if key in seq_element}
+    for key in CACHE_STATE_KEYS:
+        if entry.get(key):
+            slim[key] = entry[key]
+            break
+    return slim
+
+
+class SequencePartitions:
+    """
+    Entries grouped in n_partitions partitions by sequence name, buffered in memory up to
+    memory_budget bytes and spilled to temporary files beyond that. Use as a context manager, the
+    temporary files are removed on exit.
+    """
+
+    def __init__(self, memory_budget, n_partitions, spill_dir=None):
+        self.memory_budget = parse_byte_size(memory_budget)
+        self.n_partitions = n_partitions
+        self.spill_dir = spill_dir
+        self.buffers = [[] for _ in range(n_partitions)]
+        self.buffered_bytes = 0
+        self.spilled_bytes = 0
+        self.n_spills = 0
+        self.directory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+    def _partition_path(self, partition):
+        return os.path.join(self.directory, f"partition-{partition:04d}.jsonl")
+
+    def add(self, entry):
+        line = json.dumps(slim_entry(entry))
+        partition = zlib.crc32(entry['name'].encode()) % self.n_partitions
+        self.buffers[partition].append(line)
+        self.buffered_bytes += len(line) + 1
+        if self.buffered_bytes > self.memory_budget:
+            self.spill()
+
+    def add_all(self, entries):
+        """Adds the entries, yielding every entry on so statistics can be collected in the same pass."""
+        for entry in entries:
+            self.add(entry)
+            yield entry
+
+    def spill(self):
+        """Appends the buffers to their partition files."""
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix="analysis-spill-", dir=self.spill_dir)
+        with stage("spill", entries=sum(len(lines) for lines in self.buffers)):
+            for partition, lines in enumerate(self.buffers):
+                if not lines:
+                    continue
+                with open(self._partition_path(partition), 'a') as f:
+                    f.write("\n".join(lines) + "\n")
+                lines.clear()
+        self.spilled_bytes += self.buffered_bytes
+        self.buffered_bytes = 0
+        self.n_spills += 1
+
+    def partition_entries(self, partition):
+        """The entries of a partition: its spilled entries followed by its buffered ones, in file order."""
+        lines = []
+        if self.directory is not None and os.path.exists(self._partition_path(partition)):
+            with open(self._partition_path(partition), 'r') as f:
+                lines = f.read().splitlines()
+        return [json_backend.loads(line) for line in lines + self.buffers[partition]]
+
+    def per_sequence(self, partition_function):
+        """
+        Applies partition_function (entries -> {sequence: result}) to every partition, one partition
+        in memory at a time, and merges the results.
+        """
+        results = {}
+        for partition in range(self.n_partitions):
+            entries = self.partition_entries(partition)
+            self.buffers[partition] = []
+            with stage("merge_partition", entries=len(entries)):
+                results.update(partition_function(entries))
+        return {name: results[name] for name in sorted(results, key=natural_sort_key)}
+
+
+def default_partitions(location, memory_budget):
+    """Enough partitions for every decoded partition of location to fit in the memory budget."""
+    size = os.path.getsize(location) * OBJECT_OVERHEAD
+    if not str(location).endswith(".json"):
+        size *= COMPRESSION_FACTOR
+    return max(1, min(MAX_PARTITIONS, math.ceil(size / parse_byte_size(memory_budget))))
+
+
+@profiled()
+def bounded_per_sequence(location, make_partition_function, memory_budget, timeout_ms=None, n_partitions=None,
+                         spill_dir=None, verbose=False):
+    """
+    Per-sequence results of a streamed result file within memory_budget (bytes or e.g. "512M").
+
+    Parameters:
+        location: Result file.
+        make_partition_function: Called with the templates that always fail (error, or timeout_ms
+            if given), which are only known after the whole file was read, returns the function
+            computing {sequence: result} of the entries of whole sequences (e.g. cumulative_data_by_sequence).
+        memory_budget: Bytes of entries buffered before they are spilled to disk.
+        n_partitions: Number of partitions, default_partitions by default.
+        spill_dir: Directory of the temporary files, the system temporary directory by default.
+        verbose: Print how much was spilled to disk.
+    """
+    n_partitions = n_partitions or default_partitions(location, memory_budget)
+    with SequencePartitions(memory_budget, n_partitions, spill_dir) as partitions:
+        with stage("stream_entries"):
+            error_stats = template_error_stats(partitions.add_all(json_backend.iter_array(location)))
+        if verbose and partitions.n_spills:
+            print(f"Spilled {partitions.spilled_bytes / 1024 ** 2:.1f} MB of {location} to disk in "
+                  f"{partitions.n_spills} spills")
+        always_error_templates = always_error_templates_from_index({"templates": error_stats}, timeout_ms)
+        return partitions.per_sequence(make_partition_function(frozenset(always_error_templates)))
@@ -0,0 +1,52 @@
+"""
+Manifest of staged result files, written by scratch/process_random_new.py next to the files it
+stages. Every entry records the content hash of a file together with its size and modification
+time, so consumers (e.g. the analysis cache) can reuse the hash instead of re-reading the file.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+MANIFEST_NAME = "staging_manifest.json"
+
+
+def file_digest(path):
+    """blake2b-128 content hash of a file, the same digest ResultCache.fingerprint uses."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(directory):
+    """Returns the manifest entries of a directory keyed by file name, or {} if it has none."""
+    path = Path(directory) / MANIFEST_NAME
+    if not path.exists():
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f).get("files", {})
+
+
+def write_manifest(directory, entries):
+    path = Path(directory) / MANIFEST_NAME
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump({"files": entries}, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def manifest_digest(path):
+    """
+    The content hash of a staged file from the manifest in its directory, or None if the file is
+    not in the manifest or changed (different size or modification time) since it was staged.
+    """
+    path = Path(path)
+    entry = load_manifest(path.parent).get(path.name)
+    if entry is None:
+        return None
+    st = path.stat()
+    if entry.get("bytes") != st.st_size or entry.get("mtime_ns") != st.st_mtime_ns:
+        return None
+    return entry.get("hash")
@@ -0,0 +1,267 @@
+"""
+Materialized summary cube of the per-template aggregates of all result files.
+
+The cube has one cell per (label, algorithm, size, template, filter_mode, drop_always_errors) and
+stores additive measures (counts and sums), so any roll-up over some of the dimensions is exact and
+the derived measures (mean and geometric-mean time, error rate, mean results, hit rate) are
+recomputed from the summed cells. It is built once from the result files, with one grouped
+bincount pass per file (memoized), and saved as a compressed .npz of dimension codes and measures.
+
+    cube = SummaryCube.build(find_result_files("data"))
+    cube.save("output/summary_cube.npz")
+    cube.query(by=("algorithm", "size"), filter_mode="no_refinement", drop_always_errors=True)
+    plot_algorithm_comparison_v2(cube, filter_mode="refinement_only")
+"""
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    from src.data_analysis import parse_algorithm_label
+    from src.load_raw_data import find_always_error_templates, load_json, parse_cache_state, result_label
+    from src.profiling import profiled, stage
+    from src.result_cache import memoize
+except ModuleNotFoundError:
+    from data_analysis import parse_algorithm_label
+    from load_raw_data import find_always_error_templates, load_json, parse_cache_state, result_label
+    from profiling import profiled, stage
+    from result_cache import memoize
+
+DEFAULT_CUBE_PATH = str(Path(__file__).resolve().parent.parent / "output" / "summary_cube.npz")
+FILTER_MODES = ("all", "refinement_only", "no_refinement")
+DIMENSIONS = ("label", "algorithm", "size", "template", "filter_mode", "drop_always_errors")
+# Dimensions with True/False values, the others hold strings
+BOOL_DIMENSIONS = ("drop_always_errors",)
+# Additive measures stored per cell
+SUMS = ("n", "n_errors", "sum_time", "sum_log_time", "n_positive", "sum_results", "sum_hit_rate", "n_cache_valid")
+# Measures derived from the sums after a roll-up
+MEASURES = ("mean_time", "geo_mean_time", "errors", "error_rate", "mean_results", "hit_rate")
+
+
+@memoize
+def file_aggregates(location, timeout_ms=180000):
+    """
+    The cells of one result file as a dict of columns: template, filter_mode, drop_always_errors and SUMS.
+    Templates failing (error or timeout_ms) in all executions are left out of the drop_always_errors cells.
+    """
+    data = load_json(location)
+    always_error_templates = find_always_error_templates(data, timeout_ms)
+    template_index = {}
+    n = len(data)
+    codes = np.full(n, -1, dtype=np.int64)
+    time_ms = np.zeros(n)
+    has_error = np.zeros(n, dtype=bool)
+    results = np.zeros(n)
+    hit_rate = np.zeros(n)
+    cache_valid = np.zeros(n, dtype=bool)
+    refinement = np.zeros(n, dtype=bool)
+
+    for i, entry in enumerate(data):
+        seq_element = entry.get('sequenceElement', {})
+        template = seq_element.get('template')
+        if template is None:
+            continue
+        code = template_index.get(template)
+        if code is None:
+            code = template_index[template] = len(template_index)
+        codes[i] = code
+        time_ms[i] = entry.get('time', 0)
+        has_error[i] = 'error' in entry
+        results[i] = entry.get('results', 0)
+        refinement[i] = len(seq_element.get('refinementMetadata', {}).values()) > 0
+        try:
+            cache_state = parse_cache_state(entry)
+            hits, misses = cache_state.get('hits', 0), cache_state.get('misses', 0)
+            hit_rate[i] = hits / (hits + misses) if hits + misses > 0 else 0.0
+            cache_valid[i] = True
+        except (ValueError, KeyError, TypeError):
+            pass
+
+    templates = list(template_index)
+    n_templates = len(templates)
+    positive = time_ms > 0
+    log_time = np.log(np.where(positive, time_ms, 1.0))
+    always_error = np.array([template in always_error_templates for template in templates] + [False])
+
+    cells = {column: [] for column in ("template", "filter_mode", "drop_always_errors") + SUMS}
+    for filter_mode in FILTER_MODES:
+        mode_mask = codes >= 0
+        if filter_mode == "refinement_only":
+            mode_mask &= refinement
+        elif filter_mode == "no_refinement":
+            mode_mask &= ~refinement
+        for drop_always_errors in (False, True):
+            mask = mode_mask & ~always_error[codes] if drop_always_errors else mode_mask
+            c = codes[mask]
+
+            def group_sum(weights=None):
+                return np.bincount(c, weights=weights, minlength=n_templates)
+
+            cells["template"] += templates
+            cells["filter_mode"] += [filter_mode] * n_templates
+            cells["drop_always_errors"] += [drop_always_errors] * n_templates
+            cells["n"] += list(group_sum())
+            cells["n_errors"] += list(group_sum(has_error[mask]))
+            cells["sum_time"] += list(group_sum(time_ms[mask]))
+            cells["sum_log_time"] += list(group_sum(np.where(positive, log_time, 0.0)[mask]))
+            cells["n_positive"] += list(group_sum(positive[mask]))
+            cells["sum_results"] += list(group_sum(results[mask]))
+            cells["sum_hit_rate"] += list(group_sum(np.where(cache_valid, hit_rate, 0.0)[mask]))
+            cells["n_cache_valid"] += list(group_sum(cache_valid[mask]))
+    return cells
+
+
+def derive_measures(sums):
+    """Adds MEASURES to a DataFrame of summed SUMS, NaN where a cell has no executions."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n = sums["n"].to_numpy(dtype=np.float64)
+        sums["mean_time"] = np.where(n > 0, sums["sum_time"] / n, np.nan)
+        sums["geo_mean_time"] = np.where(sums["n_positive"] > 0, np.exp(sums["sum_log_time"] / sums["n_positive"]),
+                                         np.nan)
+        sums["errors"] = sums["n_errors"]
+        sums["error_rate"] = np.where(n > 0, sums["n_errors"] / n, np.nan)
+        sums["mean_results"] = np.where(n > 0, sums["sum_results"] / n, np.nan)
+        sums["hit_rate"] = np.where(sums["n_cache_valid"] > 0, sums["sum_hit_rate"] / sums["n_cache_valid"], np.nan)
+    return sums
+
+
+class SummaryCube:
+    """Cells of the cube as a DataFrame with DIMENSIONS and SUMS columns, see the module docstring."""
+
+    def __init__(self, cells, sources=None, timeout_ms=180000):
+        self.cells = cells
+        self.sources = sources or []
+        self.timeout_ms = timeout_ms
+
+    @classmethod
+    @profiled("SummaryCube.build")
+    def build(cls, locations, timeout_ms=180000):
+        frames, sources = [], []
+        for location in locations:
+            algorithm, size = parse_algorithm_label(location)
+            frame = pd.DataFrame(file_aggregates(location, timeout_ms))
+            frame.insert(0, "label", result_label(location))
+            frame.insert(1, "algorithm", algorithm)
+            frame.insert(2, "size", size)
+            frames.append(frame)
+            st = os.stat(location)
+            sources.append({"path": str(location), "bytes": st.st_size, "mtime_ns": st.st_mtime_ns})
+        cells = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=DIMENSIONS + SUMS)
+        return cls(cells[list(DIMENSIONS + SUMS)], sources, timeout_ms)
+
+    def save(self, path=DEFAULT_CUBE_PATH):
+        """Writes the cube as a compressed .npz: integer codes per dimension and one array per sum."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        arrays, categories = {}, {}
+        for dimension in DIMENSIONS:
+            codes, uniques = pd.factorize(self.cells[dimension], use_na_sentinel=True)
+            arrays[f"dim_{dimension}"] = codes.astype(np.int32)
+            categories[dimension] = [u.item() if isinstance(u, np.generic) else u for u in uniques]
+        for column in SUMS:
+            values = self.cells[column].to_numpy()
+            is_count = column.startswith("n")
+            arrays[column] = values.astype(np.int64 if is_count else np.float64)
+        metadata = {"categories": categories, "sources": self.sources, "timeout_ms": self.timeout_ms}
+        arrays["metadata"] = np.array(json.dumps(metadata))
+        tmp_path = str(path) + ".tmp.npz"
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=DEFAULT_CUBE_PATH):
+        with np.load(path, allow_pickle=False) as f:
+            metadata = json.loads(str(f["metadata"]))
+            columns = {}
+            for dimension in DIMENSIONS:
+                categories = np.array(metadata["categories"][dimension] + [None], dtype=object)
+                # Code -1 (missing, e.g. files without a size) maps to the appended None
+                columns[dimension] = categories[f[f"dim_{dimension}"]]
+            for column in SUMS:
+                columns[column] = f[column]
+        return cls(pd.DataFrame(columns), metadata["sources"], metadata["timeout_ms"])
+
+    def is_stale(self):
+        """True if a source file changed or disappeared since the cube was built."""
+        for source in self.sources:
+            try:
+                st = os.stat(source["path"])
+            except OSError:
+                return True
+            if st.st_size != source["bytes"] or st.st_mtime_ns != source["mtime_ns"]:
+                return True
+        return False
+
+    def select(self, **filters):
+        """
+        The cells matching filters (a value or a list of values per dimension). Cells of other
+        filter modes/drop_always_errors settings overlap, so unless they are filtered on, only the
+        filter_mode="all", drop_always_errors=False cells are selected.
+        """
+        filters.setdefault("filter_mode", "all")
+        filters.setdefault("drop_always_errors", False)
+        cells = self.cells
+        for dimension, value in filters.items():
+            if dimension not in DIMENSIONS:
+                raise ValueError(f"Unknown dimension {dimension}, choose from {', '.join(DIMENSIONS)}")
+            if value is None:
+                continue
+            values = value if isinstance(value, (list, tuple, set, frozenset)) else [value]
+            cells = cells[cells[dimension].isin(values)]
+        return cells
+
+    def coerce(self, dimension, value):
+        """Converts a filter value given as a string (e.g. on the command line) to the type of the dimension."""
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension {dimension}, choose from {', '.join(DIMENSIONS)}")
+        if dimension in BOOL_DIMENSIONS:
+            if value.lower() not in ("true", "false", "1", "0"):
+                raise ValueError(f"{dimension} is true or false, got {value}")
+            return value.lower() in ("true", "1")
+        return value
+
+    @profiled("SummaryCube.query")
+    def query(self, by=("algorithm", "size"), measures=MEASURES, **filters):
+        """
+        Rolls the selected cells up to the dimensions in by and returns the measures per group.
+        Dimensions in by are kept, including filter_mode and drop_always_errors, e.g.
+        query(by=("label", "filter_mode"), filter_mode=list(FILTER_MODES)).
+        """
+        by = list(by)
+        for dimension in ("filter_mode", "drop_always_errors"):
+            if dimension in by:
+                filters.setdefault(dimension, None)
+        cells = self.select(**filters)
+        with stage("cube_rollup", entries=len(cells)):
+            if by:
+                sums = cells.groupby(by, dropna=False, sort=True)[list(SUMS)].sum().reset_index()
+            else:
+                sums = cells[list(SUMS)].sum().to_frame().T
+        return derive_measures(sums)[by + list(measures)]
+
+    def to_nested(self, measure="mean_time", key="label", missing=-1, **filters):
+        """
+        {key value: {template: measure}} of the selected cells, the algo_times/algo_errors format of
+        plot_algorithm_comparison_v2. Templates without executions get missing (-1, like average_number).
+        """
+        frame = self.query(by=(key, "template"), measures=(measure,), **filters)
+        nested = {}
+        for key_value, template, value in zip(frame[key], frame["template"], frame[measure]):
+            nested.setdefault(key_value, {})[template] = missing if pd.isna(value) else value
+        order = {label: i for i, label in enumerate(dict.fromkeys(self.cells[key]))}
+        return {k: nested[k] for k in sorted(nested, key=lambda k: order.get(k, len(order)))}
+
+
+def build_summary_cube(locations, path=DEFAULT_CUBE_PATH, timeout_ms=180000, force=False):
+    """Loads the cube at path if it is up to date for locations, otherwise builds and saves it."""
+    if not force and os.path.exists(path):
+        cube = SummaryCube.load(path)
+        if not cube.is_stale() and cube.timeout_ms == timeout_ms \
+                and [source["path"] for source in cube.sources] == [str(location) for location in locations]:
+            return cube
+    cube = SummaryCube.build(locations, timeout_ms)
+    cube.save(path)
+    print(f"Wrote summary cube of {len(locations)} files ({len(cube.cells)} cells) to {path}")
+    return cube
@@ -0,0 +1,197 @@
+"""
+Packs a topology directory (thousands of <timestamp>-<md5(query)>.json files) into a single indexed
+archive, <topology dir>.pack next to the directory. find_topology_files uses the archive
+transparently when it exists, so the analysis reads one file instead of opening thousands.
+
+Layout: MAGIC, the individually compressed members, the compressed JSON index and the offset of
+the index as an 8-byte little-endian integer. The index maps every query hash to its members as
+[file name, offset, length], in timestamp order.
+"""
+import gzip
+import json
+import os
+import struct
+import threading
+from pathlib import Path
+
+try:
+    from src import json_backend
+except ModuleNotFoundError:
+    import json_backend
+
+MAGIC = b"TOPOPACK1\n"
+ARCHIVE_SUFFIX = ".pack"
+_FOOTER = struct.Struct("<Q")
+
+
+def _compress(data, codec):
+    if codec == "zstd":
+        return json_backend.zstandard.ZstdCompressor(level=10).compress(data)
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    return data
+
+
+def _decompress(data, codec):
+    if codec == "zstd":
+        if json_backend.zstandard is None:
+            raise ImportError("Reading a zstd topology archive requires the zstandard package (pip install zstandard)")
+        return json_backend.zstandard.ZstdDecompressor().decompress(data)
+    if codec == "gzip":
+        return gzip.decompress(data)
+    return data
+
+
+def archive_path(topology_dir):
+    """Path of the archive of a topology directory: the directory name with ARCHIVE_SUFFIX."""
+    topology_dir = Path(topology_dir)
+    if topology_dir.suffix == ARCHIVE_SUFFIX:
+        return topology_dir
+    return topology_dir.with_name(topology_dir.name + ARCHIVE_SUFFIX)
+
+
+class ArchiveMember:
+    """A topology file inside an archive. Has a .name like a Path, so it can stand in for one."""
+    __slots__ = ("archive", "name", "offset", "length")
+
+    def __init__(self, archive, name, offset, length):
+        self.archive = archive
+        self.name = name
+        self.offset = offset
+        self.length = length
+
+    def read_bytes(self):
+        return self.archive.read_member(self)
+
+    def __repr__(self):
+        return f"ArchiveMember({self.archive.path.name}:{self.name})"
+
+
+class TopologyArchive:
+    def __init__(self, path):
+        self.path = Path(path)
+        self._fd = os.open(self.path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        self._lock = threading.Lock()
+        size = os.fstat(self._fd).st_size
+        if self._pread(len(MAGIC), 0) != MAGIC:
+            raise ValueError(f"{self.path} is not a topology archive")
+        (index_offset,) = _FOOTER.unpack(self._pread(_FOOTER.size, size - _FOOTER.size))
+        index = json_backend.loads(gzip.decompress(self._pread(size - _FOOTER.size - index_offset, index_offset)))
+        self.codec = index["codec"]
+        self.index = index["members"]
+
+    def _pread(self, length, offset):
+        if hasattr(os, "pread"):
+            return os.pread(self._fd, length, offset)
+        with self._lock:
+            os.lseek(self._fd, offset, os.SEEK_SET)
+            return os.read(self._fd, length)
+
+    def close(self):
+        os.close(self._fd)
+
+    def members(self, query_hash):
+        return [ArchiveMember(self, name, offset, length) for name, offset, length in self.index.get(query_hash, [])]
+
+    def read_member(self, member):
+        return _decompress(self._pread(member.length, member.offset), self.codec)
+
+    def __len__(self):
+        return sum(len(members) for members in self.index.values())
+
+
+_open_archives = {}
+
+
+def open_archive(topology_dir):
+    """
+    Returns the (cached) TopologyArchive of a topology directory, or None if it has not been packed.
+    The archive is reopened when it was rewritten.
+    """
+    path = archive_path(topology_dir)
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    key = (str(path.resolve()), st.st_size, st.st_mtime_ns)
+    archive = _open_archives.get(key)
+    if archive is None:
+        archive = _open_archives[key] = TopologyArchive(path)
+    return archive
+
+
+def newer_than_archive(topology_dir, archive):
+    """
+    Whether files were added to or removed from the topology directory after it was packed (the
+    directory was modified after the archive was written).
+    """
+    try:
+        return Path(topology_dir).stat().st_mtime_ns > archive.path.stat().st_mtime_ns
+    except OSError:
+        return False
+
+
+def pack_topology_dir(topology_dir, output=None, codec=None, remove=False):
+    """
+    Packs the topology files of a directory into one archive. Members are written in timestamp
+    (execution) order, so an analysis that follows the sequences reads the archive mostly
+    sequentially. Unfinished .tmp files are skipped. If the archive already exists, its members are
+    kept (files in the directory replace members of the same name), so files added after packing
+    with remove can be packed into it.
+
+    Parameters:
+    topology_dir (str): Directory with <timestamp>-<md5(query)>.json(.gz|.zst) files.
+    output (str): Archive path, defaults to <topology_dir>.pack.
+    codec (str): "zstd" (default when zstandard is installed), "gzip" or "none".
+    remove (bool): Delete the packed files (and the directory, if empty) afterwards.
+
+    Returns the path of the archive.
+    """
+    topology_dir = Path(topology_dir)
+    output = Path(output) if output else archive_path(topology_dir)
+    codec = codec or ("zstd" if json_backend.zstandard is not None else "gzip")
+
+    files = []
+    if topology_dir.is_dir():
+        for f in topology_dir.iterdir():
+            if not json_backend.is_json_file(f.name):
+                continue
+            timestamp, _, query_hash = json_backend.strip_json_suffix(f.name).partition('-')
+            files.append((int(timestamp), query_hash, f))
+    loose_names = {f.name for _, _, f in files}
+    existing = TopologyArchive(output) if output.exists() else None
+    members = []
+    if existing is not None:
+        for query_hash, entries in existing.index.items():
+            members += [(int(name.split('-')[0]), query_hash, ArchiveMember(existing, name, offset, length))
+                        for name, offset, length in entries if name not in loose_names]
+    entries = sorted(files + members, key=lambda item: item[0])
+
+    index = {}
+    tmp_output = output.with_name(output.name + ".tmp")
+    with open(tmp_output, 'wb') as out:
+        out.write(MAGIC)
+        for _, query_hash, f in entries:
+            if isinstance(f, ArchiveMember):
+                data = f.archive._pread(f.length, f.offset) if existing.codec == codec \
+                    else _compress(f.read_bytes(), codec)
+            else:
+                data = _compress(json_backend.read_bytes(f), codec)
+            index.setdefault(query_hash, []).append([f.name, out.tell(), len(data)])
+            out.write(data)
+        index_offset = out.tell()
+        out.write(gzip.compress(json.dumps({"codec": codec, "members": index}).encode('utf-8')))
+        out.write(_FOOTER.pack(index_offset))
+    if existing is not None:
+        existing.close()
+    os.replace(tmp_output, output)
+
+    if remove:
+        for _, _, f in files:
+            f.unlink()
+        if topology_dir.is_dir() and not any(topology_dir.iterdir()):
+            topology_dir.rmdir()
+    kept = f", kept {len(members)} packed files" if members else ""
+    print(f"Packed {len(files)} topology files from {topology_dir} into {output}{kept} "
+          f"({output.stat().st_size / 1024 ** 2:.1f} MB, {codec})")
+    return output
@@ -120,20 +120,28 @@ def plot_algorithm_comparison(algo_times, algo_errors, figsize=(16, 8)):
     return fig, ax
 
 
-def plot_algorithm_comparison_v2(algo_times, algo_errors, figsize=(16, 8)):
+def plot_algorithm_comparison_v2(algo_times, algo_errors=None, figsize=(16, 8), **cube_filters):
     """
     Create a grouped bar chart comparing algorithm execution times across queries.
     Includes a secondary y-axis showing error counts as markers.
 
     Parameters:
     -----------
-    algo_times : dict
-        Dictionary mapping algorithm names to query execution times
+    algo_times : dict or SummaryCube
+        Dictionary mapping algorithm names to query execution times, or a SummaryCube to take the
+        mean times and error counts per file label from
     algo_errors : dict
-        Dictionary mapping algorithm names to query error counts
+        Dictionary mapping algorithm names to query error counts (not needed for a SummaryCube)
     figsize : tuple
         Figure size (width, height)
+    cube_filters :
+        Selection of the SummaryCube cells, e.g. filter_mode="no_refinement", drop_always_errors=True, size="m"
     """
+    # A SummaryCube, duck-typed so importing this module does not import pandas and the cube
+    if hasattr(algo_times, "to_nested"):
+        cube = algo_times
+        algo_times = cube.to_nested("mean_time", **cube_filters)
+        algo_errors = cube.to_nested("errors", missing=0, **cube_filters)
 
     # Get all queries and sort them by category
     all_queries = sorted(list(algo_times[list(algo_times.keys())[0]].keys()),
@@ -258,12 +266,69 @@ def plot_algorithm_comparison_v2(algo_times, algo_errors, figsize=(16, 8)):
     plt.tight_layout()
     return fig, ax1, ax2
 
+def bin_log_density(x, y, bins=(100, 100), x_range=(0.0, 1.0), y_range=None):
+    """
+    Pre-bins points into a 2D histogram with a linear x-axis and a log10-scaled y-axis.
+
+    Parameters:
+    x (np.ndarray): Values on the linear axis (e.g. cache hit rate).
+    y (np.ndarray): Strictly positive values on the log axis (e.g. execution time), non-positive values are dropped.
+    bins (tuple): Number of bins along x and y.
+    x_range (tuple): Range of the x-axis bins.
+    y_range (tuple): Range of the y-axis bins in data units, defaults to the min/max of y.
+
+    Returns:
+    counts (np.ndarray): Array of shape bins with the number of points per cell.
+    x_edges (np.ndarray): Bin edges along x.
+    y_edges (np.ndarray): Bin edges along y in data units (log-spaced).
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    positive = y > 0
+    x, log_y = x[positive], np.log10(y[positive])
+
+    if y_range is None:
+        if len(log_y) == 0:
+            y_range = (1.0, 10.0)
+        else:
+            y_range = (10 ** log_y.min(), 10 ** log_y.max())
+    log_range = (np.log10(y_range[0]), np.log10(y_range[1]))
+    if log_range[0] == log_range[1]:
+        log_range = (log_range[0] - 0.5, log_range[1] + 0.5)
+
+    counts, x_edges, log_y_edges = np.histogram2d(x, log_y, bins=bins, range=[x_range, log_range])
+    return counts, x_edges, 10 ** log_y_edges
+
+
+def plot_log_density(ax, x, y, bins=(100, 100), x_range=(0.0, 1.0), y_range=None, cmap='viridis'):
+    """
+    Draws the density of (x, y) points as a single image on a log-scaled y-axis, instead of
+    one marker per point. Empty cells are left transparent.
+
+    Returns the QuadMesh so a colorbar can be attached.
+    """
+    from matplotlib.colors import LogNorm
+
+    counts, x_edges, y_edges = bin_log_density(x, y, bins=bins, x_range=x_range, y_range=y_range)
+    masked = np.ma.masked_equal(counts.T, 0)
+    vmax = max(counts.max(), 1)
+    mesh = ax.pcolormesh(x_edges, y_edges, masked, cmap=cmap, norm=LogNorm(vmin=1, vmax=vmax), rasterized=True)
+    ax.set_yscale('log')
+    return mesh
+
+
 # Alternative: Create a heatmap version
-def plot_heatmap_comparison(algo_times, figsize=(12, 8)):
-    """Create a heatmap showing relative performance."""
+def plot_heatmap_comparison(algo_times, figsize=(12, 8), measure="mean_time", **cube_filters):
+    """
+    Create a heatmap showing relative performance. algo_times is a dict mapping algorithm names to
+    query execution times, or a SummaryCube to take measure per file label from, selected by cube_filters.
+    """
     import matplotlib.pyplot as plt
     from matplotlib.colors import LogNorm
 
+    if hasattr(algo_times, "to_nested"):
+        algo_times = algo_times.to_nested(measure, **cube_filters)
+
     algorithms = list(algo_times.keys())
     queries = sorted(list(algo_times[algorithms[0]].keys()))
 